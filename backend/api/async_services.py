@@ -0,0 +1,275 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from authentication.services import SpotifyService
+from . import caching, metrics, rate_limit, search_cache, suggest, tokens
+from .http import get_async_client
+from .loaders import AsyncBatchLoader
+from .services import SpotifyAPIService
+
+
+# Keeps fire-and-forget search prefetches alive until they finish
+_prefetch_tasks = set()
+
+
+class AsyncSpotifyAPIService(SpotifyAPIService):
+    """
+    Asyncio-native counterpart of SpotifyAPIService.
+
+    Every endpoint method inherited from SpotifyAPIService returns the result
+    of ``_make_request``, ``_get_many`` or ``_load``, which are coroutines
+    here, so callers simply await them. Build instances with ``await AsyncSpotifyAPIService.for_user(user)``.
+    """
+
+    loader_class = AsyncBatchLoader
+
+    def __init__(self, user, access_token):
+        self.user = user
+        self.access_token = access_token
+        self._loaders = {}
+
+    async def _load(self, kind, item_id):
+        """Look up one item through the loader, batched with every lookup made in the same tick"""
+        return self._found(kind, item_id, await self.loader(kind).load(item_id))
+
+    @classmethod
+    async def for_user(cls, user):
+        """Create a service for a user without blocking the event loop"""
+        spotify_token = await tokens.aget_token(user)
+        if spotify_token.expires_within(settings.TOKEN_INLINE_REFRESH_MARGIN):
+            metrics.incr('token_refresh_inline')
+            spotify_token = await sync_to_async(SpotifyService.refresh_user_token)(
+                user, margin=settings.TOKEN_INLINE_REFRESH_MARGIN
+            )
+        return cls(user, spotify_token.access_token)
+
+    async def _refresh_rejected_token(self):
+        """Replace an access token Spotify answered 401 to"""
+        metrics.incr('token_refresh_on_401')
+        spotify_token = await sync_to_async(SpotifyService.refresh_user_token)(
+            self.user, rejected_access_token=self.access_token
+        )
+        self.access_token = spotify_token.access_token
+
+    async def _make_request(self, method, endpoint, params=None, data=None, cache_key=None, cache_timeout=300, metric=None):
+        """Make authenticated request to Spotify API with caching (``metric`` counts {metric}_hit/_miss)"""
+        if cache_key:
+            cached_result, state = await caching.alookup(cache_key)
+            if metric:
+                metrics.incr(f'{metric}_miss' if state == caching.MISS else f'{metric}_hit')
+            if state == caching.FRESH:
+                return cached_result
+            if state == caching.STALE:
+                caching.refresh_in_background_async(
+                    cache_key,
+                    lambda: self._fetch(method, endpoint, params, data, cache_key, cache_timeout, revalidate=True)
+                )
+                return cached_result
+
+            return await caching.asingle_flight(
+                cache_key,
+                lambda: self._fetch(method, endpoint, params, data, cache_key, cache_timeout)
+            )
+
+        return await self._fetch(method, endpoint, params, data, cache_key, cache_timeout)
+
+    async def _fetch(self, method, endpoint, params=None, data=None, cache_key=None, cache_timeout=300, revalidate=False):
+        """Call Spotify and cache a successful response under cache_key, revalidating by ETag if asked"""
+        url = f"{self.BASE_URL}{endpoint}"
+        headers = self._get_headers()
+
+        cached_entry = await caching.apeek(cache_key) if revalidate and cache_key else None
+        if cached_entry is not None and cached_entry.etag:
+            headers['If-None-Match'] = cached_entry.etag
+
+        started = time.monotonic()
+        async with await self._send(method, url, headers, params, data) as response:
+            if response.status == 304 and cached_entry is not None:
+                metrics.incr('etag_not_modified')
+                metrics.incr('etag_bytes_saved', cached_entry.size)
+                await caching.astore(cache_key, cached_entry.value, cache_timeout, delta=time.monotonic() - started,
+                                     etag=cached_entry.etag, size=cached_entry.size)
+                return cached_entry.value
+
+            if response.status == 401:
+                metrics.incr('token_expired_errors')
+                raise ValueError("Access token expired. Please re-authenticate.")
+
+            if response.status >= 400:
+                response.raise_for_status()
+
+            body = await response.read()
+            result = json.loads(body)
+
+        if cache_key and response.status == 200:
+            if 'If-None-Match' in headers:
+                metrics.incr('etag_modified')
+            await caching.astore(cache_key, result, cache_timeout, delta=time.monotonic() - started,
+                                 etag=response.headers.get('ETag'), size=len(body))
+
+        return result
+
+    async def _send(self, method, url, headers, params=None, data=None):
+        """Send a request under the app-wide rate limit, with the same retries as SpotifyAPIService._send"""
+        attempt = 0
+        token_refreshed = False
+        while True:
+            await rate_limit.aacquire()
+            response = await get_async_client().request(method, url, headers=headers, params=params, json=data)
+            status = response.status
+            if status == 401 and self.user is not None and not token_refreshed:
+                response.release()
+                await self._refresh_rejected_token()
+                headers.update(self._get_headers())
+                token_refreshed = True
+                continue
+            if status not in rate_limit.RETRY_STATUSES:
+                return response
+            response.release()
+
+            metrics.incr(f'upstream_{status}')
+            retry_after = rate_limit.parse_retry_after(response.headers.get('Retry-After'))
+            delay = rate_limit.backoff(attempt, retry_after)
+            if status == 429:
+                await rate_limit.ablock(delay)
+            if not rate_limit.should_retry(method, status, attempt):
+                return response
+
+            if status == 429:
+                rate_limit.record_retry()
+            else:
+                rate_limit.record_retry(delay)
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get_many(self, endpoint, response_key, ids, cache_prefix, batch_size, cache_timeout=300):
+        """Look up several IDs through a multi-ID endpoint, fetching only cache misses"""
+        keys = {item_id: f'{cache_prefix}_{item_id}' for item_id in ids}
+        cached = await caching.alookup_many(list(keys.values()))
+        found = {}
+        stale = []
+        for item_id, key in keys.items():
+            if key in cached:
+                found[item_id], state = cached[key]
+                if state == caching.STALE:
+                    stale.append(item_id)
+
+        if stale:
+            caching.refresh_in_background_async(
+                caching.batch_key(cache_prefix, stale),
+                lambda: self._fetch_many(endpoint, response_key, stale, cache_prefix, batch_size, cache_timeout)
+            )
+
+        missing = [item_id for item_id in dict.fromkeys(ids) if item_id not in found]
+        found.update(await self._fetch_many(endpoint, response_key, missing, cache_prefix, batch_size, cache_timeout))
+        return [found.get(item_id) for item_id in ids]
+
+    async def _fetch_many(self, endpoint, response_key, ids, cache_prefix, batch_size, cache_timeout=300):
+        """Fetch IDs in concurrent chunks and cache each item under its single-ID key"""
+        chunks = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+        started = time.monotonic()
+        results = await asyncio.gather(*(
+            self._make_request('GET', endpoint, params={'ids': ','.join(chunk)}) for chunk in chunks
+        ))
+
+        fetched = {}
+        for chunk, result in zip(chunks, results):
+            for item_id, item in zip(chunk, result.get(response_key) or []):
+                if item:
+                    fetched[item_id] = item
+
+        if fetched:
+            await caching.astore_many(
+                {f'{cache_prefix}_{item_id}': item for item_id, item in fetched.items()},
+                cache_timeout, delta=time.monotonic() - started
+            )
+        return fetched
+
+    async def get_collection(self, endpoint, page_size=50, params=None):
+        """Get every item of a paged collection, fetching pages after the first in parallel"""
+        first = await self._fetch_page(endpoint, page_size, 0, params)
+        semaphore = asyncio.Semaphore(settings.SPOTIFY_PAGE_CONCURRENCY)
+
+        async def fetch(offset):
+            async with semaphore:
+                return await self._fetch_page(endpoint, page_size, offset, params)
+
+        pages = await asyncio.gather(*(
+            fetch(offset) for offset in range(page_size, first.get('total') or 0, page_size)
+        ))
+
+        items = list(first.get('items') or [])
+        for page in pages:
+            items.extend(page.get('items') or [])
+        return items
+
+    async def iter_collection(self, endpoint, page_size=50, params=None):
+        """Async-iterate over every item of a paged collection, prefetching the next page"""
+        page = await self._fetch_page(endpoint, page_size, 0, params)
+        offset = 0
+        while True:
+            upcoming = None
+            if page.get('next'):
+                offset += page_size
+                upcoming = asyncio.ensure_future(self._fetch_page(endpoint, page_size, offset, params))
+            try:
+                for item in page.get('items') or []:
+                    yield item
+            except BaseException:
+                if upcoming is not None:
+                    upcoming.cancel()
+                raise
+            if upcoming is None:
+                return
+            page = await upcoming
+
+    async def search(self, query, search_type='track', limit=20, offset=0, market=None):
+        """Search for tracks, artists, albums, or playlists (cached for all users under a normalized key)"""
+        params = search_cache.search_params(query, search_type, limit, offset, market)
+        results = await self._make_request('GET', '/search', params=params, cache_key=search_cache.cache_key(params),
+                                           cache_timeout=settings.SEARCH_CACHE_TIMEOUT, metric='search_cache')
+        # Names seen in results become typeahead suggestions
+        suggest.observe_results(results)
+        next_params = search_cache.next_page(params, results)
+        if next_params and settings.SEARCH_PREFETCH:
+            task = asyncio.get_running_loop().create_task(self._prefetch_search(next_params))
+            _prefetch_tasks.add(task)
+            task.add_done_callback(_prefetch_tasks.discard)
+        return results
+
+    async def _prefetch_search(self, params):
+        """Cache a search page before it is asked for, only if it is missing and quota is spare"""
+        cache_key = search_cache.cache_key(params)
+        if await caching.apeek(cache_key) is not None:
+            return
+        try:
+            with rate_limit.patient(0):
+                await caching.asingle_flight(
+                    cache_key,
+                    lambda: self._fetch('GET', '/search', params, None, cache_key, settings.SEARCH_CACHE_TIMEOUT)
+                )
+            metrics.incr('search_prefetched')
+        except rate_limit.RateLimitExceeded:
+            metrics.incr('search_prefetch_skipped')
+        except Exception:
+            metrics.incr('search_prefetch_failed')
+
+    async def get_tracks_audio_features(self, track_ids):
+        """Get audio features for multiple tracks, 100 per upstream call, reusing per-track cache entries"""
+        features = await self._get_many('/audio-features', 'audio_features', track_ids, 'audio_features', 100)
+        return {'audio_features': features}
+
+    async def create_playlist(self, name, description='', public=True):
+        """Create a new playlist"""
+        data = {
+            'name': name,
+            'description': description,
+            'public': public
+        }
+        user_profile = await self.get_user_profile()
+        user_id = user_profile['id']
+        return await self._make_request('POST', f'/users/{user_id}/playlists', data=data)
@@ -0,0 +1,228 @@
+"""
+Async versions of the Spotify proxy views.
+
+These are plain Django async views (DRF's api_view is sync-only), so they
+authenticate with the same DRF token or session themselves. Under ASGI a
+single worker can keep hundreds of them waiting on Spotify at once.
+"""
+import asyncio
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+
+from . import events
+from .async_services import AsyncSpotifyAPIService
+
+
+async def _authenticate(request):
+    """Resolve the user from a DRF token header or the session"""
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        try:
+            token = await Token.objects.select_related('user').aget(key=auth[1])
+        except Token.DoesNotExist:
+            return None
+        return token.user if token.user.is_active else None
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def _proxy(request, method_name, *args, int_params=None, **kwargs):
+    """
+    Authenticate, call one AsyncSpotifyAPIService method and wrap the result.
+    ``int_params`` maps integer query parameters to their defaults; they are
+    passed to the method as keyword arguments.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    for name, default in (int_params or {}).items():
+        try:
+            kwargs[name] = int(request.GET.get(name, default))
+        except ValueError:
+            return JsonResponse({'error': f'{name} must be an integer'}, status=400)
+
+    try:
+        spotify_service = await AsyncSpotifyAPIService.for_user(user)
+        result = await getattr(spotify_service, method_name)(*args, **kwargs)
+        return JsonResponse(result, safe=False)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# User Profile & Dashboard Views
+@require_GET
+async def dashboard(request):
+    """Get user dashboard data"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        spotify_service = await AsyncSpotifyAPIService.for_user(user)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+    calls = {
+        'top_tracks': spotify_service.get_user_top_tracks(limit=10),
+        'top_artists': spotify_service.get_user_top_artists(limit=10),
+        'recently_played': spotify_service.get_recently_played(limit=10),
+        'featured_playlists': spotify_service.get_featured_playlists(limit=6),
+        'new_releases': spotify_service.get_new_releases(limit=6),
+    }
+    results = await asyncio.gather(
+        *(asyncio.wait_for(call, settings.DASHBOARD_SECTION_TIMEOUT) for call in calls.values()),
+        return_exceptions=True
+    )
+
+    sections = {}
+    errors = {}
+    for name, result in zip(calls, results):
+        if isinstance(result, asyncio.TimeoutError):
+            sections[name] = None
+            errors[name] = 'timeout'
+        elif isinstance(result, Exception):
+            sections[name] = None
+            errors[name] = str(result)
+        else:
+            sections[name] = result
+
+    if len(errors) == len(sections):
+        return JsonResponse({'error': 'Failed to load dashboard', 'errors': errors}, status=500)
+
+    return JsonResponse({**sections, 'errors': errors})
+
+
+@require_GET
+async def user_playlists(request):
+    """Get user's playlists"""
+    return await _proxy(request, 'get_user_playlists', int_params={'limit': 20, 'offset': 0})
+
+
+# Search Views
+@require_GET
+async def search(request):
+    """Search for tracks, artists, albums, or playlists"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        query = request.GET.get('q', '')
+        search_type = request.GET.get('type', 'track')
+        limit = int(request.GET.get('limit', 20))
+        offset = int(request.GET.get('offset', 0))
+        market = request.GET.get('market')
+
+        if not query:
+            return JsonResponse({'error': 'Query parameter is required'}, status=400)
+
+        spotify_service = await AsyncSpotifyAPIService.for_user(user)
+        results = await spotify_service.search(query, search_type, limit, offset, market)
+
+        # Saved to search history in the background (record() never blocks on I/O)
+        events.record_search(
+            user, query, search_type,
+            result_count=results.get(f'{search_type}s', {}).get('total', 0)
+        )
+
+        return JsonResponse(results)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# Track Views
+@require_GET
+async def track_detail(request, track_id):
+    """Get track details"""
+    return await _proxy(request, 'get_track', track_id)
+
+
+@require_GET
+async def track_audio_features(request, track_id):
+    """Get track audio features"""
+    return await _proxy(request, 'get_track_audio_features', track_id)
+
+
+# Artist Views
+@require_GET
+async def artist_detail(request, artist_id):
+    """Get artist details"""
+    return await _proxy(request, 'get_artist', artist_id)
+
+
+@require_GET
+async def artist_albums(request, artist_id):
+    """Get artist's albums"""
+    return await _proxy(request, 'get_artist_albums', artist_id, int_params={'limit': 20})
+
+
+@require_GET
+async def artist_top_tracks(request, artist_id):
+    """Get artist's top tracks"""
+    market = request.GET.get('market', 'US')
+    return await _proxy(request, 'get_artist_top_tracks', artist_id, market)
+
+
+@require_GET
+async def related_artists(request, artist_id):
+    """Get related artists"""
+    return await _proxy(request, 'get_related_artists', artist_id)
+
+
+# Album Views
+@require_GET
+async def album_detail(request, album_id):
+    """Get album details"""
+    return await _proxy(request, 'get_album', album_id)
+
+
+@require_GET
+async def album_tracks(request, album_id):
+    """Get album tracks"""
+    return await _proxy(request, 'get_album_tracks', album_id, int_params={'limit': 20})
+
+
+# Playlist Views
+@require_GET
+async def playlist_detail(request, playlist_id):
+    """Get playlist details"""
+    return await _proxy(request, 'get_playlist', playlist_id)
+
+
+@require_GET
+async def playlist_tracks(request, playlist_id):
+    """Get playlist tracks"""
+    return await _proxy(request, 'get_playlist_tracks', playlist_id, int_params={'limit': 20, 'offset': 0})
+
+
+# Browse Views
+@require_GET
+async def featured_playlists(request):
+    """Get featured playlists"""
+    return await _proxy(request, 'get_featured_playlists', int_params={'limit': 20})
+
+
+@require_GET
+async def new_releases(request):
+    """Get new album releases"""
+    return await _proxy(request, 'get_new_releases', int_params={'limit': 20})
+
+
+@require_GET
+async def categories(request):
+    """Get browse categories"""
+    return await _proxy(request, 'get_categories', int_params={'limit': 20})
+
+
+# Library Views
+@require_GET
+async def saved_tracks(request):
+    """Get user's saved tracks"""
+    return await _proxy(request, 'get_saved_tracks', int_params={'limit': 20, 'offset': 0})
@@ -0,0 +1,223 @@
+"""
+Audio-feature statistics over a user's library (the SavedTrack mirror).
+
+Audio features never change, so each track's are stored once in
+TrackAudioFeatures: taken from favorites when someone has the track as one
+(UserTrack keeps its features), otherwise fetched from Spotify 100 tracks
+per call. Per user, the features of their library are kept in the cache as
+one (tracks x features) float32 array with the track IDs of its rows.
+
+When the library changes (by its row count and newest pk), rows of removed
+tracks are dropped and only added tracks are looked up; the statistics are
+then recomputed from the array with a few NumPy reductions, which takes a
+few milliseconds even for tens of thousands of tracks. Unchanged libraries
+are answered from the cached result.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from . import metrics
+from .models import SavedTrack, TrackAudioFeatures, UserTrack
+from .services import SpotifyAPIService
+
+
+NUMERIC = (
+    'danceability', 'energy', 'valence', 'acousticness', 'instrumentalness',
+    'speechiness', 'liveness', 'loudness', 'tempo',
+)
+COLUMNS = NUMERIC + ('key', 'mode')
+KEY = COLUMNS.index('key')
+MODE = COLUMNS.index('mode')
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Feature: (low, high, bins); values outside the range count in the end bins
+HISTOGRAMS = {
+    'tempo': (40.0, 220.0, 18),
+    'energy': (0.0, 1.0, 10),
+    'valence': (0.0, 1.0, 10),
+}
+KEY_NAMES = ('C', 'C#/Db', 'D', 'D#/Eb', 'E', 'F', 'F#/Gb', 'G', 'G#/Ab', 'A', 'A#/Bb', 'B')
+
+# Tracks looked up per database query, and fetched from Spotify before storing
+LOOKUP_CHUNK = 500
+FETCH_CHUNK = 1000
+
+
+def _summary_key(user_id):
+    return f'audio_analytics:summary:{user_id}'
+
+
+def _state_key(user_id):
+    return f'audio_analytics:state:{user_id}'
+
+
+def library_digest(user_id):
+    """Changes whenever tracks are added to or removed from the user's library"""
+    totals = SavedTrack.objects.filter(user_id=user_id).order_by().aggregate(rows=Count('pk'), latest=Max('pk'))
+    return f"{totals['rows']}:{totals['latest']}"
+
+
+def _number(features, name):
+    value = features.get(name) if isinstance(features, dict) else None
+    return value if isinstance(value, (int, float)) else np.nan
+
+
+def to_rows(features_list):
+    """Raw feature rows (COLUMNS order) for audio-features dicts; NaN where a value is missing"""
+    return np.array(
+        [[_number(features, name) for name in COLUMNS] for features in features_list],
+        dtype=np.float32,
+    ).reshape(-1, len(COLUMNS))
+
+
+def _complete(features):
+    return isinstance(features, dict) and all(isinstance(features.get(name), (int, float)) for name in COLUMNS)
+
+
+def get_features(user, track_ids):
+    """
+    Audio features for ``track_ids`` as {track_id: features or None}, from
+    the store, then favorites, then Spotify; whatever is found is stored.
+    Tracks missing from the result could not be fetched (Spotify failed).
+    """
+    found = {}
+    for start in range(0, len(track_ids), LOOKUP_CHUNK):
+        found.update(TrackAudioFeatures.objects.filter(
+            track_id__in=track_ids[start:start + LOOKUP_CHUNK]
+        ).values_list('track_id', 'features'))
+
+    missing = [track_id for track_id in track_ids if track_id not in found]
+    known = {}
+    for start in range(0, len(missing), LOOKUP_CHUNK):
+        for track_id, features in UserTrack.objects.filter(
+            track_id__in=missing[start:start + LOOKUP_CHUNK]
+        ).order_by().values_list('track_id', 'audio_features'):
+            if _complete(features):
+                known[track_id] = features
+    _store(known)
+    found.update(known)
+
+    missing = [track_id for track_id in missing if track_id not in known]
+    if missing:
+        service = SpotifyAPIService(user)
+        for start in range(0, len(missing), FETCH_CHUNK):
+            chunk = missing[start:start + FETCH_CHUNK]
+            try:
+                features = service.get_tracks_audio_features(chunk)['audio_features']
+            except Exception:
+                # Keep what was fetched so far; the rest is retried on a later request
+                metrics.incr('audio_features_fetch_failed')
+                break
+            fetched = dict(zip(chunk, features))
+            _store(fetched)
+            found.update(fetched)
+            metrics.incr('audio_features_fetched', len(chunk))
+    return found
+
+
+def _store(features):
+    # Only the analysed values are kept, not Spotify's URLs and IDs
+    TrackAudioFeatures.objects.bulk_create(
+        [
+            TrackAudioFeatures(
+                track_id=track_id,
+                features={name: item[name] for name in COLUMNS if name in item} if isinstance(item, dict) else None,
+            )
+            for track_id, item in features.items()
+        ],
+        batch_size=500, ignore_conflicts=True,
+    )
+
+
+def update(user):
+    """
+    Bring the user's cached feature array up to date with their library and
+    return it as a dict of ``track_ids``, ``values`` and ``pending`` (tracks
+    whose features could not be fetched yet).
+    """
+    state = cache.get(_state_key(user.pk)) or {
+        'track_ids': [], 'values': np.empty((0, len(COLUMNS)), dtype=np.float32),
+    }
+    current = list(SavedTrack.objects.filter(user=user).order_by().values_list('track_id', flat=True))
+    in_library = set(current)
+
+    keep = np.fromiter((track_id in in_library for track_id in state['track_ids']), dtype=bool,
+                       count=len(state['track_ids']))
+    track_ids = [track_id for track_id, kept in zip(state['track_ids'], keep) if kept]
+    values = state['values'][keep]
+
+    have = set(track_ids)
+    added = [track_id for track_id in current if track_id not in have]
+    features = get_features(user, added) if added else {}
+    rows = [track_id for track_id in added if track_id in features]
+    state = {
+        'track_ids': track_ids + rows,
+        'values': np.concatenate([values, to_rows([features[track_id] for track_id in rows])]),
+        'pending': [track_id for track_id in added if track_id not in features],
+    }
+    cache.set(_state_key(user.pk), state, settings.AUDIO_ANALYTICS_TIMEOUT)
+    metrics.incr('audio_analytics_updates')
+    return state
+
+
+def _round(values):
+    return [round(float(value), 4) for value in values]
+
+
+def summarize(values, pending=0):
+    """Distribution statistics of a (tracks x COLUMNS) feature array"""
+    complete = ~np.isnan(values).any(axis=1)
+    data = values[complete]
+    summary = {
+        'tracks': len(values) + pending,
+        'analyzed': len(data),
+        'without_features': int(len(values) - len(data)),
+        'pending': pending,
+        'features': {},
+        'histograms': {},
+        'keys': {},
+        'modes': {},
+    }
+    if not len(data):
+        return summary
+
+    numeric = data[:, :len(NUMERIC)].astype(np.float64)
+    means = numeric.mean(axis=0)
+    stds = numeric.std(axis=0)
+    percentiles = np.percentile(numeric, PERCENTILES, axis=0)
+    for column, name in enumerate(NUMERIC):
+        summary['features'][name] = {
+            'mean': round(float(means[column]), 4),
+            'std': round(float(stds[column]), 4),
+            'percentiles': dict(zip((f'p{p}' for p in PERCENTILES), _round(percentiles[:, column]))),
+        }
+
+    for name, (low, high, bins) in HISTOGRAMS.items():
+        column = numeric[:, NUMERIC.index(name)]
+        counts, edges = np.histogram(np.clip(column, low, high), bins=bins, range=(low, high))
+        summary['histograms'][name] = {'edges': _round(edges), 'counts': counts.tolist()}
+
+    # Key -1 means Spotify detected none
+    keys = np.bincount(np.clip(data[:, KEY], -1, 11).astype(np.int64) + 1, minlength=13)
+    summary['keys'] = dict(zip(('none',) + KEY_NAMES, keys.tolist()))
+    modes = np.bincount(np.clip(data[:, MODE], 0, 1).astype(np.int64), minlength=2)
+    summary['modes'] = {'minor': int(modes[0]), 'major': int(modes[1])}
+    return summary
+
+
+def library_stats(user):
+    """Audio-feature statistics for the user's library, cached until it changes"""
+    digest = library_digest(user.pk)
+    cached = cache.get(_summary_key(user.pk))
+    if cached is not None and cached['digest'] == digest:
+        metrics.incr('audio_analytics_hits')
+        return cached['summary']
+
+    state = update(user)
+    summary = summarize(state['values'], len(state['pending']))
+    # Retry the tracks Spotify failed on soon, rather than when the library next changes
+    timeout = settings.AUDIO_ANALYTICS_RETRY if state['pending'] else settings.AUDIO_ANALYTICS_TIMEOUT
+    cache.set(_summary_key(user.pk), {'digest': digest, 'summary': summary}, timeout)
+    return summary
@@ -0,0 +1,418 @@
+"""
+Stale-while-revalidate caching for Spotify responses.
+
+Each cached response is stored as a CacheEntry with two lifetimes:
+
+* a soft TTL, after which the entry is stale: it is still served, but a
+  background refresh is started;
+* a hard TTL (the backend timeout), after which the entry is gone and the
+  next request fetches inline.
+
+Both TTLs are jittered so keys written together do not expire together,
+and refreshes start probabilistically before the soft expiry using the
+XFetch rule (Vattani et al., "Optimal Probabilistic Cache Stampede
+Prevention"): the longer a value takes to recompute, the earlier it tends
+to be refreshed.
+
+Entries keep the upstream ETag. A refresh of a stale entry sends it as
+If-None-Match, and a 304 just renews the entry's TTLs without re-downloading
+or re-parsing the body.
+
+Reads go through a per-process L1 (see local_cache) before the shared
+cache; writes update both and broadcast an invalidation to other workers.
+
+Fetches are single-flight across workers: a short lock in the shared cache
+(SET NX on Redis) elects one worker per key to call Spotify. On a miss the
+others poll briefly for its result; on a stale hit they keep serving the
+stale copy instead of refreshing it themselves.
+"""
+import asyncio
+import hashlib
+import math
+import pickle
+import random
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .concurrency import submit
+from .local_cache import broadcast_invalidation, get_local_cache
+
+
+FRESH = 'fresh'
+STALE = 'stale'
+MISS = 'miss'
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_refresh_tasks = set()
+
+
+class CacheEntry:
+    """A cached value plus the bookkeeping needed to refresh or revalidate it"""
+
+    __slots__ = ('value', 'soft_expiry', 'delta', 'etag', 'size')
+
+    def __init__(self, value, soft_expiry, delta, etag=None, size=0):
+        self.value = value
+        self.soft_expiry = soft_expiry
+        self.delta = delta
+        self.etag = etag
+        self.size = size
+
+    def state(self, now=None):
+        """Classify the entry as FRESH or STALE, applying XFetch early expiry"""
+        now = time.time() if now is None else now
+        early = self.delta * settings.CACHE_XFETCH_BETA * -math.log(1.0 - random.random())
+        return STALE if now + early >= self.soft_expiry else FRESH
+
+
+def jitter(timeout):
+    """Spread a TTL by +/- CACHE_TTL_JITTER so related keys expire at different times"""
+    spread = settings.CACHE_TTL_JITTER
+    return timeout * random.uniform(1 - spread, 1 + spread)
+
+
+def make_entry(value, timeout, delta=0.0, etag=None, size=0):
+    """Wrap a value for storage and return it with its (hard) backend timeout"""
+    soft_ttl = jitter(timeout)
+    entry = CacheEntry(value, time.time() + soft_ttl, delta, etag, size)
+    return entry, int(math.ceil(soft_ttl * settings.CACHE_STALE_TTL_FACTOR))
+
+
+def classify(entry):
+    """Turn a raw cache value into (value, FRESH/STALE/MISS)"""
+    if entry is None:
+        return None, MISS
+    if not isinstance(entry, CacheEntry):
+        # Written before stale-while-revalidate existed; treat as fresh until it expires
+        return entry, FRESH
+    return entry.value, entry.state()
+
+
+def _remember(key, entry):
+    """Keep a copy of a shared-cache entry in L1 until it would go stale"""
+    if not isinstance(entry, CacheEntry):
+        get_local_cache().set(key, entry)
+        return
+    # The recorded size spares L1 from pickling the entry again on every shared-cache hit
+    get_local_cache().set(key, entry, entry.soft_expiry - time.time(), entry.size or None)
+
+
+def _read_local(keys):
+    """Split keys into L1 hits ({key: entry}) and keys that must be read from the shared cache"""
+    local_cache = get_local_cache()
+    found = {}
+    remaining = []
+    for key in keys:
+        entry = local_cache.get(key)
+        if entry is None:
+            remaining.append(key)
+        else:
+            found[key] = entry
+    if found:
+        metrics.incr('l1_hit', len(found))
+    if remaining:
+        metrics.incr('l1_miss', len(remaining))
+    return found, remaining
+
+
+def _merge_shared(found, remaining, shared):
+    """Add shared-cache results to L1 hits, caching them locally, and classify everything"""
+    for key, entry in shared.items():
+        _remember(key, entry)
+        found[key] = entry
+    if shared:
+        metrics.incr('l2_hit', len(shared))
+    if len(remaining) > len(shared):
+        metrics.incr('l2_miss', len(remaining) - len(shared))
+
+    classified = {}
+    for key, entry in found.items():
+        classified[key] = classify(entry)
+        metrics.incr(f'cache_{classified[key][1]}')
+    misses = len(remaining) - len(shared)
+    if misses:
+        metrics.incr('cache_miss', misses)
+    return classified
+
+
+def lookup(key):
+    """Read a key through L1 then the shared cache, and classify it"""
+    found, remaining = _read_local([key])
+    shared = {}
+    if remaining:
+        entry = cache.get(key)
+        if entry is not None:
+            shared[key] = entry
+    return _merge_shared(found, remaining, shared).get(key, (None, MISS))
+
+
+def lookup_many(keys):
+    """Read several keys (L1 first, then one shared multi-get); returns {key: (value, state)} for keys present"""
+    found, remaining = _read_local(keys)
+    shared = cache.get_many(remaining) if remaining else {}
+    return _merge_shared(found, remaining, shared)
+
+
+async def alookup(key):
+    """Async counterpart of lookup()"""
+    found, remaining = _read_local([key])
+    shared = {}
+    if remaining:
+        entry = await cache.aget(key)
+        if entry is not None:
+            shared[key] = entry
+    return _merge_shared(found, remaining, shared).get(key, (None, MISS))
+
+
+async def alookup_many(keys):
+    """Async counterpart of lookup_many()"""
+    found, remaining = _read_local(keys)
+    shared = await cache.aget_many(remaining) if remaining else {}
+    return _merge_shared(found, remaining, shared)
+
+
+def _hard_timeout(timeout):
+    """Backend timeout that outlives every jittered soft TTL for ``timeout``"""
+    return int(math.ceil(timeout * (1 + settings.CACHE_TTL_JITTER) * settings.CACHE_STALE_TTL_FACTOR))
+
+
+def peek(key):
+    """Get the raw CacheEntry for a key (L1, then shared cache) without touching hit counters"""
+    entry = get_local_cache().get(key)
+    if entry is None:
+        entry = cache.get(key)
+    return entry if isinstance(entry, CacheEntry) else None
+
+
+async def apeek(key):
+    """Async counterpart of peek()"""
+    entry = get_local_cache().get(key)
+    if entry is None:
+        entry = await cache.aget(key)
+    return entry if isinstance(entry, CacheEntry) else None
+
+
+def _size(value):
+    """Approximate size of a value with no upstream body length, measured once when it is written"""
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def store(key, value, timeout, delta=0.0, etag=None, size=0):
+    """Cache a value with jittered soft and hard TTLs, plus its upstream ETag if any"""
+    entry, hard_timeout = make_entry(value, timeout, delta, etag, size)
+    cache.set(key, entry, hard_timeout)
+    _remember(key, entry)
+    broadcast_invalidation([key])
+
+
+def store_many(values, timeout, delta=0.0):
+    """Cache several values with one multi-set; each entry gets its own jittered soft TTL"""
+    entries = {key: make_entry(value, timeout, delta, size=_size(value))[0] for key, value in values.items()}
+    cache.set_many(entries, _hard_timeout(timeout))
+    for key, entry in entries.items():
+        _remember(key, entry)
+    broadcast_invalidation(entries)
+
+
+async def astore(key, value, timeout, delta=0.0, etag=None, size=0):
+    """Async counterpart of store()"""
+    entry, hard_timeout = make_entry(value, timeout, delta, etag, size)
+    await cache.aset(key, entry, hard_timeout)
+    _remember(key, entry)
+    await sync_to_async(broadcast_invalidation, thread_sensitive=False)([key])
+
+
+async def astore_many(values, timeout, delta=0.0):
+    """Async counterpart of store_many()"""
+    entries = {key: make_entry(value, timeout, delta, size=_size(value))[0] for key, value in values.items()}
+    await cache.aset_many(entries, _hard_timeout(timeout))
+    for key, entry in entries.items():
+        _remember(key, entry)
+    await sync_to_async(broadcast_invalidation, thread_sensitive=False)(list(entries))
+
+
+def invalidate(*keys):
+    """Drop keys from the shared cache and from every worker's L1"""
+    cache.delete_many(keys)
+    local_cache = get_local_cache()
+    for key in keys:
+        local_cache.delete(key)
+    broadcast_invalidation(keys)
+
+
+def _lock_key(key):
+    return f'lock:{key}'
+
+
+def acquire(key, timeout=None):
+    """Try to become the single worker fetching ``key``; returns a release token or None"""
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, timeout or settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release(key, token):
+    """Release a lock taken by acquire(), unless it already expired and was re-taken"""
+    if cache.get(_lock_key(key)) == token:
+        cache.delete(_lock_key(key))
+
+
+async def aacquire(key):
+    """Async counterpart of acquire()"""
+    token = uuid.uuid4().hex
+    if await cache.aadd(_lock_key(key), token, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+async def arelease(key, token):
+    """Async counterpart of release()"""
+    if await cache.aget(_lock_key(key)) == token:
+        await cache.adelete(_lock_key(key))
+
+
+def _poll_delays():
+    """Back-off schedule for waiting on another worker's fetch, bounded by SINGLE_FLIGHT_WAIT"""
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    delay = 0.01
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(delay, remaining)
+        delay = min(delay * 2, 0.1)
+
+
+def single_flight(key, fetch):
+    """
+    Run ``fetch()`` for a missing key, or wait for the worker that already is.
+
+    Returns the fetched value, or the value another worker cached while we
+    waited. Falls back to fetching directly if the wait times out.
+    """
+    token = acquire(key)
+    if token:
+        metrics.incr('single_flight_leader')
+        try:
+            return fetch()
+        finally:
+            release(key, token)
+
+    metrics.incr('single_flight_wait')
+    started = time.monotonic()
+    for delay in _poll_delays():
+        time.sleep(delay)
+        value, state = classify(cache.get(key))
+        if state != MISS:
+            metrics.incr('single_flight_coalesced')
+            metrics.incr('single_flight_wait_seconds', time.monotonic() - started)
+            return value
+
+    metrics.incr('single_flight_wait_timeout')
+    metrics.incr('single_flight_wait_seconds', time.monotonic() - started)
+    return fetch()
+
+
+async def asingle_flight(key, fetch):
+    """Async counterpart of single_flight(); ``fetch`` is a coroutine function"""
+    token = await aacquire(key)
+    if token:
+        metrics.incr('single_flight_leader')
+        try:
+            return await fetch()
+        finally:
+            await arelease(key, token)
+
+    metrics.incr('single_flight_wait')
+    started = time.monotonic()
+    for delay in _poll_delays():
+        await asyncio.sleep(delay)
+        value, state = classify(await cache.aget(key))
+        if state != MISS:
+            metrics.incr('single_flight_coalesced')
+            metrics.incr('single_flight_wait_seconds', time.monotonic() - started)
+            return value
+
+    metrics.incr('single_flight_wait_timeout')
+    metrics.incr('single_flight_wait_seconds', time.monotonic() - started)
+    return await fetch()
+
+
+def _claim(key):
+    """Mark ``key`` as being refreshed by this process; False if it already is"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release(key):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def batch_key(prefix, ids):
+    """Refresh/lock key for a batch of IDs, the same for any order of the IDs"""
+    # Hashed: the joined IDs of a large batch would make a key of tens of KB
+    return f"{prefix}:{hashlib.sha1(','.join(sorted(ids)).encode()).hexdigest()}"
+
+
+def refresh_in_background(key, refresh):
+    """Run ``refresh()`` on the refresh pool unless any worker is already refreshing ``key``"""
+    if not _claim(key):
+        return False
+    token = acquire(key)
+    if token is None:
+        # Another worker holds the lock; keep serving stale until its refresh lands
+        _release(key)
+        metrics.incr('refresh_coalesced')
+        return False
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            # The stale value stays in place until its hard TTL; the next reader retries
+            metrics.incr('cache_refresh_failed')
+        finally:
+            release(key, token)
+            _release(key)
+
+    metrics.incr('cache_background_refresh')
+    submit('refresh', run)
+    return True
+
+
+def refresh_in_background_async(key, refresh):
+    """Schedule the coroutine function ``refresh`` on the running loop unless ``key`` is already refreshing"""
+    if not _claim(key):
+        return False
+
+    async def run():
+        token = await aacquire(key)
+        if token is None:
+            _release(key)
+            metrics.incr('refresh_coalesced')
+            return
+        metrics.incr('cache_background_refresh')
+        try:
+            await refresh()
+        except Exception:
+            metrics.incr('cache_refresh_failed')
+        finally:
+            await arelease(key, token)
+            _release(key)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+    return True
@@ -0,0 +1,99 @@
+"""
+Bounded thread pools for fanning out independent Spotify calls
+"""
+import threading
+from collections import deque
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import connections
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name='fanout'):
+    """Get a named process-wide executor, creating it on first use"""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=settings.SPOTIFY_FANOUT_WORKERS,
+                    thread_name_prefix=f'spotify-{name}',
+                )
+                _executors[name] = executor
+    return executor
+
+
+def _run(func, args, kwargs):
+    """Run a call on a pool thread and release any DB connection it opened"""
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def submit(executor, func, *args, **kwargs):
+    """Run a call in the background on a named executor"""
+    return get_executor(executor).submit(_run, func, args, kwargs)
+
+
+def gather(calls, timeout=None, executor='fanout'):
+    """
+    Run named calls concurrently and wait for them up to a shared deadline.
+
+    ``calls`` maps a name to ``(func, args, kwargs)``. Returns two dicts:
+    results by name, and error messages by name for calls that raised or
+    did not finish in time. A failed call never affects the others.
+    """
+    pool = get_executor(executor)
+    futures = {
+        name: pool.submit(_run, func, args, kwargs)
+        for name, (func, args, kwargs) in calls.items()
+    }
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel()
+            results[name] = None
+            errors[name] = 'timeout'
+        except Exception as e:
+            results[name] = None
+            errors[name] = str(e)
+    return results, errors
+
+
+def map_concurrently(func, items, executor='batch', limit=None):
+    """
+    Call ``func`` on each item concurrently and return results in order,
+    re-raising the first error. With ``limit``, at most that many calls are
+    in flight at once.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    pool = get_executor(executor)
+    if limit is None:
+        futures = [pool.submit(_run, func, (item,), {}) for item in items]
+        return [future.result() for future in futures]
+
+    results = [None] * len(items)
+    in_flight = deque()
+    for index, item in enumerate(items):
+        if len(in_flight) >= limit:
+            done_index, future = in_flight.popleft()
+            results[done_index] = future.result()
+        in_flight.append((index, pool.submit(_run, func, (item,), {})))
+    for done_index, future in in_flight:
+        results[done_index] = future.result()
+    return results
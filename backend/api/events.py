@@ -0,0 +1,163 @@
+"""
+Write-behind buffer for user-activity writes (searches and plays).
+
+Views record an event in a bounded per-process queue and return without
+touching the database. A daemon thread drains the queue every
+ACTIVITY_FLUSH_INTERVAL seconds, or as soon as ACTIVITY_FLUSH_SIZE events
+are waiting, and writes each batch with one bulk query per kind: in this
+process, or in a Celery worker when ACTIVITY_FLUSH_MODE is 'celery'. When
+ACTIVITY_BUFFER_LIMIT events are already waiting, new ones are dropped
+(and counted) rather than slowing requests down.
+
+Events are plain JSON-safe dicts so they can travel through Celery as is.
+Rows get their created_at when written, so it may lag the request by up to
+one flush interval.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import metrics
+from .listening import play_fields
+from .models import ListeningHistory, SearchHistory
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH = 'search'
+PLAY = 'play'
+
+_lock = threading.Lock()
+_buffer = deque()
+_wakeup = threading.Event()
+_flusher_pid = None
+
+
+def _json_safe(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def record(kind, user_id, **fields):
+    """Queue one event for writing; returns False if the buffer was full and it was dropped"""
+    event = {'kind': kind, 'user_id': user_id, **{name: _json_safe(value) for name, value in fields.items()}}
+    with _lock:
+        if len(_buffer) >= settings.ACTIVITY_BUFFER_LIMIT:
+            metrics.incr('activity_events_dropped')
+            return False
+        _buffer.append(event)
+        pending = len(_buffer)
+    metrics.incr('activity_events_recorded')
+    _start_flusher()
+    if pending >= settings.ACTIVITY_FLUSH_SIZE:
+        _wakeup.set()
+    return True
+
+
+def record_search(user, query, search_type, result_count):
+    return record(SEARCH, user.pk, query=query[:200], search_type=search_type[:20], result_count=result_count)
+
+
+def record_plays(user, items):
+    """Queue play history objects (from /me/player/recently-played) as play events"""
+    for item in items:
+        fields = play_fields(item)
+        if fields:
+            record(PLAY, user.pk, **fields)
+
+
+def buffered():
+    """Events waiting in this process"""
+    return len(_buffer)
+
+
+def _start_flusher():
+    """Run the flush loop in a daemon thread (once per process, again after fork)"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, daemon=True, name='activity-events').start()
+
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(settings.ACTIVITY_FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception('Activity event flush failed')
+        finally:
+            connections.close_all()
+
+
+def _drain():
+    with _lock:
+        events = list(_buffer)
+        _buffer.clear()
+    return events
+
+
+def flush():
+    """Write everything buffered in this process now; returns the number of events handed off"""
+    events = _drain()
+    if not events:
+        return 0
+    metrics.incr('activity_flushes')
+    if settings.ACTIVITY_FLUSH_MODE == 'celery':
+        from .tasks import write_activity_events
+        try:
+            write_activity_events.delay(events)
+            return len(events)
+        except Exception:
+            # Broker unreachable: write here rather than lose the batch
+            logger.exception('Could not queue %d activity events, writing them in-process', len(events))
+    _write_with_retry(events)
+    return len(events)
+
+
+def _write_with_retry(events):
+    try:
+        write(events)
+    except Exception:
+        # One retry covers transient failures such as SQLite's "database is locked"
+        time.sleep(0.5)
+        try:
+            write(events)
+        except Exception:
+            metrics.incr('activity_events_lost', len(events))
+            logger.exception('Dropped %d activity events after a failed write', len(events))
+
+
+def _fields(event):
+    return {name: value for name, value in event.items() if name != 'kind'}
+
+
+def write(events):
+    """Apply a batch of events with one bulk query per kind, atomically so a retry cannot duplicate rows"""
+    with transaction.atomic():
+        _write(events)
+    metrics.incr('activity_events_written', len(events))
+
+
+def _write(events):
+    searches = [SearchHistory(**_fields(event)) for event in events if event['kind'] == SEARCH]
+    SearchHistory.objects.bulk_create(searches, batch_size=500)
+
+    plays = [ListeningHistory(**_fields(event)) for event in events if event['kind'] == PLAY]
+    # Dashboard plays are also ingested from the recently-played poll
+    ListeningHistory.objects.bulk_create(plays, batch_size=500, ignore_conflicts=True)
+
+
+# Whatever is still buffered when a worker shuts down
+atexit.register(flush)
@@ -0,0 +1,120 @@
+"""
+Process-wide pooled HTTP clients for upstream Spotify calls
+"""
+import asyncio
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = {}
+
+
+def _build_session():
+    """Create a keep-alive session with a bounded connection pool"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.SPOTIFY_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.SPOTIFY_HTTP_POOL_MAXSIZE,
+        pool_block=settings.SPOTIFY_HTTP_POOL_BLOCK,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # The session is shared between threads, so never let upstream cookies leak across users
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    session.headers['Connection'] = 'keep-alive'
+    return session
+
+
+def get_session():
+    """Get the shared session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session():
+    """
+    Forget the shared session and aiohttp clients in a forked child. Their
+    pooled sockets are shared with the parent, so they are dropped unclosed
+    and the child opens its own connections.
+    """
+    global _session, _session_lock
+    _session = None
+    # The parent may have held the lock at the moment of the fork
+    _session_lock = threading.Lock()
+    _async_clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Pre-forked gunicorn workers, Celery prefork pools and the recommendation process pool
+    os.register_at_fork(after_in_child=reset_session)
+
+
+def get_async_client():
+    """Get the pooled aiohttp session bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.closed:
+        # Sessions cannot be shared across event loops, so drop any left over from closed loops
+        for stale_loop in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[stale_loop]
+        client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.SPOTIFY_ASYNC_MAX_CONNECTIONS,
+                limit_per_host=settings.SPOTIFY_ASYNC_MAX_PER_HOST,
+            ),
+            timeout=aiohttp.ClientTimeout(total=settings.SPOTIFY_HTTP_TIMEOUT),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the aiohttp session bound to the running event loop"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def pool_stats():
+    """Report connection pool utilisation for this process"""
+    stats = {
+        'pid': os.getpid(),
+        'pool_connections': settings.SPOTIFY_HTTP_POOL_CONNECTIONS,
+        'pool_maxsize': settings.SPOTIFY_HTTP_POOL_MAXSIZE,
+        'hosts': [],
+    }
+    if _session is None:
+        return stats
+
+    adapter = _session.get_adapter('https://')
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        # The pool queue is pre-filled with None placeholders; real entries are idle sockets
+        queued = list(pool.pool.queue) if pool.pool is not None else []
+        idle = sum(1 for conn in queued if conn is not None)
+        in_use = pool.pool.maxsize - len(queued) if pool.pool is not None else 0
+        stats['hosts'].append({
+            'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+            'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+            'in_use': in_use,
+            'idle': idle,
+            'connections_opened': pool.num_connections,
+            'requests_sent': pool.num_requests,
+        })
+    return stats
@@ -0,0 +1,175 @@
+"""
+Local mirror of each user's Spotify saved tracks (SavedTrack).
+
+Spotify lists /me/tracks newest first, so an incremental sync reads pages
+only until it reaches the user's ``added_at`` watermark, which is usually a
+single request. Removals never show up that way, so a full reconciliation
+re-reads the whole library (pages fetched in parallel) and deletes whatever
+is gone. It runs every LIBRARY_FULL_SYNC_INTERVAL, or immediately when
+Spotify's total disagrees with the local count after an incremental pass.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching
+from .models import LibrarySyncState, SavedTrack
+from .services import SpotifyAPIService
+
+
+PAGE_SIZE = 50
+
+UPDATE_FIELDS = [
+    'name', 'artist_name', 'artist_id', 'album_name', 'album_id', 'image_url',
+    'duration_ms', 'popularity', 'explicit', 'added_at', 'synced_at',
+]
+
+
+def _saved_track(user, item):
+    """Build a SavedTrack from a saved-track object, or None for local files"""
+    track = item.get('track') or {}
+    if not track.get('id'):
+        return None
+    album = track.get('album') or {}
+    artists = track.get('artists') or [{}]
+    images = album.get('images') or [{}]
+    return SavedTrack(
+        user=user,
+        track_id=track['id'],
+        name=(track.get('name') or '')[:200],
+        artist_name=', '.join(artist.get('name') or '' for artist in artists)[:200],
+        artist_id=artists[0].get('id') or '',
+        album_name=(album.get('name') or '')[:200],
+        album_id=album.get('id') or '',
+        image_url=images[0].get('url') or '',
+        duration_ms=track.get('duration_ms') or 0,
+        popularity=track.get('popularity') or 0,
+        explicit=bool(track.get('explicit')),
+        added_at=parse_datetime(item['added_at']),
+    )
+
+
+def _upsert(rows):
+    SavedTrack.objects.bulk_create(
+        rows, batch_size=500,
+        update_conflicts=True, unique_fields=['user', 'track_id'], update_fields=UPDATE_FIELDS,
+    )
+
+
+def _incremental(service, user, watermark):
+    """Mirror tracks added since ``watermark``; returns (rows, Spotify's total)"""
+    rows = []
+    offset = 0
+    while True:
+        page = service.get_saved_tracks(limit=PAGE_SIZE, offset=offset)
+        reached_watermark = False
+        for item in page.get('items') or []:
+            if watermark is not None and parse_datetime(item['added_at']) < watermark:
+                reached_watermark = True
+                break
+            row = _saved_track(user, item)
+            if row is not None:
+                rows.append(row)
+        if reached_watermark or not page.get('next'):
+            break
+        offset += PAGE_SIZE
+
+    _upsert(rows)
+    return rows, page.get('total') or 0
+
+
+def _full(service, user):
+    """Mirror the whole library and drop tracks that are no longer saved; returns (rows, Spotify's total, removed)"""
+    items = service.get_all_saved_tracks()
+    rows = [row for row in (_saved_track(user, item) for item in items) if row]
+    _upsert(rows)
+
+    saved = {row.track_id for row in rows}
+    removed = [
+        track_id for track_id in SavedTrack.objects.filter(user=user).values_list('track_id', flat=True)
+        if track_id not in saved
+    ]
+    # Chunked to stay under SQLite's bound-parameter limit
+    for start in range(0, len(removed), 500):
+        SavedTrack.objects.filter(user=user, track_id__in=removed[start:start + 500]).delete()
+    return rows, len(items), len(removed)
+
+
+def needs_full_sync(state):
+    if state.last_full_sync_at is None:
+        return True
+    return state.last_full_sync_at <= timezone.now() - timedelta(seconds=settings.LIBRARY_FULL_SYNC_INTERVAL)
+
+
+def sync_saved_tracks(user, full=None):
+    """
+    Bring a user's SavedTrack mirror up to date and return a summary.
+
+    ``full`` forces (True) or skips (False) reconciliation; by default it
+    runs when due. Returns None if another worker is already syncing the user.
+    """
+    lock_name = f'library_sync:{user.pk}'
+    lock = caching.acquire(lock_name, timeout=settings.LIBRARY_SYNC_LOCK_TIMEOUT)
+    if lock is None:
+        return None
+
+    state, _ = LibrarySyncState.objects.get_or_create(user=user)
+    started = timezone.now()
+    try:
+        service = SpotifyAPIService(user)
+        if full is None:
+            full = needs_full_sync(state)
+
+        removed = 0
+        if not full:
+            rows, spotify_total = _incremental(service, user, state.added_at_watermark)
+            if spotify_total != SavedTrack.objects.filter(user=user).count() + state.unmirrored:
+                # Something was removed (or missed): reconcile now rather than at the next full sync
+                full = True
+        if full:
+            rows, spotify_total, removed = _full(service, user)
+            state.unmirrored = spotify_total - len(rows)
+    except Exception as e:
+        state.last_error = str(e)
+        state.save(update_fields=['last_error', 'updated_at'])
+        raise
+    finally:
+        caching.release(lock_name, lock)
+
+    if rows:
+        newest = max(row.added_at for row in rows)
+        if state.added_at_watermark is None or newest > state.added_at_watermark:
+            state.added_at_watermark = newest
+    state.last_synced_at = started
+    if full:
+        state.last_full_sync_at = started
+    state.spotify_total = spotify_total
+    state.last_error = ''
+    state.save()
+
+    return {
+        'user_id': user.pk,
+        'full': full,
+        'upserted': len(rows),
+        'removed': removed,
+        'total': spotify_total,
+        'seconds': round((timezone.now() - started).total_seconds(), 3),
+    }
+
+
+def sync_status(user):
+    """Describe how current a user's mirror is"""
+    state = LibrarySyncState.objects.filter(user=user).first()
+    if state is None or state.last_synced_at is None:
+        return {'synced': False, 'lag_seconds': None, 'last_error': state.last_error if state else ''}
+    return {
+        'synced': True,
+        'lag_seconds': round((timezone.now() - state.last_synced_at).total_seconds(), 1),
+        'last_synced_at': state.last_synced_at,
+        'last_full_sync_at': state.last_full_sync_at,
+        'added_at_watermark': state.added_at_watermark,
+        'spotify_total': state.spotify_total,
+        'last_error': state.last_error,
+    }
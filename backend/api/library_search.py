@@ -0,0 +1,237 @@
+"""
+Full-text search over each user's local library (UserTrack, UserArtist,
+UserAlbum), answered from the database without calling Spotify.
+
+Every query word is matched as a prefix ("miles da" finds "Miles Davis"),
+and results are ranked by BM25 with name matches weighted above artist and
+album matches. The backend is chosen by LIBRARY_SEARCH_BACKEND, or from the
+database vendor when that is blank:
+
+* SQLiteFTSBackend keeps an FTS5 virtual table (created by migration 0006)
+  in step with the three models through signals (see api.signals), and
+  rebuild_library_search re-indexes everything;
+* PostgresBackend builds tsvectors at query time, which needs no upkeep as
+  each user's library is small and read through the (user, -created_at)
+  indexes.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import UserAlbum, UserArtist, UserTrack
+
+
+KINDS = ('track', 'artist', 'album')
+
+# Field identifying a row within its user's library, for rows saved without getting their pk back
+NATURAL_KEYS = {UserTrack: 'track_id', UserArtist: 'artist_id', UserAlbum: 'album_id'}
+
+_backend = None
+
+
+def terms(query):
+    """Case-folded words of a query; punctuation never reaches the FTS query syntax"""
+    return re.findall(r'\w+', query.casefold())
+
+
+def with_pks(objs):
+    """
+    ``objs`` with their primary keys. bulk_create does not set them on every
+    database (nor for update_conflicts before Django 5.0), so rows that lack
+    one are looked up by user and natural key; rows not found are left out.
+    """
+    objs = list(objs)
+    by_model = {}
+    for obj in objs:
+        if obj.pk is None:
+            by_model.setdefault(type(obj), []).append(obj)
+    for model, rows in by_model.items():
+        field = NATURAL_KEYS[model]
+        pks = {}
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            pks.update(
+                ((user_id, key), pk) for user_id, key, pk in model.objects.filter(
+                    user_id__in={obj.user_id for obj in chunk},
+                    **{f'{field}__in': {getattr(obj, field) for obj in chunk}},
+                ).values_list('user_id', field, 'pk')
+            )
+        for obj in rows:
+            obj.pk = pks.get((obj.user_id, getattr(obj, field)))
+    return [obj for obj in objs if obj.pk is not None]
+
+
+class LibrarySearchBackend:
+    """Interface of library search backends"""
+
+    def index(self, objs):
+        """Add or update UserTrack/UserArtist/UserAlbum rows"""
+
+    def remove(self, objs):
+        """Drop rows that were deleted"""
+
+    def rebuild(self):
+        """Re-index every library row; returns how many were indexed"""
+        return 0
+
+    def search(self, user, query, kinds=KINDS, limit=20):
+        """Best matches as dicts with type, id, name, artist_name, album_name and score"""
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(LibrarySearchBackend):
+    """
+    FTS5 table with one row per library item. Indexed words are namespaced
+    with the owner (``u42_blue``), so a prefix query only ever scans the
+    searching user's part of the term index; the original text is kept in
+    unindexed columns for display. The rowid encodes the model and primary
+    key, so signals update a row without scanning.
+    """
+
+    table = 'library_search'
+
+    # rowid = pk * 4 + code
+    CODES = {UserTrack: 1, UserArtist: 2, UserAlbum: 3}
+
+    # bm25 weights, in column order: name, artist_name, album_name
+    WEIGHTS = (10.0, 4.0, 2.0)
+
+    COLUMNS = 'rowid, name, artist_name, album_name, kind, item_id, display_name, display_artist, display_album'
+
+    @staticmethod
+    def _words(user_id, text):
+        return ' '.join(f'u{user_id}_{word}' for word in terms(text))
+
+    @classmethod
+    def _row(cls, obj):
+        if isinstance(obj, UserTrack):
+            kind, item_id, artist_name, album_name = 'track', obj.track_id, obj.artist_name, obj.album_name
+        elif isinstance(obj, UserArtist):
+            kind, item_id, artist_name, album_name = 'artist', obj.artist_id, '', ''
+        else:
+            kind, item_id, artist_name, album_name = 'album', obj.album_id, obj.artist_name, ''
+        return (
+            obj.pk * 4 + cls.CODES[type(obj)],
+            cls._words(obj.user_id, obj.name), cls._words(obj.user_id, artist_name),
+            cls._words(obj.user_id, album_name),
+            kind, item_id, obj.name, artist_name, album_name,
+        )
+
+    def index(self, objs):
+        rows = [self._row(obj) for obj in with_pks(objs)]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table} ({self.COLUMNS}) VALUES ({", ".join(["%s"] * 9)})', rows)
+
+    def remove(self, objs):
+        rowids = [(obj.pk * 4 + self.CODES[type(obj)],) for obj in objs if obj.pk is not None]
+        if rowids:
+            with connection.cursor() as cursor:
+                cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', rowids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        indexed = 0
+        for model in self.CODES:
+            batch = []
+            for obj in model.objects.order_by().iterator(chunk_size=2000):
+                batch.append(obj)
+                if len(batch) == 2000:
+                    self.index(batch)
+                    indexed += len(batch)
+                    batch = []
+            self.index(batch)
+            indexed += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return indexed
+
+    def search(self, user, query, kinds=KINDS, limit=20):
+        words = terms(query)
+        if not words:
+            return []
+        match = ' '.join(f'"u{user.pk}_{word}"*' for word in words)
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        placeholders = ', '.join(['%s'] * len(kinds))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT kind, item_id, display_name, display_artist, display_album, '
+                f'bm25({self.table}, {weights}) AS score '
+                f'FROM {self.table} WHERE {self.table} MATCH %s AND kind IN ({placeholders}) '
+                f'ORDER BY score LIMIT %s',
+                [match, *kinds, limit]
+            )
+            rows = cursor.fetchall()
+        return [
+            {'type': kind, 'id': item_id, 'name': name, 'artist_name': artist_name,
+             'album_name': album_name, 'score': -score}
+            for kind, item_id, name, artist_name, album_name, score in rows
+        ]
+
+
+class PostgresBackend(LibrarySearchBackend):
+    """Ranks each model's rows with to_tsvector/ts_rank; nothing to maintain"""
+
+    FIELDS = {
+        'track': (UserTrack, 'track_id', ['name', 'artist_name', 'album_name']),
+        'artist': (UserArtist, 'artist_id', ['name']),
+        'album': (UserAlbum, 'album_id', ['name', 'artist_name']),
+    }
+
+    WEIGHTS = ('A', 'B', 'C')
+
+    def search(self, user, query, kinds=KINDS, limit=20):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        words = terms(query)
+        if not words:
+            return []
+        tsquery = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+        results = []
+        for kind in kinds:
+            model, id_field, fields = self.FIELDS[kind]
+            vector = SearchVector(fields[0], weight='A', config='simple')
+            for field, weight in zip(fields[1:], self.WEIGHTS[1:]):
+                vector += SearchVector(field, weight=weight, config='simple')
+            rows = (
+                model.objects.filter(user=user)
+                .annotate(document=vector, score=SearchRank(vector, tsquery))
+                .filter(document=tsquery)
+                .order_by('-score')[:limit]
+            )
+            results.extend(
+                {'type': kind, 'id': getattr(row, id_field), 'name': row.name,
+                 'artist_name': getattr(row, 'artist_name', ''), 'album_name': getattr(row, 'album_name', ''),
+                 'score': round(row.score, 4)}
+                for row in rows
+            )
+        results.sort(key=lambda result: result['score'], reverse=True)
+        return results[:limit]
+
+
+DEFAULT_BACKENDS = {
+    'sqlite': 'api.library_search.SQLiteFTSBackend',
+    'postgresql': 'api.library_search.PostgresBackend',
+}
+
+
+def get_backend():
+    """The configured backend (one instance per process)"""
+    global _backend
+    if _backend is None:
+        path = settings.LIBRARY_SEARCH_BACKEND or DEFAULT_BACKENDS.get(connection.vendor)
+        if path is None:
+            raise ImproperlyConfigured(f'No library search backend for {connection.vendor}; set LIBRARY_SEARCH_BACKEND')
+        _backend = import_string(path)()
+    return _backend
+
+
+def search(user, query, kinds=KINDS, limit=20):
+    return get_backend().search(user, query, kinds, limit)
@@ -0,0 +1,147 @@
+"""
+Ingestion of users' recently played tracks into ListeningHistory.
+
+Each poll asks /me/player/recently-played only for plays after the user's
+stored ``after`` cursor, so a user costs one upstream request per run. Users
+are processed in batches: polls run concurrently under the shared rate limit
+(waiting up to LISTENING_RATE_LIMIT_MAX_WAIT for tokens instead of failing),
+and the plays of a whole batch are written with a single bulk_create that
+skips (user, track, played_at) rows already stored.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics, rate_limit
+from .concurrency import map_concurrently
+from .models import ListeningHistory, ListeningSyncState
+from .services import SpotifyAPIService
+
+
+LAST_RUN_KEY = 'listening_ingest:last_run'
+
+
+def play_fields(item):
+    """ListeningHistory fields of a play history object, or None for items without a track ID"""
+    track = item.get('track') or {}
+    if not track.get('id'):
+        return None
+    context = item.get('context') or {}
+    return {
+        'track_id': track['id'],
+        'track_name': (track.get('name') or '')[:200],
+        'artist_name': ', '.join(artist.get('name') or '' for artist in track.get('artists') or [])[:200],
+        'played_at': parse_datetime(item['played_at']),
+        # Spotify does not report how much was played; the track length is the best estimate
+        'duration_played': track.get('duration_ms') or 0,
+        'context_type': context.get('type') or '',
+        'context_id': (context.get('uri') or '').rsplit(':', 1)[-1],
+    }
+
+
+def _plays(user, items):
+    """Build ListeningHistory rows from play history objects"""
+    plays = (play_fields(item) for item in items)
+    return [ListeningHistory(user=user, **fields) for fields in plays if fields]
+
+
+def _poll(user, state):
+    """Fetch a user's plays since their cursor; returns (rows, new cursor, error)"""
+    try:
+        with rate_limit.patient(settings.LISTENING_RATE_LIMIT_MAX_WAIT):
+            page = SpotifyAPIService(user).get_recently_played(limit=50, after=state.after_cursor)
+    except Exception as e:
+        return [], state.after_cursor, str(e)
+    cursor = (page.get('cursors') or {}).get('after')
+    return _plays(user, page.get('items') or []), int(cursor) if cursor else state.after_cursor, ''
+
+
+def ingest_users(user_ids):
+    """Ingest new plays for a batch of users and return a throughput report"""
+    started = time.monotonic()
+    users = list(User.objects.filter(pk__in=user_ids, spotify_token__isnull=False))
+    states = {state.user_id: state for state in ListeningSyncState.objects.filter(user__in=users)}
+    missing = [ListeningSyncState(user=user) for user in users if user.pk not in states]
+    ListeningSyncState.objects.bulk_create(missing, ignore_conflicts=True)
+    if missing:
+        states = {state.user_id: state for state in ListeningSyncState.objects.filter(user__in=users)}
+
+    results = map_concurrently(
+        lambda user: _poll(user, states[user.pk]),
+        users, executor='ingest', limit=settings.LISTENING_INGEST_CONCURRENCY
+    )
+
+    polled_at = timezone.now()
+    rows = []
+    failed = 0
+    for user, (plays, cursor, error) in zip(users, results):
+        state = states[user.pk]
+        state.after_cursor = cursor
+        state.last_polled_at = polled_at
+        state.last_error = error
+        failed += bool(error)
+        rows.extend(plays)
+
+    ListeningHistory.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    ListeningSyncState.objects.bulk_update(
+        states.values(), ['after_cursor', 'last_polled_at', 'last_error'], batch_size=500
+    )
+
+    elapsed = time.monotonic() - started
+    metrics.incr('listening_users_polled', len(users))
+    metrics.incr('listening_plays_ingested', len(rows))
+    return {
+        'users': len(users),
+        'failed': failed,
+        'plays': len(rows),
+        'seconds': round(elapsed, 3),
+        'users_per_second': round(len(users) / elapsed, 1) if elapsed else None,
+    }
+
+
+def due_user_ids():
+    """
+    IDs of connected users not polled within LISTENING_POLL_INTERVAL (less
+    LISTENING_POLL_SLACK), least recently polled first. Without the slack a
+    user stamped late in the previous run would just miss each next run and
+    be polled only every other interval.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.LISTENING_POLL_INTERVAL - settings.LISTENING_POLL_SLACK)
+    return (
+        User.objects
+        .filter(spotify_token__isnull=False)
+        .exclude(listening_sync__last_polled_at__gte=cutoff)
+        .order_by(F('listening_sync__last_polled_at').asc(nulls_first=True), 'pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def batches(user_ids, size=None):
+    """Split user IDs into ingestion batches"""
+    size = size or settings.LISTENING_INGEST_BATCH_SIZE
+    user_ids = list(user_ids)
+    return [user_ids[start:start + size] for start in range(0, len(user_ids), size)]
+
+
+def record_run(reports, elapsed):
+    """Combine a run's batch reports, keep the result for /api/stats/ and return it"""
+    run = {'batches': len(reports), 'users': 0, 'failed': 0, 'plays': 0}
+    for report in reports:
+        for key in ('users', 'failed', 'plays'):
+            run[key] += report[key]
+    run['seconds'] = round(elapsed, 3)
+    run['users_per_second'] = round(run['users'] / elapsed, 1) if elapsed else None
+    run['plays_per_second'] = round(run['plays'] / elapsed, 1) if elapsed else None
+    run['finished_at'] = timezone.now().isoformat()
+    cache.set(LAST_RUN_KEY, run, None)
+    return run
+
+
+def last_run():
+    return cache.get(LAST_RUN_KEY)
@@ -0,0 +1,252 @@
+"""
+Listening statistics rolled up from ListeningHistory.
+
+ListeningRollup holds plays and listening time per user, period (day, week
+or month), period start and track or artist; ListeningHourRollup holds them
+per hour of the day. Stats endpoints read a few rows of these through their
+indexes, however long a user's history is. Periods and hours are in
+TIME_ZONE.
+
+The rollups are maintained incrementally. Each run reads the plays above
+the watermark in ListeningRollupState, in pk order and LISTENING_ROLLUP_BATCH
+at a time, sums them in memory and adds the sums with INSERT ... ON CONFLICT
+DO UPDATE, moving the watermark in the same transaction, so no play is
+counted twice. Plays stored late (with an old played_at) still land in
+their own period.
+
+`manage.py rebuild_listening_rollups` recomputes them from the history, for
+backfills or after changing how plays are counted.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching, metrics
+from .models import ListeningHistory, ListeningHourRollup, ListeningRollup, ListeningRollupState
+
+
+LAST_RUN_KEY = 'listening_rollups:last_run'
+LOCK_NAME = 'listening_rollups'
+
+PERIODS = ('day', 'week', 'month')
+ITEM_TYPES = ('track', 'artist')
+
+PLAY_FIELDS = ('pk', 'user_id', 'track_id', 'track_name', 'artist_name', 'played_at', 'duration_played', 'created_at')
+
+ITEM_UPSERT = (
+    f'INSERT INTO {ListeningRollup._meta.db_table} '
+    '(user_id, period, period_start, item_type, item_id, item_name, artist_name, plays, ms_played) '
+    'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) '
+    'ON CONFLICT (user_id, period, period_start, item_type, item_id) DO UPDATE SET '
+    f'plays = {ListeningRollup._meta.db_table}.plays + excluded.plays, '
+    f'ms_played = {ListeningRollup._meta.db_table}.ms_played + excluded.ms_played, '
+    'item_name = excluded.item_name, artist_name = excluded.artist_name'
+)
+HOUR_UPSERT = (
+    f'INSERT INTO {ListeningHourRollup._meta.db_table} (user_id, hour, plays, ms_played) '
+    'VALUES (%s, %s, %s, %s) '
+    'ON CONFLICT (user_id, hour) DO UPDATE SET '
+    f'plays = {ListeningHourRollup._meta.db_table}.plays + excluded.plays, '
+    f'ms_played = {ListeningHourRollup._meta.db_table}.ms_played + excluded.ms_played'
+)
+
+
+def period_start(day, period):
+    """First day of the day, week (from Monday) or month containing ``day``"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def aggregate(plays):
+    """
+    Sum plays, as (user_id, track_id, track_name, artist_name, played_at,
+    duration_played) tuples, into rollup increments: returns ({(user_id,
+    period, period_start, item_type, item_id): [item_name, artist_name,
+    plays, ms]}, {(user_id, hour): [plays, ms]}).
+    """
+    items = {}
+    hours = {}
+    for user_id, track_id, track_name, artist_name, played_at, duration in plays:
+        played_at = timezone.localtime(played_at)
+        day = played_at.date()
+        # Plays only record a comma-joined artist string; the first is the primary artist
+        artist = artist_name.split(', ')[0]
+        entries = [('track', track_id, track_name, artist_name)]
+        if artist:
+            entries.append(('artist', artist.casefold()[:200], artist, ''))
+        for period in PERIODS:
+            start = period_start(day, period)
+            for item_type, item_id, name, subtitle in entries:
+                totals = items.get((user_id, period, start, item_type, item_id))
+                if totals is None:
+                    totals = items[(user_id, period, start, item_type, item_id)] = [name, subtitle, 0, 0]
+                # The most recent play's names win
+                totals[0], totals[1] = name, subtitle
+                totals[2] += 1
+                totals[3] += duration
+        totals = hours.setdefault((user_id, played_at.hour), [0, 0])
+        totals[0] += 1
+        totals[1] += duration
+    return items, hours
+
+
+def _upsert(items, hours):
+    date_value = connection.ops.adapt_datefield_value
+    with connection.cursor() as cursor:
+        # In index order, so consecutive upserts touch the same pages
+        cursor.executemany(ITEM_UPSERT, [
+            (user_id, period, date_value(start), item_type, item_id, name, subtitle, plays, ms)
+            for (user_id, period, start, item_type, item_id), (name, subtitle, plays, ms) in sorted(items.items())
+        ])
+        cursor.executemany(HOUR_UPSERT, [
+            (user_id, hour, plays, ms) for (user_id, hour), (plays, ms) in hours.items()
+        ])
+
+
+def _roll_up_batch(size, cutoff):
+    """Add the next ``size`` plays above the watermark to the rollups; returns (plays added, whether more are ready)"""
+    with transaction.atomic():
+        ListeningRollupState.objects.get_or_create(pk=1)
+        state = ListeningRollupState.objects.select_for_update().get(pk=1)
+        rows = list(
+            ListeningHistory.objects.filter(pk__gt=state.last_history_id)
+            .order_by('pk').values_list(*PLAY_FIELDS)[:size]
+        )
+        full = len(rows) == size
+        # Stop at the first play too recent to be sure that no lower pk is still being written
+        for index, row in enumerate(rows):
+            if row[-1] >= cutoff:
+                rows = rows[:index]
+                full = False
+                break
+        if not rows:
+            return 0, False
+        _upsert(*aggregate(row[1:-1] for row in rows))
+        state.last_history_id = rows[-1][0]
+        state.save(update_fields=['last_history_id', 'updated_at'])
+    metrics.incr('listening_plays_rolled_up', len(rows))
+    return len(rows), full
+
+
+def _catch_up(batch_size=None):
+    size = batch_size or settings.LISTENING_ROLLUP_BATCH
+    cutoff = timezone.now() - timedelta(seconds=settings.LISTENING_ROLLUP_LAG)
+    plays = batches = 0
+    while True:
+        added, more = _roll_up_batch(size, cutoff)
+        plays += added
+        batches += bool(added)
+        if not more:
+            return plays, batches
+
+
+def roll_up(batch_size=None):
+    """
+    Add plays stored since the last run to the rollups and return a report,
+    or None if another run is in progress.
+    """
+    token = caching.acquire(LOCK_NAME, timeout=settings.LISTENING_ROLLUP_LOCK_TIMEOUT)
+    if token is None:
+        return None
+    started = time.monotonic()
+    try:
+        plays, batches = _catch_up(batch_size)
+    finally:
+        caching.release(LOCK_NAME, token)
+    return record_run(plays, batches, time.monotonic() - started)
+
+
+def rebuild(user_ids=None, batch_size=None):
+    """
+    Recompute the rollups from ListeningHistory, for ``user_ids`` or for
+    everyone, and return a report (None if a run is in progress).
+
+    A full rebuild empties the tables and replays every play from the start
+    (stats are partial until it finishes). A per-user rebuild replays those
+    users' plays up to the watermark in one transaction; later plays are
+    left to the regular runs.
+    """
+    token = caching.acquire(LOCK_NAME, timeout=settings.LISTENING_ROLLUP_LOCK_TIMEOUT)
+    if token is None:
+        return None
+    started = time.monotonic()
+    try:
+        if user_ids is None:
+            with transaction.atomic():
+                ListeningRollup.objects.all().delete()
+                ListeningHourRollup.objects.all().delete()
+                ListeningRollupState.objects.update_or_create(pk=1, defaults={'last_history_id': 0})
+            plays, batches = _catch_up(batch_size)
+        else:
+            plays, batches = _rebuild_users(user_ids, batch_size or settings.LISTENING_ROLLUP_BATCH)
+    finally:
+        caching.release(LOCK_NAME, token)
+    return record_run(plays, batches, time.monotonic() - started, rebuilt=user_ids or 'all')
+
+
+def _rebuild_users(user_ids, size):
+    with transaction.atomic():
+        ListeningRollupState.objects.get_or_create(pk=1)
+        state = ListeningRollupState.objects.select_for_update().get(pk=1)
+        ListeningRollup.objects.filter(user_id__in=user_ids).delete()
+        ListeningHourRollup.objects.filter(user_id__in=user_ids).delete()
+        plays = ListeningHistory.objects.filter(
+            user_id__in=user_ids, pk__lte=state.last_history_id
+        ).order_by('pk').values_list(*PLAY_FIELDS[1:-1])
+        count = batches = 0
+        batch = []
+        for play in plays.iterator(chunk_size=size):
+            batch.append(play)
+            if len(batch) == size:
+                _upsert(*aggregate(batch))
+                count, batches, batch = count + len(batch), batches + 1, []
+        if batch:
+            _upsert(*aggregate(batch))
+            count, batches = count + len(batch), batches + 1
+    return count, batches
+
+
+def record_run(plays, batches, elapsed, rebuilt=None):
+    """Keep a run's report for /api/stats/ and return it"""
+    run = {
+        'plays': plays,
+        'batches': batches,
+        'seconds': round(elapsed, 3),
+        'plays_per_second': round(plays / elapsed, 1) if elapsed else None,
+        'watermark': ListeningRollupState.objects.filter(pk=1).values_list('last_history_id', flat=True).first(),
+        'finished_at': timezone.now().isoformat(),
+    }
+    if rebuilt is not None:
+        run['rebuilt'] = rebuilt
+    cache.set(LAST_RUN_KEY, run, None)
+    return run
+
+
+def last_run():
+    return cache.get(LAST_RUN_KEY)
+
+
+def top_items(user, period, item_type, day=None, limit=10):
+    """The user's most played tracks or artists in the ``period`` containing ``day`` (today by default)"""
+    start = period_start(day or timezone.localdate(), period)
+    items = ListeningRollup.objects.filter(
+        user=user, period=period, period_start=start, item_type=item_type
+    ).order_by('-plays', '-ms_played').values('item_id', 'item_name', 'artist_name', 'plays', 'ms_played')
+    return {'period': period, 'start': start.isoformat(), 'type': item_type, 'items': list(items[:limit])}
+
+
+def hours(user):
+    """The user's plays and listening time for each hour of the day"""
+    totals = dict.fromkeys(range(24), (0, 0))
+    totals.update(
+        (hour, (plays, ms)) for hour, plays, ms in
+        ListeningHourRollup.objects.filter(user=user).values_list('hour', 'plays', 'ms_played')
+    )
+    return [{'hour': hour, 'plays': plays, 'ms_played': ms} for hour, (plays, ms) in totals.items()]
@@ -0,0 +1,119 @@
+"""
+DataLoader-style batching of single-ID catalog lookups.
+
+Code that needs many tracks, artists or albums calls ``load(id)`` for each
+one and reads the results later. Everything queued in between is resolved
+with chunked multi-ID calls (``/tracks?ids=``, ``/artists?ids=``,
+``/albums?ids=``) instead of one upstream call per ID. Loaders live on a
+service instance, and services are built per request, so results are only
+shared within one request.
+
+The services' ``get_track``, ``get_artist`` and ``get_album`` go through
+them too: on the async service, lookups awaited together (e.g. with
+asyncio.gather) share one call; on the sync one, a lookup dispatches
+whatever was queued with ``load`` before it.
+"""
+import asyncio
+
+
+BATCH_METHODS = {
+    'track': 'get_tracks',
+    'artist': 'get_artists',
+    'album': 'get_albums',
+}
+
+
+class LoadedItem:
+    """Handle for a queued lookup, resolved on first access"""
+
+    def __init__(self, loader, item_id):
+        self.loader = loader
+        self.item_id = item_id
+
+    def result(self):
+        """Get the item, dispatching the loader's pending batch if needed"""
+        return self.loader.get(self.item_id)
+
+
+class BatchLoader:
+    """Request-scoped batching loader for the sync SpotifyAPIService"""
+
+    def __init__(self, service, kind):
+        self.batch_fn = getattr(service, BATCH_METHODS[kind])
+        self._pending = []
+        self._results = {}
+
+    def load(self, item_id):
+        """Queue an ID for the next batch and return a handle to its result"""
+        if item_id not in self._results and item_id not in self._pending:
+            self._pending.append(item_id)
+        return LoadedItem(self, item_id)
+
+    def load_many(self, item_ids):
+        """Queue several IDs and resolve them straight away, in input order"""
+        for item_id in item_ids:
+            self.load(item_id)
+        self.dispatch()
+        return [self._results.get(item_id) for item_id in item_ids]
+
+    def get(self, item_id):
+        """Get a loaded item, dispatching the pending batch if it is not resolved yet"""
+        if item_id not in self._results:
+            self.load(item_id)
+            self.dispatch()
+        return self._results.get(item_id)
+
+    def dispatch(self):
+        """Resolve every pending ID with as few multi-ID calls as possible"""
+        pending, self._pending = self._pending, []
+        if pending:
+            self._results.update(zip(pending, self.batch_fn(pending)))
+
+
+class AsyncBatchLoader:
+    """
+    Request-scoped batching loader for AsyncSpotifyAPIService.
+
+    ``load(id)`` returns a future. IDs requested in the same event loop tick
+    are dispatched together once the current tasks yield.
+    """
+
+    def __init__(self, service, kind):
+        self.batch_fn = getattr(service, BATCH_METHODS[kind])
+        self._pending = []
+        self._futures = {}
+        self._scheduled = False
+        self._task = None
+
+    def load(self, item_id):
+        """Queue an ID for the current tick and return a future for its result"""
+        future = self._futures.get(item_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[item_id] = future
+            self._pending.append(item_id)
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(self._start_dispatch)
+        return future
+
+    async def load_many(self, item_ids):
+        """Load several IDs and wait for all of them, in input order"""
+        return list(await asyncio.gather(*(self.load(item_id) for item_id in item_ids)))
+
+    def _start_dispatch(self):
+        # Keep a reference so the dispatch task is not garbage collected mid-flight
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        pending, self._pending = self._pending, []
+        self._scheduled = False
+        try:
+            results = await self.batch_fn(pending)
+        except Exception as e:
+            for item_id in pending:
+                self._futures.pop(item_id).set_exception(e)
+        else:
+            for item_id, item in zip(pending, results):
+                self._futures[item_id].set_result(item)
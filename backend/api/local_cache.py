@@ -0,0 +1,165 @@
+"""
+In-process L1 cache in front of the shared Redis cache.
+
+Entries are kept as already-unpickled objects in a byte-bounded LRU with a
+short TTL, so hot keys skip both the Redis round-trip and deserialization.
+Whenever a worker writes or deletes a key in the shared cache it publishes
+the key on a Redis pub/sub channel, and every other worker drops its local
+copy.
+"""
+import json
+import os
+import pickle
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+CHANNEL = 'cache-invalidation'
+
+
+class LocalCache:
+    """Thread-safe LRU with a total size bound in bytes and per-entry TTL"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Get a live entry and mark it most recently used, or None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires, size = item
+            if expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, size=None):
+        """Store an entry, evicting least recently used ones to stay under max_bytes"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
+
+
+_local_cache = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def get_local_cache():
+    """Get this process's L1 cache, starting the invalidation listener on first use"""
+    global _local_cache
+    if _local_cache is None:
+        with _listener_lock:
+            if _local_cache is None:
+                _local_cache = LocalCache(settings.CACHE_L1_MAX_BYTES, settings.CACHE_L1_TTL)
+    if _listener_pid != os.getpid():
+        _start_listener()
+    return _local_cache
+
+
+def redis_connection():
+    """Raw Redis client behind CACHES['default'], or None for non-Redis backends"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _origin():
+    # Computed per call: workers forked from a preloaded master share module state
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _start_listener():
+    """Subscribe to invalidations in a daemon thread (once per process, again after fork)"""
+    global _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        connection = redis_connection()
+        if connection is None:
+            # Single-process backends (e.g. locmem in development) need no broadcast
+            return
+        threading.Thread(
+            target=_listen, args=(connection,), daemon=True, name='cache-invalidation'
+        ).start()
+
+
+def _listen(connection):
+    origin = _origin()
+    while True:
+        try:
+            pubsub = connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            for message in pubsub.listen():
+                payload = json.loads(message['data'])
+                if payload['origin'] == origin:
+                    continue
+                for key in payload['keys']:
+                    _local_cache.delete(key)
+        except Exception:
+            # Messages may have been missed while disconnected, so nothing local can be trusted
+            _local_cache.clear()
+            time.sleep(1)
+
+
+def broadcast_invalidation(keys):
+    """Tell every other worker to drop ``keys`` from its L1 cache"""
+    connection = redis_connection()
+    if connection is None or not keys:
+        return
+    try:
+        connection.publish(CHANNEL, json.dumps({'origin': _origin(), 'keys': list(keys)}))
+    except Exception:
+        # L1 entries still expire after CACHE_L1_TTL
+        pass
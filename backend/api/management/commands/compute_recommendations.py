@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api import recommendations
+
+
+class Command(BaseCommand):
+    help = "Compute recommendations for users whose inputs changed, sharded across a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='recompute every user, not only those whose inputs changed')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='worker processes (default RECOMMENDATION_PROCESSES, 0 = one per CPU)')
+        parser.add_argument('--shard-size', type=int, default=None,
+                            help='users per shard (default RECOMMENDATION_SHARD_SIZE)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        shards = recommendations.shards(recommendations.due_user_ids(options['full']), options['shard_size'])
+        processes = options['processes']
+        if processes is None:
+            processes = settings.RECOMMENDATION_PROCESSES
+        processes = min(processes or os.cpu_count() or 1, len(shards))
+
+        reports = []
+        if processes <= 1:
+            for shard in shards:
+                reports.append(recommendations.compute_users(shard))
+                self._progress(reports)
+        else:
+            # Built once here and inherited by forked workers
+            recommendations.get_catalog()
+            # Workers open their own connections rather than sharing these
+            connections.close_all()
+            context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+            with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup) as pool:
+                for future in as_completed(pool.submit(recommendations.compute_users, shard) for shard in shards):
+                    reports.append(future.result())
+                    self._progress(reports)
+
+        run = recommendations.record_run(reports, time.monotonic() - started, options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{run['users']} users, {run['recommendations']} recommendations in {run['seconds']}s "
+            f"with {max(processes, 1)} processes: {run['users_per_second']} users/s"
+        ))
+
+    def _progress(self, reports):
+        report = reports[-1]
+        self.stdout.write(
+            f"shard {len(reports)}: {report['users']} users, {report['recommendations']} recommendations "
+            f"in {report['seconds']}s"
+        )
@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from api import listening
+
+
+class Command(BaseCommand):
+    help = "Ingest recently played tracks into ListeningHistory for users due a poll"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='users per batch (default LISTENING_INGEST_BATCH_SIZE)')
+        parser.add_argument('--all', action='store_true',
+                            help='poll every connected user, ignoring LISTENING_POLL_INTERVAL')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            user_ids = User.objects.filter(spotify_token__isnull=False).values_list('pk', flat=True)
+        else:
+            user_ids = listening.due_user_ids()
+
+        started = time.monotonic()
+        reports = []
+        for batch in listening.batches(user_ids, options['batch_size']):
+            report = listening.ingest_users(batch)
+            reports.append(report)
+            self.stdout.write(
+                f"batch {len(reports)}: {report['users']} users, {report['plays']} plays, "
+                f"{report['failed']} failed in {report['seconds']}s"
+            )
+
+        run = listening.record_run(reports, time.monotonic() - started)
+        self.stdout.write(self.style.SUCCESS(
+            f"{run['users']} users ({run['failed']} failed), {run['plays']} plays in {run['seconds']}s: "
+            f"{run['users_per_second']} users/s, {run['plays_per_second']} plays/s"
+        ))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import library_search
+
+
+class Command(BaseCommand):
+    help = "Re-index every favorite track, artist and album for local library search"
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            indexed = library_search.get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} library items in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import listening_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the listening statistics rollups from ListeningHistory (after backfills)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', default=None,
+                            help='rebuild only these user IDs (default: everyone)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='plays per transaction (default LISTENING_ROLLUP_BATCH)')
+
+    def handle(self, *args, **options):
+        run = listening_stats.rebuild(options['users'], options['batch_size'])
+        if run is None:
+            raise CommandError('A listening rollup run is in progress; try again when it finishes')
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {run['plays']} plays in {run['batches']} batches in {run['seconds']}s "
+            f"({run['plays_per_second']} plays/s), watermark {run['watermark']}"
+        ))
@@ -0,0 +1,96 @@
+"""
+Lightweight counters for the caching and upstream layers.
+
+Increments are kept in process memory and folded into the shared Django
+cache at most every ``METRICS_FLUSH_INTERVAL`` seconds, on a background
+thread, so the hot path (sync or async) never waits on Redis while
+/api/stats/ can still report totals across all workers.
+
+Counter names are registered with atomic cache operations only: the first
+worker to ``add`` a name's marker key appends it to a numbered list of
+slots, so workers never overwrite each other's names.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .concurrency import submit
+
+
+NAMES_COUNT_KEY = 'metrics:names:count'
+
+_lock = threading.Lock()
+_process = Counter()
+_unflushed = Counter()
+_last_flush = time.monotonic()
+# Names this process has already registered
+_registered = set()
+
+
+def incr(name, amount=1):
+    """Increment a counter (amount may be a float, e.g. seconds spent waiting)"""
+    global _last_flush
+    with _lock:
+        _process[name] += amount
+        _unflushed[name] += amount
+        if time.monotonic() - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        pending = dict(_unflushed)
+        _unflushed.clear()
+        _last_flush = time.monotonic()
+    try:
+        submit('metrics', _flush, pending)
+    except RuntimeError:
+        # The executor is shutting down (interpreter exit)
+        pass
+
+
+def _flush(pending):
+    """Add pending increments to the cluster-wide totals"""
+    try:
+        for name in pending.keys() - _registered:
+            _register(name)
+        for name, amount in pending.items():
+            key = f'metrics:{name}'
+            # Floats are stored as integer micro-units so they can use atomic incr
+            value = int(round(amount * 1_000_000))
+            if not cache.add(key, value, None):
+                cache.incr(key, value)
+    except Exception:
+        # Metrics must never break a request
+        pass
+
+
+def _register(name):
+    """Add a counter name to the cluster-wide list, once"""
+    if cache.add(f'metrics:name:{name}', True, None):
+        cache.add(NAMES_COUNT_KEY, 0, None)
+        cache.set(f'metrics:names:{cache.incr(NAMES_COUNT_KEY)}', name, None)
+    _registered.add(name)
+
+
+def _names():
+    count = cache.get(NAMES_COUNT_KEY) or 0
+    return set(cache.get_many([f'metrics:names:{slot}' for slot in range(1, count + 1)]).values())
+
+
+def snapshot():
+    """Get counters for this process and the cluster-wide totals"""
+    with _lock:
+        process = dict(_process)
+    try:
+        names = sorted(_names())
+        stored = cache.get_many([f'metrics:{name}' for name in names])
+        cluster = {name: stored.get(f'metrics:{name}', 0) / 1_000_000 for name in names}
+    except Exception:
+        cluster = {}
+    return {'process': process, 'cluster': cluster}
+
+
+def ratio(hits, misses):
+    """Hit rate, or None when nothing has been recorded yet"""
+    total = hits + misses
+    return round(hits / total, 4) if total else None
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def stamp_expires_at(apps, schema_editor):
+    """Existing tokens were issued (or last refreshed) at updated_at"""
+    SpotifyToken = apps.get_model("api", "SpotifyToken")
+    tokens = list(SpotifyToken.objects.filter(expires_at__isnull=True))
+    for token in tokens:
+        token.expires_at = token.updated_at + timedelta(seconds=token.expires_in)
+    SpotifyToken.objects.bulk_update(tokens, ["expires_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spotifytoken",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(stamp_expires_at, migrations.RunPython.noop),
+    ]
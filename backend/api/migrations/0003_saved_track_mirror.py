@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_spotifytoken_expires_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LibrarySyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("added_at_watermark", models.DateTimeField(blank=True, null=True)),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+                ("last_full_sync_at", models.DateTimeField(blank=True, null=True)),
+                ("spotify_total", models.IntegerField(default=0)),
+                ("unmirrored", models.IntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="library_sync",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "library_sync_state",
+            },
+        ),
+        migrations.CreateModel(
+            name="SavedTrack",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("track_id", models.CharField(max_length=100)),
+                ("name", models.CharField(max_length=200)),
+                ("artist_name", models.CharField(max_length=200)),
+                ("artist_id", models.CharField(blank=True, max_length=100)),
+                ("album_name", models.CharField(max_length=200)),
+                ("album_id", models.CharField(blank=True, max_length=100)),
+                ("image_url", models.URLField(blank=True)),
+                ("duration_ms", models.IntegerField(default=0)),
+                ("popularity", models.IntegerField(default=0)),
+                ("explicit", models.BooleanField(default=False)),
+                ("added_at", models.DateTimeField()),
+                ("synced_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="saved_tracks",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "saved_tracks",
+                "ordering": ["-added_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-added_at"], name="saved_tracks_user_added"
+                    )
+                ],
+                "unique_together": {("user", "track_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_saved_track_mirror"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ListeningSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("after_cursor", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "last_polled_at",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+                ("last_error", models.TextField(blank=True)),
+            ],
+            options={
+                "db_table": "listening_sync_state",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="listeninghistory",
+            constraint=models.UniqueConstraint(
+                fields=("user", "track_id", "played_at"),
+                name="listening_history_unique_play",
+            ),
+        ),
+        migrations.AddField(
+            model_name="listeningsyncstate",
+            name="user",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="listening_sync",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
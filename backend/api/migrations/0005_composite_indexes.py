@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_listening_history_ingestion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="listeninghistory",
+            index=models.Index(
+                fields=["user", "-played_at"], name="listening_history_user_played"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="searchhistory",
+            index=models.Index(
+                fields=["user", "-created_at"], name="search_history_user_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="useralbum",
+            index=models.Index(
+                fields=["user", "-created_at"], name="user_albums_user_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userartist",
+            index=models.Index(
+                fields=["user", "-created_at"], name="user_artists_user_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userplaylist",
+            index=models.Index(
+                fields=["user", "-created_at"], name="user_playlists_user_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userrecommendation",
+            index=models.Index(
+                fields=["user", "-score", "-created_at"], name="user_recs_user_score"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usertrack",
+            index=models.Index(
+                fields=["user", "-created_at"], name="user_tracks_user_created"
+            ),
+        ),
+    ]
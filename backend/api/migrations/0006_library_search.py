@@ -0,0 +1,56 @@
+import re
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    """FTS5 table behind api.library_search.SQLiteFTSBackend, filled from the existing rows"""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE library_search USING fts5("
+        "name, artist_name, album_name, kind UNINDEXED, item_id UNINDEXED, "
+        "display_name UNINDEXED, display_artist UNINDEXED, display_album UNINDEXED, "
+        "tokenize = \"unicode61 remove_diacritics 2 tokenchars '_'\")"
+    )
+
+    def words(user_id, text):
+        return " ".join(f"u{user_id}_{word}" for word in re.findall(r"\w+", text.casefold()))
+
+    sources = [
+        ("UserTrack", 1, "track", "track_id", "artist_name", "album_name"),
+        ("UserArtist", 2, "artist", "artist_id", None, None),
+        ("UserAlbum", 3, "album", "album_id", "artist_name", None),
+    ]
+    for model_name, code, kind, id_field, artist_field, album_field in sources:
+        rows = []
+        for obj in apps.get_model("api", model_name).objects.iterator():
+            artist_name = getattr(obj, artist_field) if artist_field else ""
+            album_name = getattr(obj, album_field) if album_field else ""
+            rows.append((
+                obj.pk * 4 + code,
+                words(obj.user_id, obj.name), words(obj.user_id, artist_name), words(obj.user_id, album_name),
+                kind, getattr(obj, id_field), obj.name, artist_name, album_name,
+            ))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO library_search (rowid, name, artist_name, album_name, kind, item_id, "
+                "display_name, display_artist, display_album) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS library_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_library_search"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecommendationState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("inputs_digest", models.CharField(max_length=40)),
+                ("computed_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "recommendation_state",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="userrecommendation",
+            constraint=models.UniqueConstraint(
+                fields=("user", "item_type", "item_id"), name="user_recs_unique_item"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recommendationstate",
+            name="user",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="recommendation_state",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
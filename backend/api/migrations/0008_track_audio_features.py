@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_recommendation_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrackAudioFeatures",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("track_id", models.CharField(max_length=100, unique=True)),
+                ("features", models.JSONField(blank=True, null=True)),
+                ("fetched_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "track_audio_features",
+            },
+        ),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_track_audio_features"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ListeningRollupState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_history_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "listening_rollup_state",
+            },
+        ),
+        migrations.CreateModel(
+            name="ListeningHourRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.SmallIntegerField()),
+                ("plays", models.IntegerField(default=0)),
+                ("ms_played", models.BigIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="listening_hours",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "listening_hour_rollups",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "hour"),
+                        name="listening_hour_rollups_unique_hour",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ListeningRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week"), ("month", "Month")],
+                        max_length=10,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                (
+                    "item_type",
+                    models.CharField(
+                        choices=[("track", "Track"), ("artist", "Artist")],
+                        max_length=10,
+                    ),
+                ),
+                ("item_id", models.CharField(max_length=200)),
+                ("item_name", models.CharField(max_length=200)),
+                ("artist_name", models.CharField(blank=True, max_length=200)),
+                ("plays", models.IntegerField(default=0)),
+                ("ms_played", models.BigIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="listening_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "listening_rollups",
+                "indexes": [
+                    models.Index(
+                        fields=[
+                            "user",
+                            "period",
+                            "period_start",
+                            "item_type",
+                            "-plays",
+                            "-ms_played",
+                        ],
+                        name="listening_rollups_top",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "user",
+                            "period",
+                            "period_start",
+                            "item_type",
+                            "item_id",
+                        ),
+                        name="listening_rollups_unique_item",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_listening_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usertrack",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
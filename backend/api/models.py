@@ -1,4 +1,6 @@
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import json
 
@@ -26,12 +28,19 @@ class SpotifyToken(models.Model):
     refresh_token = models.TextField()
     token_type = models.CharField(max_length=50, default='Bearer')
     expires_in = models.IntegerField()
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
     scope = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Token for {self.user.username}"
+    
+    def expires_within(self, seconds):
+        """Check whether the access token expires in the next ``seconds`` (unknown expiry counts as expiring)"""
+        if self.expires_at is None:
+            return True
+        return self.expires_at <= timezone.now() + timedelta(seconds=seconds)
 
 
 class UserPlaylist(models.Model):
@@ -54,6 +63,9 @@ class UserPlaylist(models.Model):
         db_table = 'user_playlists'
         unique_together = ['user', 'playlist_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='user_playlists_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.name}"
@@ -76,16 +88,82 @@ class UserTrack(models.Model):
     external_urls = models.JSONField(default=dict)
     audio_features = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'user_tracks'
         unique_together = ['user', 'track_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='user_tracks_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.name} by {self.artist_name}"
 
 
+class SavedTrack(models.Model):
+    """Local mirror of a user's Spotify saved-tracks library"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_tracks')
+    track_id = models.CharField(max_length=100)
+    name = models.CharField(max_length=200)
+    artist_name = models.CharField(max_length=200)
+    artist_id = models.CharField(max_length=100, blank=True)
+    album_name = models.CharField(max_length=200)
+    album_id = models.CharField(max_length=100, blank=True)
+    image_url = models.URLField(blank=True)
+    duration_ms = models.IntegerField(default=0)
+    popularity = models.IntegerField(default=0)
+    explicit = models.BooleanField(default=False)
+    added_at = models.DateTimeField()
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'saved_tracks'
+        unique_together = ['user', 'track_id']
+        ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['user', '-added_at'], name='saved_tracks_user_added'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} saved {self.name} by {self.artist_name}"
+
+
+class LibrarySyncState(models.Model):
+    """Progress of mirroring a user's saved tracks into SavedTrack"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='library_sync')
+    # Newest added_at already mirrored; incremental syncs stop paging once they reach it
+    added_at_watermark = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    spotify_total = models.IntegerField(default=0)
+    # Saved items that cannot be mirrored (local files have no track ID)
+    unmirrored = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'library_sync_state'
+
+    def __str__(self):
+        return f"Library sync for {self.user.username}"
+
+
+class TrackAudioFeatures(models.Model):
+    """Spotify audio features of a track, stored once for every user's library analytics"""
+    track_id = models.CharField(max_length=100, unique=True)
+    # Null when Spotify has no audio features for the track
+    features = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'track_audio_features'
+
+    def __str__(self):
+        return f"Audio features of {self.track_id}"
+
+
 class UserArtist(models.Model):
     """Store user's favorite artists"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_artists')
@@ -102,6 +180,9 @@ class UserArtist(models.Model):
         db_table = 'user_artists'
         unique_together = ['user', 'artist_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='user_artists_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.name}"
@@ -125,6 +206,9 @@ class UserAlbum(models.Model):
         db_table = 'user_albums'
         unique_together = ['user', 'album_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='user_albums_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.name} by {self.artist_name}"
@@ -141,6 +225,9 @@ class SearchHistory(models.Model):
     class Meta:
         db_table = 'search_history'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='search_history_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} searched '{self.query}' in {self.search_type}"
@@ -159,11 +246,31 @@ class UserRecommendation(models.Model):
     class Meta:
         db_table = 'user_recommendations'
         ordering = ['-score', '-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item_type', 'item_id'], name='user_recs_unique_item'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score', '-created_at'], name='user_recs_user_score'),
+        ]
 
     def __str__(self):
         return f"Recommendation for {self.user.username}: {self.item_name}"
 
 
+class RecommendationState(models.Model):
+    """When a user's recommendations were last computed, and from which inputs"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation_state')
+    # Digest of the user's favorites, saved tracks and plays; a run skips users whose digest is unchanged
+    inputs_digest = models.CharField(max_length=40)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'recommendation_state'
+
+    def __str__(self):
+        return f"Recommendation state for {self.user.username}"
+
+
 class ListeningHistory(models.Model):
     """Track user's listening patterns"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listening_history')
@@ -179,6 +286,98 @@ class ListeningHistory(models.Model):
     class Meta:
         db_table = 'listening_history'
         ordering = ['-played_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'track_id', 'played_at'], name='listening_history_unique_play'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-played_at'], name='listening_history_user_played'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} played {self.track_name} at {self.played_at}"
+
+
+class ListeningSyncState(models.Model):
+    """Progress of ingesting a user's recently played tracks into ListeningHistory"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='listening_sync')
+    # Spotify's ``cursors.after`` (Unix ms) from the last poll; only newer plays are requested
+    after_cursor = models.BigIntegerField(null=True, blank=True)
+    last_polled_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'listening_sync_state'
+
+    def __str__(self):
+        return f"Listening history sync for {self.user.username}"
+
+
+class ListeningRollup(models.Model):
+    """Plays of a track or artist by a user within one day, week or month, maintained from ListeningHistory"""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+    ITEM_TYPE_CHOICES = [
+        ('track', 'Track'),
+        ('artist', 'Artist'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listening_rollups')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    # First day of the period (weeks start on Monday)
+    period_start = models.DateField()
+    item_type = models.CharField(max_length=10, choices=ITEM_TYPE_CHOICES)
+    # Track ID, or the artist's name casefolded (plays only record artist names)
+    item_id = models.CharField(max_length=200)
+    item_name = models.CharField(max_length=200)
+    artist_name = models.CharField(max_length=200, blank=True)
+    plays = models.IntegerField(default=0)
+    ms_played = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'listening_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'period_start', 'item_type', 'item_id'], name='listening_rollups_unique_item'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'period', 'period_start', 'item_type', '-plays', '-ms_played'],
+                name='listening_rollups_top',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} played {self.item_name} {self.plays}x ({self.period} of {self.period_start})"
+
+
+class ListeningHourRollup(models.Model):
+    """A user's plays and listening time in one hour of the day, over their whole history"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listening_hours')
+    hour = models.SmallIntegerField()
+    plays = models.IntegerField(default=0)
+    ms_played = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'listening_hour_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'hour'], name='listening_hour_rollups_unique_hour'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} at {self.hour:02d}h: {self.plays} plays"
+
+
+class ListeningRollupState(models.Model):
+    """Watermark of the rollups: every ListeningHistory row up to this pk is counted in them"""
+    last_history_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'listening_rollup_state'
+
+    def __str__(self):
+        return f"Listening rollups up to play {self.last_history_id}"
@@ -0,0 +1,217 @@
+"""
+App-wide rate limiting of upstream Spotify calls.
+
+Spotify's quota is per application, not per worker, so every process draws
+from one token bucket kept in Redis (refilled at ``SPOTIFY_RATE_LIMIT``
+requests per second, up to ``SPOTIFY_RATE_LIMIT_BURST``). A caller that
+finds the bucket empty reserves the next token and sleeps until it is due.
+When Spotify answers 429 the bucket is closed for the ``Retry-After``
+period, so all workers back off together instead of each discovering the
+limit on its own.
+
+Non-Redis cache backends (e.g. locmem in development) fall back to an
+in-process bucket.
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics
+from .local_cache import redis_connection
+
+
+BUCKET_KEY = 'ratelimit:spotify'
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Returns the seconds the caller must wait before its token is due, or a
+# negative number when that would exceed max_wait (no token is taken then).
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'blocked_until')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+local blocked_until = tonumber(state[3]) or 0
+
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = math.max(0, blocked_until - now)
+if tokens < 1 then
+    wait = math.max(wait, (1 - tokens) / rate)
+end
+if wait > max_wait then
+    return tostring(-wait)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate + wait) + 60)
+return tostring(wait)
+"""
+
+BLOCK_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local until_ts = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if until_ts > current then
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(until_ts))
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+end
+return 1
+"""
+
+
+class RateLimitExceeded(Exception):
+    """The upstream quota is exhausted for longer than a request may wait"""
+
+
+class LocalBucket:
+    """In-process token bucket with the same semantics as the Redis scripts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def reserve(self, rate, burst, max_wait):
+        with self._lock:
+            now = time.monotonic()
+            tokens = burst if self._tokens is None else self._tokens
+            tokens = min(burst, tokens + (now - self._updated) * rate)
+            wait = max(0.0, self._blocked_until - now)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            if wait > max_wait:
+                return -wait
+            self._tokens = tokens - 1
+            self._updated = now
+            return wait
+
+    def block(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+_local_bucket = LocalBucket()
+_scripts = {}
+_max_wait = ContextVar('rate_limit_max_wait', default=None)
+
+
+def _script(connection, source):
+    """Registered script for this connection (redis-py caches it by SHA)"""
+    key = (id(connection), source)
+    script = _scripts.get(key)
+    if script is None:
+        script = _scripts[key] = connection.register_script(source)
+    return script
+
+
+@contextmanager
+def patient(max_wait):
+    """Let calls in this context wait up to ``max_wait`` seconds for a token (for background jobs)"""
+    reset = _max_wait.set(max_wait)
+    try:
+        yield
+    finally:
+        _max_wait.reset(reset)
+
+
+def _reserve():
+    """Take a token from the shared bucket and return how long to wait for it"""
+    rate = settings.SPOTIFY_RATE_LIMIT
+    burst = settings.SPOTIFY_RATE_LIMIT_BURST
+    max_wait = _max_wait.get()
+    if max_wait is None:
+        max_wait = settings.SPOTIFY_RATE_LIMIT_MAX_WAIT
+    connection = redis_connection()
+    if connection is None:
+        return _local_bucket.reserve(rate, burst, max_wait)
+    try:
+        return float(_script(connection, ACQUIRE_SCRIPT)(keys=[BUCKET_KEY], args=[rate, burst, max_wait]))
+    except Exception:
+        # Redis trouble must not take the API down; limit this process at least
+        return _local_bucket.reserve(rate, burst, max_wait)
+
+
+def _record_wait(wait):
+    if wait < 0:
+        metrics.incr('ratelimit_rejected')
+        raise RateLimitExceeded(f'Spotify rate limit reached, retry in {-wait:.1f}s')
+    if wait > 0:
+        metrics.incr('ratelimit_throttled')
+        metrics.incr('ratelimit_wait_seconds', wait)
+
+
+def acquire():
+    """Block until this process may make one upstream call"""
+    if not settings.SPOTIFY_RATE_LIMIT:
+        return
+    wait = _reserve()
+    _record_wait(wait)
+    if wait > 0:
+        time.sleep(wait)
+
+
+async def aacquire():
+    """Async counterpart of acquire()"""
+    if not settings.SPOTIFY_RATE_LIMIT:
+        return
+    wait = await sync_to_async(_reserve, thread_sensitive=False)()
+    _record_wait(wait)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+def block(seconds):
+    """Stop every worker from calling Spotify for ``seconds`` (after a 429)"""
+    _local_bucket.block(seconds)
+    connection = redis_connection()
+    if connection is None:
+        return
+    try:
+        _script(connection, BLOCK_SCRIPT)(keys=[BUCKET_KEY], args=[seconds])
+    except Exception:
+        pass
+
+
+async def ablock(seconds):
+    await sync_to_async(block, thread_sensitive=False)(seconds)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (Spotify sends delta-seconds), or None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def should_retry(method, status, attempt):
+    """Only idempotent GETs are retried, and only on 429 and 5xx"""
+    return method == 'GET' and status in RETRY_STATUSES and attempt < settings.SPOTIFY_MAX_RETRIES
+
+
+def backoff(attempt, retry_after=None):
+    """Delay before retry number ``attempt`` (0-based): Retry-After if given, else full-jitter exponential"""
+    if retry_after is not None:
+        return retry_after
+    cap = min(settings.SPOTIFY_RETRY_MAX_DELAY, settings.SPOTIFY_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def record_retry(delay=0.0):
+    """Count a retry; ``delay`` is backoff slept outside the bucket (429 waits are counted by acquire)"""
+    metrics.incr('upstream_retries')
+    if delay:
+        metrics.incr('retry_backoff_seconds', delay)
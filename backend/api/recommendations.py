@@ -0,0 +1,313 @@
+"""
+Batch computation of UserRecommendation rows from local data only.
+
+Candidates are every track in anyone's favorites or saved tracks (the
+catalog). For each user, every catalog track is scored at once with NumPy:
+
+* audio: closeness of its features to the mean features of the user's
+  favorites (api.similarity scaling);
+* artist: the user's affinity for its artist, from favorite artists (x3),
+  favorite and saved tracks (x1) and recent plays (x0.5), relative to their
+  top artist;
+* popularity, as a small prior.
+
+Tracks the user already has are skipped. The best RECOMMENDATIONS_PER_TYPE
+tracks are stored, along with artists the user does not know yet that have
+the best-scoring tracks. Rows are upserted, so items that stay recommended
+keep their created_at; items that dropped out are deleted.
+
+A run covers only users whose inputs changed since their last computation
+(by a digest of row counts and latest timestamps per input table), unless
+it is a full run. Users are split into shards computed in parallel: in a
+process pool by `manage.py compute_recommendations`, as Celery tasks by
+api.tasks.compute_recommendations.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import metrics
+from .models import (
+    ListeningHistory, RecommendationState, SavedTrack, UserArtist, UserRecommendation, UserTrack,
+)
+from .similarity import FEATURES, vectorize
+
+
+LAST_RUN_KEY = 'recommendations:last_run'
+
+# Weights of the score components, which are each in [0, 1]
+AUDIO_WEIGHT = 0.5
+ARTIST_WEIGHT = 0.35
+POPULARITY_WEIGHT = 0.15
+
+# Artist affinity per favorite artist, favorite or saved track, and play
+FAVORITE_ARTIST_AFFINITY = 3.0
+TRACK_AFFINITY = 1.0
+PLAY_AFFINITY = 0.5
+
+# Inputs whose row count and latest timestamp make up a user's digest
+DIGEST_INPUTS = (
+    (UserTrack, 'created_at'),
+    (UserArtist, 'created_at'),
+    (SavedTrack, 'added_at'),
+    (ListeningHistory, 'played_at'),
+)
+
+_catalog = None
+
+
+class Catalog:
+    """Every locally known track, as parallel arrays indexed by catalog position"""
+
+    def __init__(self):
+        self.built_at = time.monotonic()
+        tracks = {}
+        for model, fields in ((SavedTrack, ()), (UserTrack, ('audio_features',))):
+            rows = model.objects.order_by().values_list(
+                'track_id', 'name', 'artist_id', 'artist_name', 'popularity', *fields
+            )
+            for track_id, name, artist_id, artist_name, popularity, *features in rows.iterator(chunk_size=5000):
+                features = features[0] if features else {}
+                known = tracks.get(track_id)
+                # Features are only stored with favorites
+                if known is None or (features and not known[5]):
+                    tracks[track_id] = (track_id, name, artist_id, artist_name, popularity, features)
+
+        self.track_ids = [track[0] for track in tracks.values()]
+        self.names = [track[1] for track in tracks.values()]
+        self.positions = {track_id: position for position, track_id in enumerate(self.track_ids)}
+
+        # Artists are keyed by ID; tracks without one fall back to their primary artist's name
+        self.artist_keys = []
+        self.artist_names = []
+        artist_positions = {}
+        track_artists = []
+        for _, _, artist_id, artist_name, _, _ in tracks.values():
+            key = artist_id or f"name:{artist_name.split(', ')[0].casefold()}"
+            position = artist_positions.get(key)
+            if position is None:
+                position = artist_positions[key] = len(self.artist_keys)
+                self.artist_keys.append(key)
+                self.artist_names.append(artist_name.split(', ')[0])
+            track_artists.append(position)
+        self.artist_positions = artist_positions
+        self.track_artists = np.array(track_artists, dtype=np.int64)
+        # Tracks grouped by artist, for per-artist reductions with reduceat
+        self.by_artist = np.argsort(self.track_artists, kind='stable')
+        self.artist_starts = np.searchsorted(self.track_artists[self.by_artist], np.arange(len(self.artist_keys)))
+        # Only artists with an ID can be recommended
+        self.artist_has_id = np.array([not key.startswith('name:') for key in self.artist_keys], dtype=bool)
+
+        self.popularity = np.array([track[4] for track in tracks.values()], dtype=np.float32) / 100
+        self.features = vectorize([track[5] for track in tracks.values()])
+        self.has_features = ~np.isnan(self.features).any(axis=1)
+        self.features[~self.has_features] = 0
+
+    def __len__(self):
+        return len(self.track_ids)
+
+
+def get_catalog():
+    """This process's catalog, rebuilt when older than RECOMMENDATION_CATALOG_TTL"""
+    global _catalog
+    if _catalog is None or time.monotonic() - _catalog.built_at > settings.RECOMMENDATION_CATALOG_TTL:
+        _catalog = Catalog()
+    return _catalog
+
+
+def input_digests(user_ids=None):
+    """Digest of each user's recommendation inputs, for users that have any"""
+    parts = {}
+    for model, timestamp in DIGEST_INPUTS:
+        rows = model.objects.order_by()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows = rows.values('user_id').annotate(rows=Count('pk'), latest=Max(timestamp))
+        for row in rows.values_list('user_id', 'rows', 'latest'):
+            parts.setdefault(row[0], {})[model.__name__] = (row[1], row[2].isoformat() if row[2] else None)
+    return {
+        user_id: hashlib.sha1(repr(sorted(inputs.items())).encode()).hexdigest()
+        for user_id, inputs in parts.items()
+    }
+
+
+def due_user_ids(full=False):
+    """IDs of users to compute: those whose inputs changed (or everyone with inputs, when full)"""
+    digests = input_digests()
+    states = dict(RecommendationState.objects.values_list('user_id', 'inputs_digest'))
+    if full:
+        # Users whose inputs all went away get their recommendations cleared
+        return sorted(set(digests) | set(states))
+    return sorted(
+        user_id for user_id in set(digests) | set(states)
+        if digests.get(user_id, '') != states.get(user_id)
+    )
+
+
+def shards(user_ids, size=None):
+    """Split user IDs into shards of RECOMMENDATION_SHARD_SIZE"""
+    size = size or settings.RECOMMENDATION_SHARD_SIZE
+    user_ids = list(user_ids)
+    return [user_ids[start:start + size] for start in range(0, len(user_ids), size)]
+
+
+def _inputs(user_ids):
+    """Each user's favorite and saved tracks, favorite artists and recent plays, in one query per table"""
+    inputs = {user_id: {'tracks': [], 'features': [], 'artists': [], 'plays': []} for user_id in user_ids}
+    favorites = UserTrack.objects.filter(user_id__in=user_ids).order_by()
+    for user_id, track_id, features in favorites.values_list('user_id', 'track_id', 'audio_features'):
+        inputs[user_id]['tracks'].append(track_id)
+        inputs[user_id]['features'].append(features)
+    saved = SavedTrack.objects.filter(user_id__in=user_ids).order_by()
+    for user_id, track_id in saved.values_list('user_id', 'track_id'):
+        inputs[user_id]['tracks'].append(track_id)
+    artists = UserArtist.objects.filter(user_id__in=user_ids).order_by()
+    for user_id, artist_id in artists.values_list('user_id', 'artist_id'):
+        inputs[user_id]['artists'].append(artist_id)
+    since = timezone.now() - timedelta(days=settings.RECOMMENDATION_PLAYS_DAYS)
+    for user_id, track_id in (
+        ListeningHistory.objects.filter(user_id__in=user_ids, played_at__gte=since).order_by()
+        .values_list('user_id', 'track_id')
+    ):
+        inputs[user_id]['plays'].append(track_id)
+    return inputs
+
+
+def _positions(positions, keys):
+    return np.array([positions[key] for key in keys if key in positions], dtype=np.int64)
+
+
+def score_user(catalog, inputs, limit=None):
+    """
+    Best (item_type, item_id, item_name, score, reason) tuples for one user,
+    scoring every catalog track with a handful of array operations.
+    """
+    limit = limit or settings.RECOMMENDATIONS_PER_TYPE
+    size = len(catalog)
+    if not size:
+        return []
+
+    owned = _positions(catalog.positions, inputs['tracks'])
+    played = _positions(catalog.positions, inputs['plays'])
+    favorite_artists = _positions(catalog.artist_positions, inputs['artists'])
+
+    # Artist affinity, relative to the user's top artist
+    artists = len(catalog.artist_keys)
+    affinity = (
+        FAVORITE_ARTIST_AFFINITY * np.bincount(favorite_artists, minlength=artists)
+        + TRACK_AFFINITY * np.bincount(catalog.track_artists[owned], minlength=artists)
+        + PLAY_AFFINITY * np.bincount(catalog.track_artists[played], minlength=artists)
+    ).astype(np.float32)
+    if affinity.max() > 0:
+        affinity /= affinity.max()
+    artist_scores = affinity[catalog.track_artists]
+
+    # Audio closeness to the mean of the user's favorites
+    taste = vectorize(inputs['features'])
+    taste = taste[~np.isnan(taste).any(axis=1)]
+    if len(taste):
+        distances = np.sqrt(((catalog.features - taste.mean(axis=0)) ** 2).sum(axis=1))
+        audio_scores = np.where(catalog.has_features, 1 - distances / np.sqrt(len(FEATURES)), 0)
+    else:
+        audio_scores = np.zeros(size, dtype=np.float32)
+
+    scores = AUDIO_WEIGHT * audio_scores + ARTIST_WEIGHT * artist_scores + POPULARITY_WEIGHT * catalog.popularity
+    scores[owned] = -np.inf
+
+    results = []
+    count = min(limit, size)
+    best = np.argpartition(-scores, count - 1)[:count] if count < size else np.arange(size)
+    best = best[np.argsort(-scores[best])]
+    for position in best:
+        if not np.isfinite(scores[position]):
+            break
+        artist = catalog.track_artists[position]
+        if ARTIST_WEIGHT * artist_scores[position] >= AUDIO_WEIGHT * audio_scores[position]:
+            reason = f'By {catalog.artist_names[artist]}, one of your top artists'
+        else:
+            reason = 'Sounds like the tracks in your favorites'
+        results.append(('track', catalog.track_ids[position], catalog.names[position][:200],
+                        round(float(scores[position]), 4), reason))
+
+    # Artists the user has no affinity for yet, ranked by their best track
+    best_by_artist = np.maximum.reduceat(scores[catalog.by_artist], catalog.artist_starts)
+    best_by_artist[affinity > 0] = -np.inf
+    candidates = np.flatnonzero(np.isfinite(best_by_artist) & catalog.artist_has_id)
+    if len(candidates):
+        count = min(limit, len(candidates))
+        top = candidates[np.argpartition(-best_by_artist[candidates], count - 1)[:count]]
+        for artist in top[np.argsort(-best_by_artist[top])]:
+            results.append(('artist', catalog.artist_keys[artist], catalog.artist_names[artist][:200],
+                            round(float(best_by_artist[artist]), 4), 'Their tracks match your taste'))
+    return results
+
+
+def compute_users(user_ids):
+    """Compute and store recommendations for one shard of users; returns a throughput report"""
+    started = time.monotonic()
+    catalog = get_catalog()
+    # Taken before the inputs are read, so changes made meanwhile are picked up by the next run
+    digests = input_digests(user_ids)
+    inputs = _inputs(user_ids)
+    now = timezone.now()
+
+    recommendations = []
+    for user_id in user_ids:
+        scored = score_user(catalog, inputs[user_id]) if user_id in digests else []
+        recommendations.extend(
+            UserRecommendation(user_id=user_id, item_type=item_type, item_id=item_id, item_name=name,
+                               score=score, reason=reason)
+            for item_type, item_id, name, score, reason in scored
+        )
+
+    with transaction.atomic():
+        UserRecommendation.objects.bulk_create(
+            recommendations, batch_size=500, update_conflicts=True,
+            unique_fields=['user', 'item_type', 'item_id'], update_fields=['item_name', 'score', 'reason'],
+        )
+        current = {(rec.user_id, rec.item_type, rec.item_id) for rec in recommendations}
+        existing = UserRecommendation.objects.filter(user_id__in=user_ids).values_list(
+            'pk', 'user_id', 'item_type', 'item_id'
+        )
+        stale = [pk for pk, *item in existing if tuple(item) not in current]
+        for start in range(0, len(stale), 500):
+            UserRecommendation.objects.filter(pk__in=stale[start:start + 500]).delete()
+        RecommendationState.objects.bulk_create(
+            [RecommendationState(user_id=user_id, inputs_digest=digests.get(user_id, ''), computed_at=now)
+             for user_id in user_ids],
+            batch_size=500, update_conflicts=True, unique_fields=['user'],
+            update_fields=['inputs_digest', 'computed_at'],
+        )
+
+    elapsed = time.monotonic() - started
+    metrics.incr('recommendation_users_computed', len(user_ids))
+    return {
+        'users': len(user_ids),
+        'recommendations': len(recommendations),
+        'seconds': round(elapsed, 3),
+        'users_per_second': round(len(user_ids) / elapsed, 1) if elapsed else None,
+    }
+
+
+def record_run(reports, elapsed, full=False):
+    """Combine a run's shard reports, keep the result for /api/stats/ and return it"""
+    run = {'full': full, 'shards': len(reports), 'users': 0, 'recommendations': 0}
+    for report in reports:
+        run['users'] += report['users']
+        run['recommendations'] += report['recommendations']
+    run['seconds'] = round(elapsed, 3)
+    run['users_per_second'] = round(run['users'] / elapsed, 1) if elapsed else None
+    run['finished_at'] = timezone.now().isoformat()
+    cache.set(LAST_RUN_KEY, run, None)
+    return run
+
+
+def last_run():
+    return cache.get(LAST_RUN_KEY)
@@ -0,0 +1,50 @@
+"""
+Normalized keys for the shared search result cache.
+
+Search results do not depend on who asks, so they are cached once for all
+users. Queries that only differ in case, spacing or the order of their
+types map to the same request and the same key. The normalized query is
+also what gets sent to Spotify, so a cached page is exactly what any
+equivalent query would have fetched.
+"""
+import hashlib
+
+
+# Spotify's boolean operators are case-sensitive, so they keep their case
+OPERATORS = frozenset({'AND', 'OR', 'NOT'})
+
+
+def normalize_query(query):
+    """Case-fold and collapse whitespace, keeping AND/OR/NOT operators"""
+    return ' '.join(word if word in OPERATORS else word.casefold() for word in query.split())
+
+
+def normalize_types(search_type):
+    """'Track, album,track' -> 'album,track'"""
+    return ','.join(sorted({part.strip().casefold() for part in search_type.split(',') if part.strip()}))
+
+
+def search_params(query, search_type='track', limit=20, offset=0, market=None):
+    """Upstream /search parameters in normalized form"""
+    params = {
+        'q': normalize_query(query),
+        'type': normalize_types(search_type),
+        'limit': int(limit),
+        'offset': int(offset),
+    }
+    if market:
+        params['market'] = market.strip().upper()
+    return params
+
+
+def cache_key(params):
+    # Hashed: raw queries can contain characters some cache backends reject
+    digest = hashlib.sha1(params['q'].encode()).hexdigest()
+    return f"search:{params['type']}:{params['limit']}:{params['offset']}:{params.get('market', '-')}:{digest}"
+
+
+def next_page(params, result):
+    """Parameters of the following page, or None when no result type has one"""
+    if any(isinstance(paging, dict) and paging.get('next') for paging in result.values()):
+        return {**params, 'offset': params['offset'] + params['limit']}
+    return None
@@ -2,7 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
     UserProfile, SpotifyToken, UserPlaylist, UserTrack, 
-    UserArtist, UserAlbum, SearchHistory, UserRecommendation, ListeningHistory
+    UserArtist, UserAlbum, SearchHistory, UserRecommendation, ListeningHistory,
+    SavedTrack
 )
 
 
@@ -77,6 +78,17 @@ class UserTrackSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class SavedTrackSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedTrack
+        fields = [
+            'track_id', 'name', 'artist_name', 'artist_id', 'album_name',
+            'album_id', 'image_url', 'duration_ms', 'popularity', 'explicit',
+            'added_at'
+        ]
+        read_only_fields = fields
+
+
 class UserArtistSerializer(serializers.ModelSerializer):
     followers_formatted = serializers.SerializerMethodField()
     
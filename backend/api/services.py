@@ -1,25 +1,40 @@
-import requests
-from django.core.cache import cache
+import time
+
 from django.conf import settings
-from .models import SpotifyToken
+from authentication.services import SpotifyService
+from . import caching, metrics, rate_limit, search_cache, suggest, tokens
+from .concurrency import map_concurrently, submit
+from .http import get_session
+from .loaders import BatchLoader
 
 
 class SpotifyAPIService:
     """Service class for Spotify Web API interactions"""
     
     BASE_URL = 'https://api.spotify.com/v1'
+    loader_class = BatchLoader
     
     def __init__(self, user):
         self.user = user
         self.access_token = self._get_access_token()
+        self._loaders = {}
     
     def _get_access_token(self):
-        """Get user's access token"""
-        try:
-            spotify_token = SpotifyToken.objects.get(user=self.user)
-            return spotify_token.access_token
-        except SpotifyToken.DoesNotExist:
-            raise ValueError("User has no Spotify token")
+        """Get user's access token (cached per user), refreshing it first if it is about to expire"""
+        spotify_token = tokens.get_token(self.user)
+        if spotify_token.expires_within(settings.TOKEN_INLINE_REFRESH_MARGIN):
+            # The background job normally gets there first; this covers missed runs
+            metrics.incr('token_refresh_inline')
+            spotify_token = SpotifyService.refresh_user_token(
+                self.user, margin=settings.TOKEN_INLINE_REFRESH_MARGIN
+            )
+        return spotify_token.access_token
+    
+    def _refresh_rejected_token(self):
+        """Replace an access token Spotify answered 401 to"""
+        metrics.incr('token_refresh_on_401')
+        spotify_token = SpotifyService.refresh_user_token(self.user, rejected_access_token=self.access_token)
+        self.access_token = spotify_token.access_token
     
     def _get_headers(self):
         """Get authorization headers"""
@@ -28,20 +43,56 @@ class SpotifyAPIService:
             'Content-Type': 'application/json'
         }
     
-    def _make_request(self, method, endpoint, params=None, data=None, cache_key=None, cache_timeout=300):
-        """Make authenticated request to Spotify API with caching"""
+    def _make_request(self, method, endpoint, params=None, data=None, cache_key=None, cache_timeout=300, metric=None):
+        """Make authenticated request to Spotify API with caching (``metric`` counts {metric}_hit/_miss)"""
         if cache_key:
-            cached_result = cache.get(cache_key)
-            if cached_result:
+            cached_result, state = caching.lookup(cache_key)
+            if metric:
+                metrics.incr(f'{metric}_miss' if state == caching.MISS else f'{metric}_hit')
+            if state == caching.FRESH:
                 return cached_result
+            if state == caching.STALE:
+                # Serve the stale copy now and let a pool thread revalidate it
+                caching.refresh_in_background(
+                    cache_key,
+                    lambda: self._fetch(method, endpoint, params, data, cache_key, cache_timeout, revalidate=True)
+                )
+                return cached_result
+            
+            # On a miss only one worker calls Spotify; the rest wait for its result
+            return caching.single_flight(
+                cache_key,
+                lambda: self._fetch(method, endpoint, params, data, cache_key, cache_timeout)
+            )
+        
+        return self._fetch(method, endpoint, params, data, cache_key, cache_timeout)
+    
+    def _fetch(self, method, endpoint, params=None, data=None, cache_key=None, cache_timeout=300, revalidate=False):
+        """
+        Call Spotify and cache a successful response under cache_key.
         
+        With ``revalidate``, the cached entry's ETag is sent as If-None-Match
+        and a 304 renews the cached copy instead of downloading it again.
+        """
         url = f"{self.BASE_URL}{endpoint}"
         headers = self._get_headers()
         
-        response = requests.request(method, url, headers=headers, params=params, json=data)
+        cached_entry = caching.peek(cache_key) if revalidate and cache_key else None
+        if cached_entry is not None and cached_entry.etag:
+            headers['If-None-Match'] = cached_entry.etag
+        
+        started = time.monotonic()
+        response = self._send(method, url, headers, params, data)
+        
+        if response.status_code == 304 and cached_entry is not None:
+            metrics.incr('etag_not_modified')
+            metrics.incr('etag_bytes_saved', cached_entry.size)
+            caching.store(cache_key, cached_entry.value, cache_timeout, delta=time.monotonic() - started,
+                          etag=cached_entry.etag, size=cached_entry.size)
+            return cached_entry.value
         
         if response.status_code == 401:
-            # Token expired - for now just raise error, refresh will be handled later
+            metrics.incr('token_expired_errors')
             raise ValueError("Access token expired. Please re-authenticate.")
         
         if response.status_code >= 400:
@@ -50,10 +101,173 @@ class SpotifyAPIService:
         result = response.json()
         
         if cache_key and response.status_code == 200:
-            cache.set(cache_key, result, cache_timeout)
+            if 'If-None-Match' in headers:
+                metrics.incr('etag_modified')
+            caching.store(cache_key, result, cache_timeout, delta=time.monotonic() - started,
+                          etag=response.headers.get('ETag'), size=len(response.content))
         
         return result
     
+    def _send(self, method, url, headers, params=None, data=None):
+        """
+        Send a request under the app-wide rate limit, retrying GETs on 429 and
+        5xx, and any request once with a refreshed token after a 401.
+        """
+        attempt = 0
+        token_refreshed = False
+        while True:
+            rate_limit.acquire()
+            response = get_session().request(
+                method, url, headers=headers, params=params, json=data,
+                timeout=settings.SPOTIFY_HTTP_TIMEOUT
+            )
+            status = response.status_code
+            if status == 401 and self.user is not None and not token_refreshed:
+                self._refresh_rejected_token()
+                headers.update(self._get_headers())
+                token_refreshed = True
+                continue
+            if status not in rate_limit.RETRY_STATUSES:
+                return response
+            
+            metrics.incr(f'upstream_{status}')
+            retry_after = rate_limit.parse_retry_after(response.headers.get('Retry-After'))
+            delay = rate_limit.backoff(attempt, retry_after)
+            if status == 429:
+                # Close the shared bucket so every worker waits, not just this one
+                rate_limit.block(delay)
+            if not rate_limit.should_retry(method, status, attempt):
+                return response
+            
+            if status == 429:
+                # The next acquire() sleeps until the bucket reopens
+                rate_limit.record_retry()
+            else:
+                rate_limit.record_retry(delay)
+                time.sleep(delay)
+            attempt += 1
+    
+    def _get_many(self, endpoint, response_key, ids, cache_prefix, batch_size, cache_timeout=300):
+        """
+        Look up several IDs through a multi-ID endpoint.
+        
+        Cached entries (stored under the same ``{cache_prefix}_{id}`` keys as
+        the single-ID getters) are read with one multi-get; only the misses are
+        fetched, ``batch_size`` IDs per upstream call, with the calls running
+        concurrently. Stale entries are served and refreshed in the background.
+        Results are returned in input order, with None for IDs Spotify does
+        not know.
+        """
+        keys = {item_id: f'{cache_prefix}_{item_id}' for item_id in ids}
+        cached = caching.lookup_many(list(keys.values()))
+        found = {}
+        stale = []
+        for item_id, key in keys.items():
+            if key in cached:
+                found[item_id], state = cached[key]
+                if state == caching.STALE:
+                    stale.append(item_id)
+        
+        if stale:
+            caching.refresh_in_background(
+                caching.batch_key(cache_prefix, stale),
+                lambda: self._fetch_many(endpoint, response_key, stale, cache_prefix, batch_size, cache_timeout)
+            )
+        
+        missing = [item_id for item_id in dict.fromkeys(ids) if item_id not in found]
+        found.update(self._fetch_many(endpoint, response_key, missing, cache_prefix, batch_size, cache_timeout))
+        return [found.get(item_id) for item_id in ids]
+    
+    def _fetch_many(self, endpoint, response_key, ids, cache_prefix, batch_size, cache_timeout=300):
+        """Fetch IDs in concurrent chunks and cache each item under its single-ID key"""
+        chunks = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+        started = time.monotonic()
+        results = map_concurrently(
+            lambda chunk: self._make_request('GET', endpoint, params={'ids': ','.join(chunk)}),
+            chunks
+        )
+        
+        fetched = {}
+        for chunk, result in zip(chunks, results):
+            for item_id, item in zip(chunk, result.get(response_key) or []):
+                if item:
+                    fetched[item_id] = item
+        
+        if fetched:
+            caching.store_many(
+                {f'{cache_prefix}_{item_id}': item for item_id, item in fetched.items()},
+                cache_timeout, delta=time.monotonic() - started
+            )
+        return fetched
+    
+    def _fetch_page(self, endpoint, page_size, offset, params=None):
+        """Get one page of a paged collection"""
+        return self._make_request('GET', endpoint, params={**(params or {}), 'limit': page_size, 'offset': offset})
+    
+    def get_collection(self, endpoint, page_size=50, params=None):
+        """
+        Get every item of a paged collection as one list.
+        
+        The first page reveals ``total``; all remaining pages are then requested
+        at their known offsets in parallel (at most SPOTIFY_PAGE_CONCURRENCY in
+        flight, each still subject to the shared rate limit) and reassembled in
+        order.
+        """
+        first = self._fetch_page(endpoint, page_size, 0, params)
+        offsets = range(page_size, first.get('total') or 0, page_size)
+        pages = map_concurrently(
+            lambda offset: self._fetch_page(endpoint, page_size, offset, params),
+            offsets, executor='pages', limit=settings.SPOTIFY_PAGE_CONCURRENCY
+        )
+        
+        items = list(first.get('items') or [])
+        for page in pages:
+            items.extend(page.get('items') or [])
+        return items
+    
+    def iter_collection(self, endpoint, page_size=50, params=None):
+        """
+        Yield every item of a paged collection (``items``/``next`` paging object).
+        
+        The next page is requested in the background as soon as the current
+        one arrives, so upstream latency overlaps with consuming the items,
+        and at most two pages are held in memory at any time.
+        """
+        page = self._fetch_page(endpoint, page_size, 0, params)
+        offset = 0
+        while True:
+            upcoming = None
+            if page.get('next'):
+                offset += page_size
+                upcoming = submit('prefetch', self._fetch_page, endpoint, page_size, offset, params)
+            try:
+                yield from page.get('items') or []
+            except BaseException:
+                # The consumer went away (e.g. the client disconnected)
+                if upcoming is not None:
+                    upcoming.cancel()
+                raise
+            if upcoming is None:
+                return
+            page = upcoming.result()
+    
+    def loader(self, kind):
+        """Get this service's batching loader for 'track', 'artist' or 'album' lookups"""
+        if kind not in self._loaders:
+            self._loaders[kind] = self.loader_class(self, kind)
+        return self._loaders[kind]
+    
+    def _load(self, kind, item_id):
+        """Look up one item through the loader, batched with any lookups queued before it"""
+        return self._found(kind, item_id, self.loader(kind).get(item_id))
+    
+    @staticmethod
+    def _found(kind, item_id, item):
+        # Multi-ID endpoints answer unknown IDs with null instead of a 404
+        if item is None:
+            raise LookupError(f'Spotify has no {kind} with ID {item_id}')
+        return item
+    
     # User Profile Methods
     def get_user_profile(self):
         """Get current user's profile"""
@@ -64,6 +278,10 @@ class SpotifyAPIService:
         params = {'limit': limit, 'offset': offset}
         return self._make_request('GET', '/me/playlists', params=params)
     
+    def iter_user_playlists(self):
+        """Iterate over all of the user's playlists"""
+        return self.iter_collection('/me/playlists', page_size=50)
+    
     def get_user_top_tracks(self, time_range='medium_term', limit=20):
         """Get user's top tracks"""
         params = {'time_range': time_range, 'limit': limit}
@@ -76,9 +294,11 @@ class SpotifyAPIService:
         cache_key = f'user_top_artists_{self.user.id}_{time_range}_{limit}'
         return self._make_request('GET', '/me/top/artists', params=params, cache_key=cache_key)
     
-    def get_recently_played(self, limit=20):
-        """Get recently played tracks"""
+    def get_recently_played(self, limit=20, after=None):
+        """Get recently played tracks, optionally only those played after a Unix ms cursor"""
         params = {'limit': limit}
+        if after is not None:
+            params['after'] = after
         return self._make_request('GET', '/me/player/recently-played', params=params)
     
     # Browse Methods
@@ -104,21 +324,43 @@ class SpotifyAPIService:
                                 cache_key=cache_key, cache_timeout=3600)
     
     # Search Methods
-    def search(self, query, search_type='track', limit=20, offset=0):
-        """Search for tracks, artists, albums, or playlists"""
-        params = {
-            'q': query,
-            'type': search_type,
-            'limit': limit,
-            'offset': offset
-        }
-        return self._make_request('GET', '/search', params=params)
+    def search(self, query, search_type='track', limit=20, offset=0, market=None):
+        """Search for tracks, artists, albums, or playlists (cached for all users under a normalized key)"""
+        params = search_cache.search_params(query, search_type, limit, offset, market)
+        results = self._make_request('GET', '/search', params=params, cache_key=search_cache.cache_key(params),
+                                     cache_timeout=settings.SEARCH_CACHE_TIMEOUT, metric='search_cache')
+        # Names seen in results become typeahead suggestions
+        suggest.observe_results(results)
+        next_params = search_cache.next_page(params, results)
+        if next_params and settings.SEARCH_PREFETCH:
+            submit('prefetch', self._prefetch_search, next_params)
+        return results
+    
+    def _prefetch_search(self, params):
+        """Cache a search page before it is asked for, only if it is missing and quota is spare"""
+        cache_key = search_cache.cache_key(params)
+        if caching.peek(cache_key) is not None:
+            return
+        try:
+            with rate_limit.patient(0):
+                caching.single_flight(
+                    cache_key,
+                    lambda: self._fetch('GET', '/search', params, None, cache_key, settings.SEARCH_CACHE_TIMEOUT)
+                )
+            metrics.incr('search_prefetched')
+        except rate_limit.RateLimitExceeded:
+            metrics.incr('search_prefetch_skipped')
+        except Exception:
+            metrics.incr('search_prefetch_failed')
     
     # Track Methods
     def get_track(self, track_id):
-        """Get track details"""
-        cache_key = f'track_{track_id}'
-        return self._make_request('GET', f'/tracks/{track_id}', cache_key=cache_key)
+        """Get track details (through the batching loader)"""
+        return self._load('track', track_id)
+    
+    def get_tracks(self, track_ids):
+        """Get details for multiple tracks, 50 per upstream call"""
+        return self._get_many('/tracks', 'tracks', track_ids, 'track', 50)
     
     def get_track_audio_features(self, track_id):
         """Get audio features for a track"""
@@ -126,15 +368,18 @@ class SpotifyAPIService:
         return self._make_request('GET', f'/audio-features/{track_id}', cache_key=cache_key)
     
     def get_tracks_audio_features(self, track_ids):
-        """Get audio features for multiple tracks"""
-        params = {'ids': ','.join(track_ids)}
-        return self._make_request('GET', '/audio-features', params=params)
+        """Get audio features for multiple tracks, 100 per upstream call, reusing per-track cache entries"""
+        features = self._get_many('/audio-features', 'audio_features', track_ids, 'audio_features', 100)
+        return {'audio_features': features}
     
     # Artist Methods
     def get_artist(self, artist_id):
-        """Get artist details"""
-        cache_key = f'artist_{artist_id}'
-        return self._make_request('GET', f'/artists/{artist_id}', cache_key=cache_key)
+        """Get artist details (through the batching loader)"""
+        return self._load('artist', artist_id)
+    
+    def get_artists(self, artist_ids):
+        """Get details for multiple artists, 50 per upstream call"""
+        return self._get_many('/artists', 'artists', artist_ids, 'artist', 50)
     
     def get_artist_albums(self, artist_id, limit=20):
         """Get artist's albums"""
@@ -155,9 +400,12 @@ class SpotifyAPIService:
     
     # Album Methods
     def get_album(self, album_id):
-        """Get album details"""
-        cache_key = f'album_{album_id}'
-        return self._make_request('GET', f'/albums/{album_id}', cache_key=cache_key)
+        """Get album details (through the batching loader)"""
+        return self._load('album', album_id)
+    
+    def get_albums(self, album_ids):
+        """Get details for multiple albums, 20 per upstream call"""
+        return self._get_many('/albums', 'albums', album_ids, 'album', 20)
     
     def get_album_tracks(self, album_id, limit=20):
         """Get album tracks"""
@@ -165,6 +413,10 @@ class SpotifyAPIService:
         cache_key = f'album_tracks_{album_id}_{limit}'
         return self._make_request('GET', f'/albums/{album_id}/tracks', params=params, cache_key=cache_key)
     
+    def get_all_album_tracks(self, album_id):
+        """Get all tracks of an album, fetching pages in parallel"""
+        return self.get_collection(f'/albums/{album_id}/tracks', page_size=50)
+    
     # Playlist Methods
     def get_playlist(self, playlist_id):
         """Get playlist details"""
@@ -176,6 +428,14 @@ class SpotifyAPIService:
         params = {'limit': limit, 'offset': offset}
         return self._make_request('GET', f'/playlists/{playlist_id}/tracks', params=params)
     
+    def get_all_playlist_tracks(self, playlist_id):
+        """Get all tracks of a playlist, fetching pages in parallel"""
+        return self.get_collection(f'/playlists/{playlist_id}/tracks', page_size=100)
+    
+    def iter_playlist_tracks(self, playlist_id):
+        """Iterate over all tracks of a playlist"""
+        return self.iter_collection(f'/playlists/{playlist_id}/tracks', page_size=100)
+    
     def create_playlist(self, name, description='', public=True):
         """Create a new playlist"""
         data = {
@@ -198,6 +458,14 @@ class SpotifyAPIService:
         params = {'limit': limit, 'offset': offset}
         return self._make_request('GET', '/me/tracks', params=params)
     
+    def get_all_saved_tracks(self):
+        """Get the user's whole library of saved tracks, fetching pages in parallel"""
+        return self.get_collection('/me/tracks', page_size=50)
+    
+    def iter_saved_tracks(self):
+        """Iterate over the user's whole library of saved tracks"""
+        return self.iter_collection('/me/tracks', page_size=50)
+    
     def save_tracks(self, track_ids):
         """Save tracks to user's library"""
         params = {'ids': ','.join(track_ids)}
@@ -0,0 +1,37 @@
+"""
+Keep the library search index and cached feature matrices (api.similarity)
+in step with the favorites tables.
+
+Bulk writes skip these signals: code that bulk_creates favorites must index
+the rows itself, and `manage.py rebuild_library_search` re-indexes
+everything.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from . import similarity
+from .library_search import get_backend
+from .models import UserAlbum, UserArtist, UserTrack
+
+
+def index_library_item(sender, instance, **kwargs):
+    get_backend().index([instance])
+
+
+def remove_library_item(sender, instance, **kwargs):
+    get_backend().remove([instance])
+
+
+def update_feature_matrix(sender, instance, **kwargs):
+    similarity.tracks_saved([instance])
+
+
+def remove_from_feature_matrix(sender, instance, **kwargs):
+    similarity.tracks_deleted([instance])
+
+
+for model in (UserTrack, UserArtist, UserAlbum):
+    post_save.connect(index_library_item, sender=model, dispatch_uid=f'library_search_index_{model.__name__}')
+    post_delete.connect(remove_library_item, sender=model, dispatch_uid=f'library_search_remove_{model.__name__}')
+
+post_save.connect(update_feature_matrix, sender=UserTrack, dispatch_uid='similarity_update')
+post_delete.connect(remove_from_feature_matrix, sender=UserTrack, dispatch_uid='similarity_remove')
@@ -0,0 +1,313 @@
+"""
+"More like this" over a user's favorite tracks, from their audio features.
+
+Each user's tracks with audio features are loaded once into a contiguous
+float32 matrix, one column per track, with every feature scaled to [0, 1]
+by a fixed range (so columns never need re-scaling as the library
+changes). A kNN query is one vector-matrix product over all tracks plus a
+partial sort; ``nearest`` answers many queries with matrix products.
+
+Matrices are cached per process (the SIMILARITY_CACHE_USERS most recently
+used) and kept current in place: favorites saved or deleted in this process
+update the matrix directly (see api.signals), and a
+per-user version number in the shared cache tells other processes to
+catch up, which they do by loading only the rows they do not have yet or
+that were updated (UserTrack.updated_at) since their last load.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .library_search import with_pks
+from .models import UserTrack
+
+
+# Feature, low, high: values are scaled to [0, 1] over this range and clipped
+FEATURES = (
+    ('danceability', 0.0, 1.0),
+    ('energy', 0.0, 1.0),
+    ('valence', 0.0, 1.0),
+    ('acousticness', 0.0, 1.0),
+    ('instrumentalness', 0.0, 1.0),
+    ('speechiness', 0.0, 1.0),
+    ('liveness', 0.0, 1.0),
+    ('mode', 0.0, 1.0),
+    ('loudness', -60.0, 0.0),
+    ('tempo', 0.0, 250.0),
+)
+FEATURE_NAMES = [name for name, _, _ in FEATURES]
+_LOW = np.array([low for _, low, _ in FEATURES], dtype=np.float32)
+_SPAN = np.array([high - low for _, low, high in FEATURES], dtype=np.float32)
+# Largest possible distance between two scaled rows, for similarity = 1 - distance / _MAX_DISTANCE
+_MAX_DISTANCE = float(np.sqrt(len(FEATURES)))
+
+# Batched queries are answered this many distances (queries x tracks) at a time
+QUERY_CHUNK_CELLS = 4_000_000
+
+# Catching up re-reads rows updated this long before the previous load started,
+# for transactions that committed after it and for clock skew between hosts
+UPDATE_MARGIN = timedelta(seconds=60)
+
+_lock = threading.Lock()
+_matrices = OrderedDict()
+
+
+def vectorize(features_list):
+    """Scaled feature rows for audio-features dicts; rows are NaN where a dict lacks a feature"""
+    raw = np.array(
+        [[_number(features, name) for name in FEATURE_NAMES] for features in features_list],
+        dtype=np.float32,
+    ).reshape(-1, len(FEATURES))
+    return np.clip((raw - _LOW) / _SPAN, 0.0, 1.0)
+
+
+def _number(features, name):
+    value = features.get(name) if isinstance(features, dict) else None
+    return value if isinstance(value, (int, float)) else np.nan
+
+
+class FeatureMatrix:
+    """
+    One user's scaled feature vectors, stored feature-major (one contiguous
+    row per feature, one column per track) so a query is a single gemv over
+    contiguous memory. The array is preallocated and grows by doubling;
+    removing a track moves the last column into its place, so every change
+    is O(1) columns of work. Squared column norms are kept alongside.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.lock = threading.Lock()
+        self._data = np.empty((len(FEATURES), 64), dtype=np.float32)
+        self._norms = np.empty(64, dtype=np.float32)
+        self._size = 0
+        self.track_ids = []
+        self._columns = {}
+        # pk <-> track_id for every track, and pks of tracks without usable features
+        self.pks = {}
+        self._track_pks = {}
+        self.missing = set()
+        # When the last load from the database started
+        self.loaded_at = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrix(self):
+        """Features x tracks view of the live columns"""
+        return self._data[:, :self._size]
+
+    def upsert(self, rows):
+        """Add or replace (pk, track_id, audio_features) rows"""
+        rows = list(rows)
+        if not rows:
+            return
+        vectors = vectorize([features for _, _, features in rows])
+        complete = ~np.isnan(vectors).any(axis=1)
+        for (pk, track_id, _), vector, ok in zip(rows, vectors, complete):
+            self._remove_pk(pk)
+            # A track deleted and saved again gets a new pk
+            self._remove_pk(self._track_pks.get(track_id))
+            self.pks[pk] = track_id
+            self._track_pks[track_id] = pk
+            if not ok:
+                self.missing.add(pk)
+                continue
+            if self._size == self._data.shape[1]:
+                self._grow()
+            column = self._size
+            self._data[:, column] = vector
+            self._norms[column] = vector @ vector
+            self.track_ids.append(track_id)
+            self._columns[track_id] = column
+            self._size += 1
+
+    def remove(self, pks):
+        for pk in pks:
+            self._remove_pk(pk)
+
+    def _remove_pk(self, pk):
+        track_id = self.pks.pop(pk, None)
+        if track_id is None:
+            return
+        del self._track_pks[track_id]
+        self.missing.discard(pk)
+        column = self._columns.pop(track_id, None)
+        if column is None:
+            return
+        last = self._size - 1
+        if column != last:
+            moved = self.track_ids[last]
+            self._data[:, column] = self._data[:, last]
+            self._norms[column] = self._norms[last]
+            self.track_ids[column] = moved
+            self._columns[moved] = column
+        self.track_ids.pop()
+        self._size = last
+
+    def _grow(self):
+        self._data = np.concatenate([self._data, np.empty_like(self._data)], axis=1)
+        self._norms = np.concatenate([self._norms, np.empty_like(self._norms)])
+
+    def vector(self, track_id):
+        column = self._columns.get(track_id)
+        return None if column is None else self._data[:, column].copy()
+
+    def nearest(self, vectors, k=10, exclude=None):
+        """
+        The ``k`` closest tracks to each query vector, as lists of (track_id,
+        similarity). ``exclude`` holds a track id per query to leave out
+        (the query track itself).
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        exclude = exclude if exclude is not None else [None] * len(vectors)
+        results = []
+        # Bounds the queries x tracks distance array
+        step = max(1, QUERY_CHUNK_CELLS // max(self._size, 1))
+        for start in range(0, len(vectors), step):
+            results.extend(self._nearest(vectors[start:start + step], k, exclude[start:start + step]))
+        return results
+
+    def _nearest(self, vectors, k, exclude):
+        size = self._size
+        if not size:
+            return [[] for _ in vectors]
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab; |a|^2 does not change the ranking, so it
+        # is only added to the k that are kept
+        distances = vectors @ self.matrix
+        distances *= -2
+        distances += self._norms[:size]
+        for query, track_id in enumerate(exclude):
+            column = self._columns.get(track_id)
+            if column is not None:
+                distances[query, column] = np.inf
+        k = min(k, size)
+        if k < size:
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(size), (len(vectors), size))
+        kept = np.take_along_axis(distances, nearest, axis=1)
+        order = kept.argsort(axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        kept = np.take_along_axis(kept, order, axis=1) + (vectors * vectors).sum(axis=1)[:, None]
+        similarities = 1 - np.sqrt(np.maximum(kept, 0)) / _MAX_DISTANCE
+        return [
+            [(self.track_ids[column], round(float(similarity), 4))
+             for column, similarity in zip(columns, scores) if np.isfinite(similarity)]
+            for columns, scores in zip(nearest, similarities)
+        ]
+
+
+def _version_key(user_id):
+    return f'similarity:version:{user_id}'
+
+
+def _load(user_id, matrix):
+    """Bring a matrix up to date with the database, loading only rows it lacks or that changed"""
+    tracks = UserTrack.objects.filter(user_id=user_id)
+    started, since = timezone.now(), matrix.loaded_at
+    matrix.loaded_at = started
+    if not matrix.pks or since is None:
+        matrix.upsert(tracks.values_list('pk', 'track_id', 'audio_features').iterator(chunk_size=2000))
+        return
+    current = dict(tracks.values_list('pk', 'updated_at'))
+    matrix.remove(set(matrix.pks) - current.keys())
+    cutoff = since - UPDATE_MARGIN
+    wanted = (current.keys() - matrix.pks.keys()) | {pk for pk, updated_at in current.items() if updated_at >= cutoff}
+    pks = list(wanted)
+    for start in range(0, len(pks), 500):
+        matrix.upsert(tracks.filter(pk__in=pks[start:start + 500]).values_list('pk', 'track_id', 'audio_features'))
+
+
+def get_matrix(user_id):
+    """This user's feature matrix, loading or catching up as needed"""
+    version = cache.get(_version_key(user_id), 0)
+    with _lock:
+        matrix = _matrices.get(user_id)
+        if matrix is None:
+            matrix = _matrices[user_id] = FeatureMatrix()
+        _matrices.move_to_end(user_id)
+        while len(_matrices) > settings.SIMILARITY_CACHE_USERS:
+            _matrices.popitem(last=False)
+    with matrix.lock:
+        if matrix.version != version:
+            _load(user_id, matrix)
+            matrix.version = version
+    return matrix
+
+
+def similar_tracks(user, track_id, features=None, k=10):
+    """
+    Favorite tracks of ``user`` that sound most like ``track_id``, given
+    ``features`` (its audio features) when it is not one of their favorites.
+    Returns None when there is nothing to compare it with.
+    """
+    matrix = get_matrix(user.pk)
+    with matrix.lock:
+        vector = matrix.vector(track_id)
+        if vector is None and features is not None:
+            vector = vectorize([features])[0]
+            if np.isnan(vector).any():
+                vector = None
+        if vector is None:
+            return None
+        return matrix.nearest(vector, k, exclude=[track_id])[0]
+
+
+def _bump(user_id, matrix):
+    """Publish a change applied to ``matrix`` so other processes catch up"""
+    if not cache.add(_version_key(user_id), 1, None):
+        try:
+            version = cache.incr(_version_key(user_id))
+        except ValueError:
+            # Evicted between add and incr
+            cache.add(_version_key(user_id), 1, None)
+            version = None
+    else:
+        version = 1
+    if matrix is not None and version is not None:
+        with matrix.lock:
+            if matrix.version == version - 1:
+                # Nobody else changed this user's tracks meanwhile: this matrix is current
+                matrix.version = version
+
+
+def _apply(user_id, upserts=(), removed=()):
+    with _lock:
+        matrix = _matrices.get(user_id)
+    if matrix is not None:
+        with matrix.lock:
+            matrix.upsert(upserts)
+            matrix.remove(removed)
+    _bump(user_id, matrix)
+
+
+def tracks_saved(tracks):
+    """Apply saved UserTrack rows once their transaction commits"""
+    by_user = {}
+    for track in with_pks(tracks):
+        by_user.setdefault(track.user_id, []).append((track.pk, track.track_id, track.audio_features))
+    for user_id, rows in by_user.items():
+        transaction.on_commit(lambda user_id=user_id, rows=rows: _apply(user_id, upserts=rows))
+
+
+def tracks_deleted(tracks):
+    """Drop deleted UserTrack rows once their transaction commits"""
+    by_user = {}
+    for track in tracks:
+        by_user.setdefault(track.user_id, []).append(track.pk)
+    for user_id, pks in by_user.items():
+        transaction.on_commit(lambda user_id=user_id, pks=pks: _apply(user_id, removed=pks))
+
+
+def stats():
+    with _lock:
+        matrices = list(_matrices.values())
+    return {'users_cached': len(matrices), 'rows_cached': sum(len(matrix) for matrix in matrices)}
@@ -0,0 +1,307 @@
+"""
+In-memory typeahead suggestions for /api/search/suggest/.
+
+Each process keeps a SuggestionIndex of:
+
+* past searches (from SearchHistory), once SUGGEST_MIN_USERS different
+  users have searched for them, so nobody's private searches are suggested
+  to others; weighted by how often they were searched;
+* names of tracks, artists, albums and playlists that appear in search
+  results this process has served, weighted by Spotify popularity.
+
+Lookups never leave the process. The index is filled from SearchHistory
+by a background refresh that only reads rows past the last one seen, so it
+is rebuilt incrementally; search results are added as they are served.
+
+Memory is bounded: past SUGGEST_MAX_ENTRIES entries the lightest are
+dropped, and searches still short of SUGGEST_MIN_USERS users are forgotten
+once nobody has made them for SUGGEST_PENDING_WINDOW seconds (or when more
+than SUGGEST_MAX_PENDING are waiting).
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+from .concurrency import submit
+from .search_cache import normalize_query
+
+
+# Prefixes matching more keys than this keep a ready, ranked top list;
+# smaller ranges are ranked on each lookup
+RANGE_LIMIT = 256
+TOP_K = 20
+
+# Beyond this many new keys, appending and re-sorting beats inserting each one
+BULK_INSERT = 64
+
+# Sorts after any character a key can contain
+END = '\U0010ffff'
+
+ENTITY_TYPES = ('track', 'artist', 'album', 'playlist')
+
+
+class SuggestionIndex:
+    """
+    Sorted array of keys, each followed by a NUL and its entry key, searched
+    with bisect. Every entry is reachable from each of its word starts, so
+    "davis" finds "Miles Davis".
+    Weights only grow, so the top lists of busy prefixes are updated in place
+    as entries change and stay exact. Beyond ``max_entries`` the lightest
+    tenth is dropped (oldest first among equal weights) and the top lists
+    are ranked afresh.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._keys = []
+        # entry key -> (text, type, id); tuples and floats are left alone by the cyclic GC
+        self._entries = {}
+        self._weights = {}
+        # busy prefix -> entry keys, heaviest first
+        self._top = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, item):
+        kind, text = item
+        return f'{kind}:{normalize_query(text).casefold()}' in self._entries
+
+    def add(self, kind, text, weight, item_id=None, increment=False):
+        """Add an entry or raise its weight (by ``weight`` with ``increment``, else to at least ``weight``)"""
+        self.add_many([(kind, text, weight, item_id)], increment)
+
+    def add_many(self, items, increment=False):
+        """Add (kind, text, weight, item_id) tuples, sorting the key array once"""
+        new_keys = []
+        with self._lock:
+            for kind, text, weight, item_id in items:
+                normalized = normalize_query(text).casefold()
+                if not normalized:
+                    continue
+                entry_key = f'{kind}:{normalized}'
+                current = self._weights.get(entry_key)
+                if current is None:
+                    self._entries[entry_key] = (text, kind, item_id)
+                    new_keys.extend(f'{key}\0{entry_key}' for key in self._word_starts(normalized))
+                elif increment:
+                    weight += current
+                elif weight <= current:
+                    continue
+                self._weights[entry_key] = weight
+                for key in self._word_starts(normalized):
+                    for length in range(1, len(key) + 1):
+                        top = self._top.get(key[:length])
+                        if top is not None:
+                            self._promote(top, entry_key, weight)
+            if len(new_keys) > BULK_INSERT:
+                # Timsort merges the appended run in linear time
+                self._keys.extend(new_keys)
+                self._keys.sort()
+            else:
+                for key in new_keys:
+                    insort(self._keys, key)
+            max_entries = self.max_entries or settings.SUGGEST_MAX_ENTRIES
+            if len(self._entries) > max_entries:
+                self._trim(max_entries - max_entries // 10)
+
+    def _trim(self, size):
+        """Keep the ``size`` heaviest entries"""
+        dropped = set(heapq.nsmallest(len(self._entries) - size, self._weights, key=self._weights.get))
+        for entry_key in dropped:
+            del self._entries[entry_key]
+            del self._weights[entry_key]
+        self._keys = [key for key in self._keys if key.partition('\0')[2] not in dropped]
+        self._top.clear()
+        metrics.incr('suggest_entries_trimmed', len(dropped))
+
+    @staticmethod
+    def _word_starts(normalized):
+        words = normalized.split(' ')
+        return {' '.join(words[position:]) for position in range(len(words))}
+
+    def _promote(self, top, entry_key, weight):
+        if entry_key not in top:
+            if len(top) >= TOP_K and weight <= self._weights[top[-1]]:
+                return
+            top.append(entry_key)
+        top.sort(key=self._weights.get, reverse=True)
+        del top[TOP_K:]
+
+    def _bounds(self, prefix):
+        start = bisect_left(self._keys, prefix)
+        return start, bisect_left(self._keys, prefix + END, start)
+
+    def _ranked(self, start, end):
+        weights = {}
+        for key in self._keys[start:end]:
+            entry_key = key.partition('\0')[2]
+            weights[entry_key] = self._weights[entry_key]
+        return heapq.nlargest(TOP_K, weights, key=weights.get)
+
+    def _top_for(self, prefix):
+        top = self._top.get(prefix)
+        if top is None:
+            start, end = self._bounds(prefix)
+            top = self._ranked(start, end)
+            if end - start > RANGE_LIMIT:
+                self._top[prefix] = top
+        return top
+
+    def warm(self):
+        """
+        Rank every busy prefix ahead of its first lookup. Only prefixes of busy
+        prefixes can be busy, so the walk stays within those ranges.
+        """
+        with self._lock:
+            keys = list(self._keys)
+        stack = [('', 0, len(keys))]
+        while stack:
+            prefix, position, end = stack.pop()
+            while position < end:
+                key = keys[position].partition('\0')[0]
+                if len(key) <= len(prefix):
+                    position += 1
+                    continue
+                child = key[:len(prefix) + 1]
+                child_end = bisect_left(keys, child + END, position, end)
+                if child_end - position > RANGE_LIMIT:
+                    if child not in self._top:
+                        # One prefix per lock hold, so lookups are not held up
+                        with self._lock:
+                            self._top_for(child)
+                    stack.append((child, position, child_end))
+                position = child_end
+
+    def lookup(self, prefix, limit=10):
+        """Heaviest entries with a word starting with ``prefix``"""
+        prefix = normalize_query(prefix).casefold()
+        if not prefix:
+            return []
+        with self._lock:
+            entries = [self._entries[entry_key] for entry_key in self._top_for(prefix)[:limit]]
+        return [{'text': text, 'type': kind, 'id': item_id} for text, kind, item_id in entries]
+
+    def stats(self):
+        return {'entries': len(self._entries), 'keys': len(self._keys), 'ranked_prefixes': len(self._top)}
+
+
+_index = SuggestionIndex()
+_refresh_lock = threading.Lock()
+# Last SearchHistory row read
+_watermark = 0
+# Queries not suggested yet: query -> [users who searched it, searches, last searched],
+# least recently searched first
+_pending = OrderedDict()
+_last_refresh = None
+
+
+def get_index():
+    return _index
+
+
+def observe_results(results):
+    """Add the names in a /search response to the index"""
+    if not isinstance(results, dict):
+        return
+    # 1 for items without popularity (albums, playlists), up to 6 for the most popular
+    _index.add_many(
+        (kind, item['name'], 1 + (item.get('popularity') or 0) / 20, item.get('id'))
+        for kind in ENTITY_TYPES
+        for item in (results.get(f'{kind}s') or {}).get('items') or []
+        if item and item.get('name')
+    )
+
+
+def _searched(user_id, query, searched_at):
+    """Weight a past search adds to the index: 0 while too few users have made it"""
+    if ('query', query) in _index:
+        return 1
+    pending = _pending.pop(query, None) or [set(), 0, searched_at]
+    pending[0].add(user_id)
+    pending[1] += 1
+    pending[2] = searched_at
+    if len(pending[0]) < settings.SUGGEST_MIN_USERS:
+        _pending[query] = pending
+        return 0
+    return pending[1]
+
+
+def _expire_pending(now):
+    """Forget pending queries nobody searched within the window, and the oldest beyond the cap"""
+    cutoff = now - settings.SUGGEST_PENDING_WINDOW
+    expired = 0
+    while _pending:
+        query, (_, _, searched_at) = next(iter(_pending.items()))
+        if searched_at >= cutoff and len(_pending) <= settings.SUGGEST_MAX_PENDING:
+            break
+        del _pending[query]
+        expired += 1
+    if expired:
+        metrics.incr('suggest_pending_expired', expired)
+
+
+def _refresh():
+    """Index SearchHistory rows added since the last refresh"""
+    from .models import SearchHistory
+
+    global _watermark, _last_refresh
+    started = time.monotonic()
+    while True:
+        rows = list(
+            SearchHistory.objects.filter(pk__gt=_watermark).order_by('pk')
+            .values_list('pk', 'user_id', 'query', 'created_at')[:settings.SUGGEST_REFRESH_BATCH]
+        )
+        added = []
+        for _, user_id, query, created_at in rows:
+            query = normalize_query(query)
+            weight = _searched(user_id, query, created_at.timestamp())
+            if weight:
+                added.append(('query', query, weight, None))
+        _index.add_many(added, increment=True)
+        _expire_pending(time.time())
+        if rows:
+            _watermark = rows[-1][0]
+        if len(rows) < settings.SUGGEST_REFRESH_BATCH:
+            break
+    _index.warm()
+    _last_refresh = time.time()
+    metrics.incr('suggest_refresh_seconds', time.monotonic() - started)
+
+
+def refresh():
+    """Run one incremental refresh unless one is already running in this process"""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        _refresh()
+    finally:
+        _refresh_lock.release()
+    return True
+
+
+def maybe_refresh():
+    """Start a background refresh when the index is older than SUGGEST_REFRESH_INTERVAL"""
+    if _last_refresh is None or time.time() - _last_refresh >= settings.SUGGEST_REFRESH_INTERVAL:
+        if not _refresh_lock.locked():
+            submit('refresh', refresh)
+
+
+def suggest(prefix, limit=10):
+    maybe_refresh()
+    metrics.incr('suggest_lookups')
+    return _index.lookup(prefix, limit)
+
+
+def stats():
+    return {
+        **_index.stats(),
+        'pending_queries': len(_pending),
+        'last_refresh_at': _last_refresh,
+    }
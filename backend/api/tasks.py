@@ -0,0 +1,104 @@
+import logging
+import time
+
+from celery import chord, shared_task
+from django.contrib.auth.models import User
+
+from . import audio_analytics, events, listening, listening_stats, recommendations
+from .library import sync_saved_tracks
+from .models import SpotifyToken
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def sync_user_library(user_id, full=None):
+    """Mirror one user's saved tracks"""
+    user = User.objects.get(pk=user_id)
+    summary = sync_saved_tracks(user, full=full)
+    if summary is None:
+        logger.info('Library sync for user %s already running, skipped', user_id)
+    else:
+        # Fetch features of newly saved tracks now rather than on the next stats request
+        audio_analytics.library_stats(user)
+    return summary
+
+
+@shared_task
+def sync_libraries():
+    """Queue a library sync for every user with a connected Spotify account"""
+    user_ids = SpotifyToken.objects.values_list('user_id', flat=True)
+    queued = 0
+    for user_id in user_ids.iterator():
+        sync_user_library.delay(user_id)
+        queued += 1
+    logger.info('Queued library sync for %d users', queued)
+    return queued
+
+
+@shared_task
+def ingest_listening_history():
+    """Queue recently-played ingestion for every user due a poll, in batches"""
+    batches = listening.batches(listening.due_user_ids())
+    if batches:
+        # The report task runs once every batch has finished
+        chord(ingest_listening_batch.s(batch) for batch in batches)(report_listening_ingest.s(time.time()))
+    return len(batches)
+
+
+@shared_task
+def ingest_listening_batch(user_ids):
+    """Ingest new plays for one batch of users"""
+    return listening.ingest_users(user_ids)
+
+
+@shared_task
+def report_listening_ingest(reports, started):
+    """Log and record the throughput of a whole ingestion run"""
+    run = listening.record_run(reports, time.time() - started)
+    logger.info('Listening history ingestion: %s', run)
+    return run
+
+
+@shared_task
+def roll_up_listening_history():
+    """Add plays stored since the last run to the listening statistics rollups"""
+    run = listening_stats.roll_up()
+    if run is None:
+        logger.info('Listening rollup already running, skipped')
+    else:
+        logger.info('Listening rollup: %s', run)
+    return run
+
+
+@shared_task
+def write_activity_events(batch):
+    """Write a batch of activity events flushed by a web worker (ACTIVITY_FLUSH_MODE = 'celery')"""
+    events.write(batch)
+    return len(batch)
+
+
+@shared_task
+def compute_recommendations(full=False):
+    """Queue recommendation shards for users whose inputs changed (every user with ``full``)"""
+    shards = recommendations.shards(recommendations.due_user_ids(full))
+    if shards:
+        chord(compute_recommendation_shard.s(shard) for shard in shards)(
+            report_recommendations.s(time.time(), full)
+        )
+    return len(shards)
+
+
+@shared_task
+def compute_recommendation_shard(user_ids):
+    """Compute and store recommendations for one shard of users"""
+    return recommendations.compute_users(user_ids)
+
+
+@shared_task
+def report_recommendations(reports, started, full=False):
+    """Log and record the throughput of a whole recommendation run"""
+    run = recommendations.record_run(reports, time.time() - started, full)
+    logger.info('Recommendation run: %s', run)
+    return run
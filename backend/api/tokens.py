@@ -0,0 +1,104 @@
+"""
+Per-user cache of Spotify access tokens.
+
+Building a SpotifyAPIService needs the user's access token, and reading it
+from the database on every request would cost a query even when the Spotify
+response itself comes from cache. Tokens are therefore cached (L1, then the
+shared cache) until they expire. SpotifyService.save_user_token, which every
+login and refresh goes through, writes the new token here, so a refreshed
+token replaces the old one in every worker immediately.
+
+Only the access token and its expiry are cached; refresh tokens stay in the
+database.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import metrics
+from .local_cache import broadcast_invalidation, get_local_cache
+from .models import SpotifyToken
+
+
+# Used when a token's expiry is unknown (rows stored before expires_at existed)
+UNKNOWN_EXPIRY_TIMEOUT = 60
+
+
+class CachedToken(namedtuple('CachedToken', ['access_token', 'expires_at'])):
+    """The parts of a SpotifyToken the request path needs"""
+
+    __slots__ = ()
+
+    # Only reads self.expires_at, so the model's check applies as is
+    expires_within = SpotifyToken.expires_within
+
+
+def _key(user_id):
+    return f'spotify_token_{user_id}'
+
+
+def _timeout(cached_token):
+    if cached_token.expires_at is None:
+        return UNKNOWN_EXPIRY_TIMEOUT
+    return int((cached_token.expires_at - timezone.now()).total_seconds())
+
+
+def remember(spotify_token):
+    """Cache a user's new token and drop older copies from every worker's L1"""
+    cached_token = CachedToken(spotify_token.access_token, spotify_token.expires_at)
+    key = _key(spotify_token.user_id)
+    timeout = _timeout(cached_token)
+    if timeout > 0:
+        cache.set(key, cached_token, timeout)
+        get_local_cache().set(key, cached_token, timeout)
+    else:
+        cache.delete(key)
+        get_local_cache().delete(key)
+    broadcast_invalidation([key])
+    return cached_token
+
+
+def get_token(user):
+    """Get a user's CachedToken, reading the database only on a cache miss"""
+    key = _key(user.pk)
+    local_cache = get_local_cache()
+    cached_token = local_cache.get(key)
+    if cached_token is not None:
+        return cached_token
+
+    cached_token = cache.get(key)
+    if cached_token is None:
+        metrics.incr('token_cache_miss')
+        try:
+            spotify_token = SpotifyToken.objects.get(user=user)
+        except SpotifyToken.DoesNotExist:
+            raise ValueError("User has no Spotify token")
+        cached_token = CachedToken(spotify_token.access_token, spotify_token.expires_at)
+        if _timeout(cached_token) > 0:
+            # add(), not set(): never overwrite a newer token saved since the query
+            cache.add(key, cached_token, _timeout(cached_token))
+    local_cache.set(key, cached_token, _timeout(cached_token))
+    return cached_token
+
+
+async def aget_token(user):
+    """Async counterpart of get_token()"""
+    key = _key(user.pk)
+    local_cache = get_local_cache()
+    cached_token = local_cache.get(key)
+    if cached_token is not None:
+        return cached_token
+
+    cached_token = await cache.aget(key)
+    if cached_token is None:
+        metrics.incr('token_cache_miss')
+        try:
+            spotify_token = await SpotifyToken.objects.aget(user=user)
+        except SpotifyToken.DoesNotExist:
+            raise ValueError("User has no Spotify token")
+        cached_token = CachedToken(spotify_token.access_token, spotify_token.expires_at)
+        if _timeout(cached_token) > 0:
+            await cache.aadd(key, cached_token, _timeout(cached_token))
+    local_cache.set(key, cached_token, _timeout(cached_token))
+    return cached_token
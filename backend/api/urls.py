@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # Dashboard & User Profile
@@ -9,18 +9,22 @@ urlpatterns = [
     # Search
     path('search/', views.search, name='search'),
     path('search/history/', views.search_history, name='search_history'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     
     # Tracks
+    path('tracks/', views.several_tracks, name='several_tracks'),
     path('tracks/<str:track_id>/', views.track_detail, name='track_detail'),
     path('tracks/<str:track_id>/audio-features/', views.track_audio_features, name='track_audio_features'),
     
     # Artists
+    path('artists/', views.several_artists, name='several_artists'),
     path('artists/<str:artist_id>/', views.artist_detail, name='artist_detail'),
     path('artists/<str:artist_id>/albums/', views.artist_albums, name='artist_albums'),
     path('artists/<str:artist_id>/top-tracks/', views.artist_top_tracks, name='artist_top_tracks'),
     path('artists/<str:artist_id>/related/', views.related_artists, name='related_artists'),
     
     # Albums
+    path('albums/', views.several_albums, name='several_albums'),
     path('albums/<str:album_id>/', views.album_detail, name='album_detail'),
     path('albums/<str:album_id>/tracks/', views.album_tracks, name='album_tracks'),
     
@@ -39,8 +43,50 @@ urlpatterns = [
     path('me/tracks/save/', views.save_tracks, name='save_tracks'),
     path('me/tracks/remove/', views.remove_saved_tracks, name='remove_saved_tracks'),
     
+    # Library mirror (Local Database)
+    path('library/tracks/', views.library_tracks, name='library_tracks'),
+    path('library/tracks/count/', views.library_tracks_count, name='library_tracks_count'),
+    path('library/sync/', views.library_sync, name='library_sync'),
+    path('library/search/', views.search_library, name='search_library'),
+    path('library/audio-features/', views.library_audio_features, name='library_audio_features'),
+    
+    # Exports (streamed NDJSON)
+    path('export/me/tracks/', views.export_saved_tracks, name='export_saved_tracks'),
+    path('export/playlists/', views.export_playlists, name='export_playlists'),
+    path('export/playlists/<str:playlist_id>/tracks/', views.export_playlist_tracks, name='export_playlist_tracks'),
+    
     # User Favorites (Local Database)
     path('favorites/tracks/', views.favorite_tracks, name='favorite_tracks'),
     path('favorites/tracks/add/', views.add_favorite_track, name='add_favorite_track'),
     path('favorites/tracks/<str:track_id>/remove/', views.remove_favorite_track, name='remove_favorite_track'),
+    path('favorites/tracks/<str:track_id>/similar/', views.similar_favorite_tracks, name='similar_favorite_tracks'),
+    
+    # Recommendations (computed by the batch job)
+    path('recommendations/', views.user_recommendations, name='user_recommendations'),
+    
+    # Listening statistics (rollups of the listening history)
+    path('listening/top/', views.listening_top, name='listening_top'),
+    path('listening/hours/', views.listening_hours, name='listening_hours'),
+    
+    # Async proxies (non-blocking when served through spotify_api.asgi)
+    path('async/dashboard/', async_views.dashboard, name='async_dashboard'),
+    path('async/playlists/', async_views.user_playlists, name='async_user_playlists'),
+    path('async/search/', async_views.search, name='async_search'),
+    path('async/tracks/<str:track_id>/', async_views.track_detail, name='async_track_detail'),
+    path('async/tracks/<str:track_id>/audio-features/', async_views.track_audio_features, name='async_track_audio_features'),
+    path('async/artists/<str:artist_id>/', async_views.artist_detail, name='async_artist_detail'),
+    path('async/artists/<str:artist_id>/albums/', async_views.artist_albums, name='async_artist_albums'),
+    path('async/artists/<str:artist_id>/top-tracks/', async_views.artist_top_tracks, name='async_artist_top_tracks'),
+    path('async/artists/<str:artist_id>/related/', async_views.related_artists, name='async_related_artists'),
+    path('async/albums/<str:album_id>/', async_views.album_detail, name='async_album_detail'),
+    path('async/albums/<str:album_id>/tracks/', async_views.album_tracks, name='async_album_tracks'),
+    path('async/playlists/<str:playlist_id>/', async_views.playlist_detail, name='async_playlist_detail'),
+    path('async/playlists/<str:playlist_id>/tracks/', async_views.playlist_tracks, name='async_playlist_tracks'),
+    path('async/browse/featured-playlists/', async_views.featured_playlists, name='async_featured_playlists'),
+    path('async/browse/new-releases/', async_views.new_releases, name='async_new_releases'),
+    path('async/browse/categories/', async_views.categories, name='async_categories'),
+    path('async/me/tracks/', async_views.saved_tracks, name='async_saved_tracks'),
+    
+    # Service Diagnostics
+    path('stats/', views.service_stats, name='service_stats'),
 ]
@@ -1,18 +1,33 @@
+import json
+from datetime import datetime, time
+from itertools import chain, islice
+
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.core.paginator import Paginator
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
-
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import audio_analytics, events, library_search, listening, listening_stats, metrics, recommendations, similarity, suggest
+from .concurrency import gather
+from .http import pool_stats
+from .library import sync_status
+from .local_cache import get_local_cache
 from .services import SpotifyAPIService
-from .models import UserPlaylist, UserTrack, UserArtist, SearchHistory
+from .models import UserPlaylist, UserTrack, UserArtist, SearchHistory, SavedTrack, UserRecommendation
 from .serializers import (
     UserPlaylistSerializer, UserTrackSerializer, UserArtistSerializer,
     SearchHistorySerializer, SpotifyTrackSerializer, SpotifyArtistSerializer,
     SpotifyAlbumSerializer, SpotifyPlaylistSerializer, AudioFeaturesSerializer,
-    SearchResultSerializer
+    SearchResultSerializer, SavedTrackSerializer, UserRecommendationSerializer
 )
+from .tasks import sync_user_library
 
 
 # User Profile & Dashboard Views
@@ -23,20 +38,24 @@ def dashboard(request):
     try:
         spotify_service = SpotifyAPIService(request.user)
         
-        # Get user's top tracks, artists, and recent activity
-        top_tracks = spotify_service.get_user_top_tracks(limit=10)
-        top_artists = spotify_service.get_user_top_artists(limit=10)
-        recently_played = spotify_service.get_recently_played(limit=10)
-        featured_playlists = spotify_service.get_featured_playlists(limit=6)
-        new_releases = spotify_service.get_new_releases(limit=6)
+        # Fetch top tracks, artists, recent activity and browse sections concurrently
+        sections, errors = gather({
+            'top_tracks': (spotify_service.get_user_top_tracks, (), {'limit': 10}),
+            'top_artists': (spotify_service.get_user_top_artists, (), {'limit': 10}),
+            'recently_played': (spotify_service.get_recently_played, (), {'limit': 10}),
+            'featured_playlists': (spotify_service.get_featured_playlists, (), {'limit': 6}),
+            'new_releases': (spotify_service.get_new_releases, (), {'limit': 6}),
+        }, timeout=settings.DASHBOARD_SECTION_TIMEOUT, executor='dashboard')
         
-        return Response({
-            'top_tracks': top_tracks,
-            'top_artists': top_artists,
-            'recently_played': recently_played,
-            'featured_playlists': featured_playlists,
-            'new_releases': new_releases
-        })
+        if len(errors) == len(sections):
+            return Response({'error': 'Failed to load dashboard', 'errors': errors},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if sections['recently_played']:
+            events.record_plays(request.user, sections['recently_played'].get('items') or [])
+        
+        # Sections that failed or timed out come back as None with an entry in 'errors'
+        return Response({**sections, 'errors': errors})
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -68,18 +87,17 @@ def search(request):
         search_type = request.GET.get('type', 'track')
         limit = int(request.GET.get('limit', 20))
         offset = int(request.GET.get('offset', 0))
+        market = request.GET.get('market')
         
         if not query:
             return Response({'error': 'Query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         spotify_service = SpotifyAPIService(request.user)
-        results = spotify_service.search(query, search_type, limit, offset)
+        results = spotify_service.search(query, search_type, limit, offset, market)
         
-        # Save search history
-        SearchHistory.objects.create(
-            user=request.user,
-            query=query,
-            search_type=search_type,
+        # Saved to search history in the background
+        events.record_search(
+            request.user, query, search_type,
             result_count=results.get(f'{search_type}s', {}).get('total', 0)
         )
         
@@ -102,6 +120,23 @@ def search_history(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_suggest(request):
+    """Typeahead suggestions for a partial query, from this worker's in-memory index (no Spotify call)"""
+    try:
+        query = request.GET.get('q', '')
+        limit = min(max(int(request.GET.get('limit', 10)), 1), suggest.TOP_K)
+        
+        if not query.strip():
+            return Response({'error': 'Query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'query': query, 'suggestions': suggest.suggest(query, limit)})
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # Track Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -116,6 +151,23 @@ def track_detail(request, track_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def several_tracks(request):
+    """Get details for a comma-separated list of track IDs"""
+    try:
+        track_ids = [i for i in request.GET.get('ids', '').split(',') if i]
+        if not track_ids:
+            return Response({'error': 'ids parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        spotify_service = SpotifyAPIService(request.user)
+        tracks = spotify_service.loader('track').load_many(track_ids)
+        return Response({'tracks': tracks})
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def track_audio_features(request, track_id):
@@ -143,6 +195,23 @@ def artist_detail(request, artist_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def several_artists(request):
+    """Get details for a comma-separated list of artist IDs"""
+    try:
+        artist_ids = [i for i in request.GET.get('ids', '').split(',') if i]
+        if not artist_ids:
+            return Response({'error': 'ids parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        spotify_service = SpotifyAPIService(request.user)
+        artists = spotify_service.loader('artist').load_many(artist_ids)
+        return Response({'artists': artists})
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def artist_albums(request, artist_id):
@@ -198,6 +267,23 @@ def album_detail(request, album_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def several_albums(request):
+    """Get details for a comma-separated list of album IDs"""
+    try:
+        album_ids = [i for i in request.GET.get('ids', '').split(',') if i]
+        if not album_ids:
+            return Response({'error': 'ids parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        spotify_service = SpotifyAPIService(request.user)
+        albums = spotify_service.loader('album').load_many(album_ids)
+        return Response({'albums': albums})
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def album_tracks(request, album_id):
@@ -348,12 +434,205 @@ def remove_saved_tracks(request):
         
         spotify_service = SpotifyAPIService(request.user)
         result = spotify_service.remove_saved_tracks(track_ids)
+        # Keep the local mirror in step without waiting for the next reconciliation
+        SavedTrack.objects.filter(user=request.user, track_id__in=track_ids).delete()
         return Response({'message': 'Tracks removed successfully'})
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Library Mirror Views (Local Database, kept in sync by api.tasks)
+def _filter_library(request):
+    """Saved tracks of the current user narrowed by the request's filter parameters"""
+    tracks = SavedTrack.objects.filter(user=request.user)
+    query = request.GET.get('q')
+    if query:
+        tracks = tracks.filter(
+            Q(name__icontains=query) | Q(artist_name__icontains=query) | Q(album_name__icontains=query)
+        )
+    for param in ('artist_id', 'album_id'):
+        if request.GET.get(param):
+            tracks = tracks.filter(**{param: request.GET[param]})
+    if 'explicit' in request.GET:
+        tracks = tracks.filter(explicit=request.GET['explicit'].lower() == 'true')
+    if request.GET.get('added_after'):
+        tracks = tracks.filter(added_at__gte=_parse_added(request.GET, 'added_after'))
+    if request.GET.get('added_before'):
+        tracks = tracks.filter(added_at__lt=_parse_added(request.GET, 'added_before'))
+    return tracks
+
+
+class InvalidParameter(ValueError):
+    """A malformed query parameter, answered with 400"""
+
+
+def _int_param(request, name, default, minimum, maximum=None):
+    """An integer query parameter clamped to [minimum, maximum]"""
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        raise InvalidParameter(f'{name} must be an integer')
+    value = max(value, minimum)
+    return value if maximum is None else min(value, maximum)
+
+
+def _parse_added(params, name):
+    """A date (start of the day) or datetime parameter as an aware datetime"""
+    value = params[name]
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise InvalidParameter(f'{name} must be a date (YYYY-MM-DD) or an ISO 8601 datetime')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def library_tracks(request):
+    """List the user's saved tracks from the local mirror"""
+    try:
+        limit = _int_param(request, 'limit', 50, 1, 500)
+        offset = _int_param(request, 'offset', 0, 0)
+        tracks = _filter_library(request)
+        page = tracks[offset:offset + limit]
+        return Response({
+            'items': SavedTrackSerializer(page, many=True).data,
+            'total': tracks.count(),
+            'limit': limit,
+            'offset': offset,
+            'sync': sync_status(request.user),
+        })
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def library_tracks_count(request):
+    """Count the user's saved tracks in the local mirror"""
+    try:
+        return Response({'count': _filter_library(request).count()})
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_library(request):
+    """Search the user's favorite tracks, artists and albums locally (prefix matching, ranked)"""
+    try:
+        query = request.GET.get('q', '')
+        kinds = [kind for kind in request.GET.get('type', ','.join(library_search.KINDS)).split(',') if kind]
+        limit = _int_param(request, 'limit', 20, 1, 50)
+        
+        if not query:
+            return Response({'error': 'Query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not kinds or not set(kinds) <= set(library_search.KINDS):
+            return Response({'error': f"type must be a comma-separated subset of {', '.join(library_search.KINDS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'results': library_search.search(request.user, query, kinds, limit)})
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def library_audio_features(request):
+    """Get audio-feature statistics (means, percentiles, histograms, keys and modes) for the user's saved tracks"""
+    try:
+        return Response(audio_analytics.library_stats(request.user))
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def library_sync(request):
+    """Get the mirror's sync status, or queue a sync (?full=true to reconcile removals)"""
+    try:
+        if request.method == 'POST':
+            full = True if request.GET.get('full', '').lower() == 'true' else None
+            sync_user_library.delay(request.user.pk, full=full)
+            return Response({'message': 'Library sync queued'}, status=status.HTTP_202_ACCEPTED)
+        return Response(sync_status(request.user))
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Export Views (NDJSON, one item per line, streamed while Spotify is paged through)
+def _ndjson_response(items, filename):
+    """Stream items as newline-delimited JSON"""
+    items = iter(items)
+    # Fetch the first page up front so an immediate failure still gets a proper error status
+    first = list(islice(items, 1))
+    
+    def lines():
+        try:
+            for item in chain(first, items):
+                yield json.dumps(item) + '\n'
+        except Exception as e:
+            # Headers are already sent; a trailing error line tells the client the export is incomplete
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_saved_tracks(request):
+    """Export the user's whole library of saved tracks"""
+    try:
+        spotify_service = SpotifyAPIService(request.user)
+        return _ndjson_response(spotify_service.iter_saved_tracks(), 'saved-tracks.ndjson')
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_playlists(request):
+    """Export all of the user's playlists"""
+    try:
+        spotify_service = SpotifyAPIService(request.user)
+        return _ndjson_response(spotify_service.iter_user_playlists(), 'playlists.ndjson')
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_playlist_tracks(request, playlist_id):
+    """Export every track of a playlist"""
+    try:
+        spotify_service = SpotifyAPIService(request.user)
+        return _ndjson_response(spotify_service.iter_playlist_tracks(playlist_id), f'playlist-{playlist_id}.ndjson')
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # User Favorites Management
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -368,7 +647,7 @@ def favorite_tracks(request):
 @permission_classes([IsAuthenticated])
 def add_favorite_track(request):
     """Add track to favorites"""
-    serializer = UserTrackSerializer(data=request.data)
+    serializer = UserTrackSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         serializer.save(user=request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -385,3 +664,186 @@ def remove_favorite_track(request, track_id):
         return Response({'message': 'Track removed from favorites'})
     except UserTrack.DoesNotExist:
         return Response({'error': 'Track not found in favorites'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def similar_favorite_tracks(request, track_id):
+    """Favorite tracks that sound most like a track, by audio features (the track need not be a favorite)"""
+    try:
+        limit = _int_param(request, 'limit', 10, 1, 100)
+        
+        similar = similarity.similar_tracks(request.user, track_id, k=limit)
+        if similar is None:
+            # Not a favorite with features: compare with its features from Spotify
+            features = SpotifyAPIService(request.user).get_track_audio_features(track_id)
+            similar = similarity.similar_tracks(request.user, track_id, features=features, k=limit)
+        if similar is None:
+            return Response({'error': 'No audio features for this track'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'track_id': track_id,
+            'results': [{'track_id': similar_id, 'similarity': score} for similar_id, score in similar],
+        })
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_recommendations(request):
+    """Get the user's recommended tracks and artists, best first (computed by the batch job)"""
+    try:
+        item_type = request.GET.get('type')
+        limit = _int_param(request, 'limit', 25, 1, 100)
+        items = UserRecommendation.objects.filter(user=request.user)
+        if item_type:
+            items = items.filter(item_type=item_type)
+        serializer = UserRecommendationSerializer(items[:limit], many=True)
+        return Response(serializer.data)
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Listening statistics (rollups of the listening history)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def listening_top(request):
+    """Get the user's most played tracks or artists of a day, week or month (?period=, ?type=, ?date=YYYY-MM-DD)"""
+    try:
+        period = request.GET.get('period', 'week')
+        item_type = request.GET.get('type', 'track')
+        limit = _int_param(request, 'limit', 10, 1, 50)
+        
+        if period not in listening_stats.PERIODS:
+            return Response({'error': f"period must be one of {', '.join(listening_stats.PERIODS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if item_type not in listening_stats.ITEM_TYPES:
+            return Response({'error': f"type must be one of {', '.join(listening_stats.ITEM_TYPES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        day = None
+        if request.GET.get('date'):
+            try:
+                day = parse_date(request.GET['date'])
+            except ValueError:
+                day = None
+            if day is None:
+                return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(listening_stats.top_items(request.user, period, item_type, day, limit))
+        
+    except InvalidParameter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def listening_hours(request):
+    """Get the user's plays and listening time for each hour of the day"""
+    try:
+        return Response({'hours': listening_stats.hours(request.user)})
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Service Diagnostics
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def service_stats(request):
+    """Get upstream connection pool and cache statistics"""
+    counters = metrics.snapshot()
+    cluster = counters['cluster']
+    return Response({
+        'http_pool': pool_stats(),
+        'cache': {
+            'hit_rate': metrics.ratio(
+                cluster.get('cache_fresh', 0) + cluster.get('cache_stale', 0),
+                cluster.get('cache_miss', 0)
+            ),
+            'l1_hit_rate': metrics.ratio(cluster.get('l1_hit', 0), cluster.get('l1_miss', 0)),
+            'l2_hit_rate': metrics.ratio(cluster.get('l2_hit', 0), cluster.get('l2_miss', 0)),
+            'l1': get_local_cache().stats(),
+            'stale_served': cluster.get('cache_stale', 0),
+            'background_refreshes': cluster.get('cache_background_refresh', 0),
+            'refresh_failures': cluster.get('cache_refresh_failed', 0),
+        },
+        'search_cache': {
+            'hit_rate': metrics.ratio(cluster.get('search_cache_hit', 0), cluster.get('search_cache_miss', 0)),
+            'hits': cluster.get('search_cache_hit', 0),
+            'misses': cluster.get('search_cache_miss', 0),
+            'prefetched_pages': cluster.get('search_prefetched', 0),
+            'prefetches_skipped': cluster.get('search_prefetch_skipped', 0),
+        },
+        'similarity': similarity.stats(),
+        'suggest': {
+            'lookups': cluster.get('suggest_lookups', 0),
+            'refresh_seconds': cluster.get('suggest_refresh_seconds', 0),
+            'index_in_process': suggest.stats(),
+        },
+        'etag': {
+            'not_modified': cluster.get('etag_not_modified', 0),
+            'modified': cluster.get('etag_modified', 0),
+            'bytes_saved': cluster.get('etag_bytes_saved', 0),
+        },
+        'rate_limit': {
+            'throttled_calls': cluster.get('ratelimit_throttled', 0),
+            'throttled_seconds': cluster.get('ratelimit_wait_seconds', 0),
+            'rejected_calls': cluster.get('ratelimit_rejected', 0),
+            'upstream_429': cluster.get('upstream_429', 0),
+            'retries': cluster.get('upstream_retries', 0),
+            'retry_backoff_seconds': cluster.get('retry_backoff_seconds', 0),
+        },
+        'tokens': {
+            'cache_misses': cluster.get('token_cache_miss', 0),
+            'refreshed': cluster.get('token_refreshed', 0),
+            'refresh_failures': cluster.get('token_refresh_failed', 0),
+            'inline_refreshes': cluster.get('token_refresh_inline', 0),
+            'refreshes_after_401': cluster.get('token_refresh_on_401', 0),
+            'expired_errors': cluster.get('token_expired_errors', 0),
+        },
+        'listening_ingest': {
+            'users_polled': cluster.get('listening_users_polled', 0),
+            'plays_ingested': cluster.get('listening_plays_ingested', 0),
+            'last_run': listening.last_run(),
+        },
+        'audio_analytics': {
+            'cached_results': cluster.get('audio_analytics_hits', 0),
+            'updates': cluster.get('audio_analytics_updates', 0),
+            'features_fetched': cluster.get('audio_features_fetched', 0),
+            'fetch_failures': cluster.get('audio_features_fetch_failed', 0),
+        },
+        'listening_rollups': {
+            'plays_rolled_up': cluster.get('listening_plays_rolled_up', 0),
+            'last_run': listening_stats.last_run(),
+        },
+        'recommendations': {
+            'users_computed': cluster.get('recommendation_users_computed', 0),
+            'last_run': recommendations.last_run(),
+        },
+        'activity_events': {
+            'recorded': cluster.get('activity_events_recorded', 0),
+            'written': cluster.get('activity_events_written', 0),
+            'dropped': cluster.get('activity_events_dropped', 0),
+            'lost': cluster.get('activity_events_lost', 0),
+            'flushes': cluster.get('activity_flushes', 0),
+            'buffered_in_process': events.buffered(),
+        },
+        'single_flight': {
+            'leaders': cluster.get('single_flight_leader', 0),
+            'waits': cluster.get('single_flight_wait', 0),
+            'coalesced': cluster.get('single_flight_coalesced', 0),
+            'wait_timeouts': cluster.get('single_flight_wait_timeout', 0),
+            'wait_seconds': cluster.get('single_flight_wait_seconds', 0),
+            'stale_refreshes_coalesced': cluster.get('refresh_coalesced', 0),
+        },
+        'counters': counters,
+    })
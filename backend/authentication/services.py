@@ -1,8 +1,11 @@
 import base64
-import requests
+import time
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from api import caching, metrics, tokens
+from api.http import get_session
 from api.models import SpotifyToken, UserProfile
 
 
@@ -49,7 +52,9 @@ class SpotifyService:
             'redirect_uri': settings.SPOTIFY_REDIRECT_URI
         }
         
-        response = requests.post(SpotifyService.AUTH_URL, headers=headers, data=data)
+        response = get_session().post(
+            SpotifyService.AUTH_URL, headers=headers, data=data, timeout=settings.SPOTIFY_HTTP_TIMEOUT
+        )
         return response.json()
     
     @staticmethod
@@ -68,14 +73,18 @@ class SpotifyService:
             'refresh_token': refresh_token
         }
         
-        response = requests.post(SpotifyService.AUTH_URL, headers=headers, data=data)
+        response = get_session().post(
+            SpotifyService.AUTH_URL, headers=headers, data=data, timeout=settings.SPOTIFY_HTTP_TIMEOUT
+        )
         return response.json()
     
     @staticmethod
     def get_user_profile(access_token):
         """Get Spotify user profile"""
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get(f'{SpotifyService.BASE_URL}/me', headers=headers)
+        response = get_session().get(
+            f'{SpotifyService.BASE_URL}/me', headers=headers, timeout=settings.SPOTIFY_HTTP_TIMEOUT
+        )
         return response.json()
     
     @staticmethod
@@ -88,6 +97,7 @@ class SpotifyService:
                 'refresh_token': token_data.get('refresh_token', ''),
                 'token_type': token_data.get('token_type', 'Bearer'),
                 'expires_in': token_data.get('expires_in', 3600),
+                'expires_at': timezone.now() + timedelta(seconds=token_data.get('expires_in', 3600)),
                 'scope': token_data.get('scope', '')
             }
         )
@@ -97,11 +107,59 @@ class SpotifyService:
             if 'refresh_token' in token_data:
                 spotify_token.refresh_token = token_data['refresh_token']
             spotify_token.expires_in = token_data.get('expires_in', 3600)
+            spotify_token.expires_at = timezone.now() + timedelta(seconds=spotify_token.expires_in)
             spotify_token.scope = token_data.get('scope', '')
             spotify_token.save()
         
+        # Every login and refresh lands here, so this keeps the token cache current
+        tokens.remember(spotify_token)
+        
         return spotify_token
     
+    @staticmethod
+    def refresh_user_token(user, rejected_access_token=None, margin=None):
+        """
+        Refresh a user's access token if it expires within ``margin`` seconds
+        (default TOKEN_REFRESH_MARGIN) or is ``rejected_access_token``.
+        
+        Only one worker refreshes a given user's token at a time: the others
+        wait for its result instead of spending the refresh token again.
+        Returns the current SpotifyToken.
+        """
+        margin = settings.TOKEN_REFRESH_MARGIN if margin is None else margin
+        
+        def needs_refresh(token):
+            return token.access_token == rejected_access_token or token.expires_within(margin)
+        
+        lock_name = f'token_refresh:{user.pk}'
+        deadline = time.monotonic() + settings.TOKEN_REFRESH_WAIT
+        while True:
+            # Re-read under the lock: another worker may have just refreshed it
+            spotify_token = SpotifyToken.objects.get(user=user)
+            if not needs_refresh(spotify_token):
+                return spotify_token
+            lock = caching.acquire(lock_name)
+            if lock is not None:
+                break
+            if time.monotonic() >= deadline:
+                raise ValueError("Access token refresh is taking too long. Please try again.")
+            time.sleep(0.05)
+        
+        try:
+            spotify_token = SpotifyToken.objects.get(user=user)
+            if not needs_refresh(spotify_token):
+                return spotify_token
+            
+            token_data = SpotifyService.refresh_access_token(spotify_token.refresh_token)
+            if 'error' in token_data:
+                metrics.incr('token_refresh_failed')
+                raise ValueError(f"Could not refresh access token: {token_data['error']}")
+            
+            metrics.incr('token_refreshed')
+            return SpotifyService.save_user_token(user, token_data)
+        finally:
+            caching.release(lock_name, lock)
+    
     @staticmethod
     def save_user_profile(user, profile_data):
         """Save or update user's Spotify profile"""
@@ -0,0 +1,39 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from api.concurrency import map_concurrently
+from api.models import SpotifyToken
+from .services import SpotifyService
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_expiring_tokens():
+    """Refresh every Spotify token that expires before the next run"""
+    horizon = timezone.now() + timedelta(seconds=settings.TOKEN_REFRESH_MARGIN)
+    tokens = (
+        SpotifyToken.objects
+        .filter(expires_at__lte=horizon)
+        .exclude(refresh_token='')
+        .select_related('user')
+    )
+
+    def refresh(spotify_token):
+        try:
+            # Tokens another worker already refreshed are skipped under the per-user lock
+            SpotifyService.refresh_user_token(spotify_token.user)
+            return True
+        except Exception:
+            logger.exception('Could not refresh Spotify token for user %s', spotify_token.user_id)
+            return False
+
+    results = map_concurrently(refresh, tokens.iterator(), executor='tokens')
+    summary = {'refreshed': results.count(True), 'failed': results.count(False)}
+    logger.info('Refreshed expiring Spotify tokens: %s', summary)
+    return summary
@@ -106,16 +106,14 @@ def refresh_token(request):
     """Refresh Spotify access token"""
     try:
         spotify_token = request.user.spotify_token
-        token_data = SpotifyService.refresh_access_token(spotify_token.refresh_token)
         
-        if 'error' in token_data:
-            return Response({'error': token_data['error']}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update token
-        SpotifyService.save_user_token(request.user, token_data)
+        # Goes through the per-user refresh lock shared with background and inline refreshes
+        SpotifyService.refresh_user_token(request.user, rejected_access_token=spotify_token.access_token)
         
         return Response({'message': 'Token refreshed successfully'})
         
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
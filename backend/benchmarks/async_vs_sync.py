@@ -0,0 +1,101 @@
+"""
+Compare upstream throughput of the sync and async Spotify services.
+
+Starts a local stub of the Spotify API that answers every request after a
+fixed latency, then drives the same uncached endpoint through:
+
+  * SpotifyAPIService on N threads, i.e. N sync gunicorn workers
+  * AsyncSpotifyAPIService on one event loop, i.e. one ASGI worker
+
+Usage (from the backend directory):
+
+    python benchmarks/async_vs_sync.py --requests 2000 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+# Only uncached endpoints are exercised, but keep the benchmark independent of Redis
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# Measure request handling, not the shared quota
+settings.SPOTIFY_RATE_LIMIT = 0
+django.setup()
+
+from api.async_services import AsyncSpotifyAPIService
+from api.http import close_async_client
+from api.services import SpotifyAPIService
+from benchmarks.stub_spotify import StubSpotify
+
+
+def run_sync(base_url, total, workers):
+    class StubSyncService(SpotifyAPIService):
+        BASE_URL = base_url
+
+        def _get_access_token(self):
+            return 'benchmark-token'
+
+    service = StubSyncService(user=None)
+
+    def worker(count):
+        for _ in range(count):
+            service.get_playlist_tracks('benchmark')
+
+    per_worker = [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(worker, per_worker))
+    return time.perf_counter() - start
+
+
+async def run_async(base_url, total, concurrency):
+    class StubAsyncService(AsyncSpotifyAPIService):
+        BASE_URL = base_url
+
+    service = StubAsyncService(user=None, access_token='benchmark-token')
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await service.get_playlist_tracks('benchmark')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await close_async_client()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--sync-workers', type=int, default=4,
+                        help='threads standing in for sync gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=200,
+                        help='in-flight upstream calls allowed on the event loop')
+    args = parser.parse_args()
+
+    base_url = StubSpotify(latency=args.latency_ms / 1000).start()
+
+    sync_elapsed = run_sync(base_url, args.requests, args.sync_workers)
+    async_elapsed = asyncio.run(run_async(base_url, args.requests, args.concurrency))
+
+    print(f"upstream latency: {args.latency_ms:.0f} ms, requests: {args.requests}")
+    print(f"sync  ({args.sync_workers} workers):      {sync_elapsed:7.2f}s  "
+          f"{args.requests / sync_elapsed:8.1f} req/s")
+    print(f"async (1 loop, {args.concurrency} in flight): {async_elapsed:7.2f}s  "
+          f"{args.requests / async_elapsed:8.1f} req/s")
+    print(f"speedup: {sync_elapsed / async_elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
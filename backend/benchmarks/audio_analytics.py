@@ -0,0 +1,62 @@
+"""
+Cost of library audio-feature statistics (api.audio_analytics).
+
+Builds the feature array for ``--tracks`` random audio-features dicts as
+an update does for newly added tracks, then times the NumPy statistics
+(means, percentiles, histograms, key and mode counts) over the whole array.
+
+Usage (from the backend directory):
+
+    python benchmarks/audio_analytics.py --tracks 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+django.setup()
+
+from api.audio_analytics import summarize, to_rows
+
+
+def features(rng):
+    return {
+        'danceability': rng.random(), 'energy': rng.random(), 'valence': rng.random(),
+        'acousticness': rng.random(), 'instrumentalness': rng.random(), 'speechiness': rng.random(),
+        'liveness': rng.random(), 'loudness': rng.uniform(-30, 0), 'tempo': rng.uniform(60, 200),
+        'key': rng.randint(-1, 11), 'mode': rng.randint(0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    features_list = [features(rng) for _ in range(args.tracks)]
+    start = time.perf_counter()
+    values = to_rows(features_list)
+    print(f'{args.tracks:,} feature rows built in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        summarize(values)
+        timings.append((time.perf_counter() - start) * 1000)
+    print(f'statistics over {args.tracks:,} tracks: median {statistics.median(timings):.1f} ms, '
+          f'max {max(timings):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure what ETag revalidation saves when cached entries go stale.
+
+Warms the cache with N tracks from a local Spotify stub that emits ETags,
+then repeatedly ages every entry past its soft TTL and reads it again, so
+each read serves the stale copy and revalidates it in the background with
+If-None-Match. Between rounds a fraction of the upstream payloads can be
+changed to mix 304s with full 200 responses.
+
+Usage (from the backend directory):
+
+    python benchmarks/etag_revalidation.py --tracks 200 --rounds 5 --change-rate 0.1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                               'OPTIONS': {'MAX_ENTRIES': 100000}}}
+django.setup()
+
+from django.core.cache import cache
+
+from api import caching, metrics
+from api.local_cache import get_local_cache
+from api.services import SpotifyAPIService
+from benchmarks.stub_spotify import StubSpotify
+
+
+def track_payload(version):
+    """A track-sized JSON body, roughly what /tracks/{id} returns"""
+    return {
+        'id': 'benchmark',
+        'name': f'Benchmark Track v{version}',
+        'album': {'name': 'Benchmark Album', 'images': [{'url': 'https://i.scdn.co/image/x' * 4}] * 3},
+        'artists': [{'id': str(i), 'name': f'Artist {i}'} for i in range(3)],
+        'available_markets': ['US', 'GB', 'DE', 'FR', 'SE', 'JP', 'BR', 'AU'] * 20,
+        'duration_ms': 215000,
+        'popularity': 60,
+    }
+
+
+def expire(keys):
+    """Push every entry past its soft TTL while keeping the body and ETag"""
+    for key in keys:
+        entry = caching.peek(key)
+        entry.soft_expiry = 0
+        cache.set(key, entry, 3600)
+        get_local_cache().delete(key)
+
+
+def wait_for(stub, expected, timeout=30):
+    deadline = time.monotonic() + timeout
+    while stub.requests < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--change-rate', type=float, default=0.0,
+                        help='probability that the upstream body changes before a round')
+    parser.add_argument('--latency-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    stub = StubSpotify(latency=args.latency_ms / 1000, payload=track_payload(0), etags=True)
+    base_url = stub.start()
+
+    class StubSyncService(SpotifyAPIService):
+        BASE_URL = base_url
+
+        def _get_access_token(self):
+            return 'benchmark-token'
+
+    service = StubSyncService(user=None)
+    track_ids = [f'track{i}' for i in range(args.tracks)]
+    keys = [f'track_{track_id}' for track_id in track_ids]
+
+    for track_id in track_ids:
+        service.get_track(track_id)
+    warm_bytes = stub.bytes_sent
+    body_size = len(stub.body)
+
+    version = 0
+    for _ in range(args.rounds):
+        if random.random() < args.change_rate:
+            version += 1
+            stub.set_payload(track_payload(version))
+        expire(keys)
+        expected = stub.requests + len(keys)
+        for track_id in track_ids:
+            service.get_track(track_id)
+        wait_for(stub, expected)
+    time.sleep(0.2)
+
+    revalidations = args.tracks * args.rounds
+    transferred = stub.bytes_sent - warm_bytes
+    counters = metrics.snapshot()['process']
+    print(f"tracks: {args.tracks}, rounds: {args.rounds}, body: {body_size} bytes")
+    print(f"revalidations:       {revalidations}")
+    print(f"304 not modified:    {stub.not_modified}")
+    print(f"200 modified:        {int(counters.get('etag_modified', 0))}")
+    print(f"bytes transferred:   {transferred}")
+    print(f"bytes saved:         {int(counters.get('etag_bytes_saved', 0))}")
+    print(f"without ETags:       {revalidations * body_size} bytes")
+
+
+if __name__ == '__main__':
+    main()
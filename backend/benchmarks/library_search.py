@@ -0,0 +1,117 @@
+"""
+Latency of local library search (api.library_search) on a large library.
+
+Builds a throwaway SQLite database, gives ``--users`` users ``--tracks``
+favorite tracks each (plus a tenth as many artists and albums), indexes
+them and times searches for random 1-3 word prefixes of names in one
+user's library, as typed in a search box.
+
+Usage (from the backend directory):
+
+    python benchmarks/library_search.py --users 50 --tracks 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='library_search_'), 'db.sqlite3')
+settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': DB_PATH}}
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+
+from api import library_search
+from api.models import UserAlbum, UserArtist, UserTrack
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 've', 'to', 'sun', 'el', 'dar', 'in', 'fa', 'ne', 'or', 'is', 'ta', 'mo',
+             'ri', 'an', 'be', 'ex']
+
+
+class Vocabulary:
+    """Made-up words drawn with Zipfian frequencies, like words in real titles"""
+
+    def __init__(self, rng, size=20000):
+        words = (''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size * 2))
+        self.words = list(dict.fromkeys(words))[:size]
+        self.cum_weights = list(accumulate(1 / rank ** 1.07 for rank in range(1, len(self.words) + 1)))
+        self.rng = rng
+
+    def name(self, words=3):
+        count = self.rng.randint(1, words)
+        return ' '.join(word.title() for word in self.rng.choices(self.words, cum_weights=self.cum_weights, k=count))
+
+
+def load(users, tracks):
+    vocabulary = Vocabulary(random.Random(0))
+    name = vocabulary.name
+    User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)], batch_size=1000)
+    for user in User.objects.all():
+        UserTrack.objects.bulk_create([
+            UserTrack(user=user, track_id=f'track{i}', name=name(), artist_name=name(2),
+                      album_name=name())
+            for i in range(tracks)
+        ], batch_size=1000)
+        UserArtist.objects.bulk_create([
+            UserArtist(user=user, artist_id=f'artist{i}', name=name(2)) for i in range(tracks // 10)
+        ], batch_size=1000)
+        UserAlbum.objects.bulk_create([
+            UserAlbum(user=user, album_id=f'album{i}', name=name(), artist_name=name(2))
+            for i in range(tracks // 10)
+        ], batch_size=1000)
+    return vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--tracks', type=int, default=5000, help='favorite tracks per user')
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    start = time.perf_counter()
+    vocabulary = load(args.users, args.tracks)
+    with transaction.atomic():
+        indexed = library_search.get_backend().rebuild()
+    print(f'{indexed:,} library items for {args.users} users, loaded and indexed in '
+          f'{time.perf_counter() - start:.1f}s')
+
+    rng = random.Random(1)
+    user = User.objects.order_by('?').first()
+    # Queries use the 2,000 most common words; the last one is still being typed
+    common = vocabulary.words[:2000]
+    queries = []
+    for _ in range(args.queries):
+        words = [rng.choice(common) for _ in range(rng.randint(1, 3))]
+        words[-1] = words[-1][:rng.randint(2, len(words[-1]))]
+        queries.append(' '.join(words))
+
+    timings = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += len(library_search.search(user, query, limit=20))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f'{args.queries} searches: median {statistics.median(timings):.2f} ms, '
+          f'p95 {timings[int(len(timings) * 0.95)]:.2f} ms, max {timings[-1]:.2f} ms, '
+          f'{hits / args.queries:.1f} results per search')
+
+
+if __name__ == '__main__':
+    main()
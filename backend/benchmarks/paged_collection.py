@@ -0,0 +1,91 @@
+"""
+Compare sequential and parallel fetching of a large paged collection.
+
+Starts a local stub of /me/tracks holding ``--items`` saved tracks, answering
+each page after a fixed latency, then reads the whole collection:
+
+  * page after page (following ``next``), as iter_collection() does
+  * with get_collection(), which requests every page after the first at
+    its known offset in parallel
+
+Usage (from the backend directory):
+
+    python benchmarks/paged_collection.py --items 5000 --latency-ms 100
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+django.setup()
+
+from api.services import SpotifyAPIService
+from benchmarks.stub_spotify import StubSpotify
+
+
+class SavedTracksStub(StubSpotify):
+    """Serves /me/tracks pages of a library of ``total`` tracks"""
+
+    def __init__(self, total, latency):
+        super().__init__(latency=latency)
+        self.total = total
+
+    def render(self, path):
+        query = parse_qs(urlsplit(path).query)
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['20'])[0])
+        end = min(offset + limit, self.total)
+        return json.dumps({
+            'items': [{'added_at': '2024-01-01T00:00:00Z', 'track': {'id': f'track{i}'}} for i in range(offset, end)],
+            'total': self.total,
+            'limit': limit,
+            'offset': offset,
+            'next': f'https://api.spotify.com/v1/me/tracks?offset={end}&limit={limit}' if end < self.total else None,
+        }).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    # Measure paging, not the shared quota
+    settings.SPOTIFY_RATE_LIMIT = 0
+    base_url = SavedTracksStub(args.items, args.latency_ms / 1000).start()
+
+    class StubSyncService(SpotifyAPIService):
+        BASE_URL = base_url
+
+        def _get_access_token(self):
+            return 'benchmark-token'
+
+    service = StubSyncService(user=None)
+
+    start = time.perf_counter()
+    sequential = list(service.iter_saved_tracks())
+    sequential_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = service.get_all_saved_tracks()
+    parallel_elapsed = time.perf_counter() - start
+
+    assert [item['track']['id'] for item in parallel] == [item['track']['id'] for item in sequential]
+    pages = -(-args.items // 50)
+    print(f"items: {args.items} ({pages} pages), upstream latency: {args.latency_ms:.0f} ms, "
+          f"page concurrency: {settings.SPOTIFY_PAGE_CONCURRENCY}")
+    print(f"sequential: {sequential_elapsed:6.2f}s  ({sequential_elapsed * 1000 / args.latency_ms:5.1f} round trips)")
+    print(f"parallel:   {parallel_elapsed:6.2f}s  ({parallel_elapsed * 1000 / args.latency_ms:5.1f} round trips)")
+
+
+if __name__ == '__main__':
+    main()
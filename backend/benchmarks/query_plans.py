@@ -0,0 +1,220 @@
+"""
+Query plans and timings of the per-user list queries, before and after the
+composite indexes of migration 0005.
+
+Builds a throwaway SQLite database migrated up to 0004, loads millions of
+synthetic rows (a few heavy users own most of them, as in production), then
+runs each hot query with EXPLAIN QUERY PLAN and a timed loop. Migration 0005
+is applied and everything is measured again.
+
+Before 0005 these queries can only use the foreign key index on user_id, so
+SQLite reads every row of the user and sorts them in a temporary B-tree to
+return the first page. The composite (user, -created_at) style indexes
+return rows already in order and stop after the page.
+
+Usage (from the backend directory):
+
+    python benchmarks/query_plans.py --rows 2000000 --users 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='query_plans_'), 'db.sqlite3')
+settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': DB_PATH}}
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from api.models import (
+    ListeningHistory, SearchHistory, UserAlbum, UserArtist, UserPlaylist, UserRecommendation, UserTrack,
+)
+
+
+BEFORE = '0004_listening_history_ingestion'
+AFTER = '0005_composite_indexes'
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+# The query each view runs, keyed by the table it reads. Only the columns loaded
+# below are selected: they exist at BEFORE, while later migrations add fields
+QUERIES = {
+    'search_history': lambda user: SearchHistory.objects.filter(user=user).values(*_columns('search_history'))[:20],
+    'listening_history': lambda user: ListeningHistory.objects.filter(user=user).values(*_columns('listening_history'))[:50],
+    'user_recommendations': lambda user: UserRecommendation.objects.filter(user=user).values(*_columns('user_recommendations'))[:20],
+    'user_tracks': lambda user: UserTrack.objects.filter(user=user).values(*_columns('user_tracks'))[:50],
+    'user_artists': lambda user: UserArtist.objects.filter(user=user).values(*_columns('user_artists'))[:50],
+    'user_albums': lambda user: UserAlbum.objects.filter(user=user).values(*_columns('user_albums'))[:50],
+    'user_playlists': lambda user: UserPlaylist.objects.filter(user=user).values(*_columns('user_playlists'))[:50],
+}
+
+
+def _columns(table):
+    return list(TABLES[table][0](0, 0))
+
+
+def _timestamp(i):
+    return (EPOCH + timedelta(seconds=i * 37)).isoformat(sep=' ')
+
+
+def _search_history(user_id, i):
+    return {'user_id': user_id, 'query': f'query {i % 5000}', 'search_type': 'track',
+            'result_count': 20, 'created_at': _timestamp(i)}
+
+
+def _listening_history(user_id, i):
+    return {'user_id': user_id, 'track_id': f'track{i % 50000}', 'track_name': f'Track {i % 50000}',
+            'artist_name': f'Artist {i % 5000}', 'played_at': _timestamp(i), 'duration_played': 180000,
+            'context_type': 'playlist', 'context_id': f'playlist{i % 100}', 'created_at': _timestamp(i)}
+
+
+def _user_recommendations(user_id, i):
+    return {'user_id': user_id, 'item_type': 'track', 'item_id': f'track{i}', 'item_name': f'Track {i}',
+            'score': random.random(), 'reason': '', 'created_at': _timestamp(i)}
+
+
+def _user_tracks(user_id, i):
+    return {'user_id': user_id, 'track_id': f'track{i}', 'name': f'Track {i}', 'artist_name': f'Artist {i % 5000}',
+            'artist_id': '', 'album_name': f'Album {i % 20000}', 'album_id': '', 'image_url': '',
+            'duration_ms': 180000, 'popularity': 50, 'preview_url': None, 'explicit': False,
+            'external_urls': '{}', 'audio_features': '{}', 'created_at': _timestamp(i)}
+
+
+def _user_artists(user_id, i):
+    return {'user_id': user_id, 'artist_id': f'artist{i}', 'name': f'Artist {i}', 'image_url': '',
+            'followers': 1000, 'popularity': 50, 'genres': '[]', 'external_urls': '{}', 'created_at': _timestamp(i)}
+
+
+def _user_albums(user_id, i):
+    return {'user_id': user_id, 'album_id': f'album{i}', 'name': f'Album {i}', 'artist_name': f'Artist {i % 5000}',
+            'artist_id': '', 'image_url': '', 'total_tracks': 12, 'release_date': '2024', 'album_type': 'album',
+            'external_urls': '{}', 'created_at': _timestamp(i)}
+
+
+def _user_playlists(user_id, i):
+    return {'user_id': user_id, 'playlist_id': f'playlist{i}', 'name': f'Playlist {i}', 'description': '',
+            'image_url': '', 'total_tracks': 30, 'owner_name': '', 'owner_id': '', 'public': True,
+            'collaborative': False, 'followers': 0, 'external_urls': '{}', 'created_at': _timestamp(i)}
+
+
+# (row factory, share of --rows)
+TABLES = {
+    'search_history': (_search_history, 1.0),
+    'listening_history': (_listening_history, 1.0),
+    'user_recommendations': (_user_recommendations, 0.25),
+    'user_tracks': (_user_tracks, 0.25),
+    'user_artists': (_user_artists, 0.1),
+    'user_albums': (_user_albums, 0.1),
+    'user_playlists': (_user_playlists, 0.1),
+}
+
+
+def _owners(user_ids, count):
+    """User ID of each row: the heaviest 1% of users own about half the rows"""
+    heavy = user_ids[:max(1, len(user_ids) // 100)]
+    return [random.choice(heavy) if random.random() < 0.5 else random.choice(user_ids) for _ in range(count)]
+
+
+def load(rows, users):
+    random.seed(0)
+    User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)], batch_size=1000)
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    total = 0
+    for table, (factory, share) in TABLES.items():
+        count = int(rows * share)
+        start = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            columns = list(factory(0, 0))
+            sql = (f'INSERT INTO {table} ({", ".join(columns)}) '
+                   f'VALUES ({", ".join(["%s"] * len(columns))})')
+            owners = _owners(user_ids, count)
+            for chunk in range(0, count, 50000):
+                cursor.executemany(sql, [
+                    tuple(factory(owners[i], i).values()) for i in range(chunk, min(chunk + 50000, count))
+                ])
+        total += count
+        print(f'  loaded {count:>9,} rows into {table} in {time.perf_counter() - start:.1f}s')
+    connection.cursor().execute('ANALYZE')
+    return user_ids, total
+
+
+def measure(users, repeat):
+    """EXPLAIN QUERY PLAN and median time of each query, for a heavy and a typical user"""
+    results = {}
+    for table, query in QUERIES.items():
+        plan = query(users['heavy']).explain()
+        timings = {}
+        for label, user in users.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(query(user))
+                samples.append(time.perf_counter() - start)
+            timings[label] = statistics.median(samples) * 1000
+        results[table] = (plan, timings)
+    return results
+
+
+def report(title, results):
+    print(f'\n== {title}')
+    for table, (plan, timings) in results.items():
+        times = '  '.join(f'{label}: {ms:8.3f} ms' for label, ms in timings.items())
+        print(f'\n{table}  ({times})')
+        for line in plan.splitlines():
+            print(f'    {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='rows in each history table (favorites and recommendations get a share)')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20, help='runs of each query per timing')
+    args = parser.parse_args()
+
+    print(f'database: {DB_PATH}')
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'api', BEFORE, verbosity=0)
+    user_ids, total = load(args.rows, args.users)
+    print(f'  {total:,} rows for {len(user_ids):,} users')
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT user_id FROM listening_history GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1')
+        heavy = cursor.fetchone()[0]
+    users = {'heavy': User(pk=heavy), 'typical': User(pk=user_ids[len(user_ids) // 2])}
+
+    before = measure(users, args.repeat)
+    report(f'before ({BEFORE})', before)
+
+    start = time.perf_counter()
+    call_command('migrate', 'api', AFTER, verbosity=0)
+    connection.cursor().execute('ANALYZE')
+    print(f'\nbuilt the composite indexes in {time.perf_counter() - start:.1f}s')
+
+    after = measure(users, args.repeat)
+    report(f'after ({AFTER})', after)
+
+    print('\n== speedup (median time before / after)')
+    for table in QUERIES:
+        ratios = '  '.join(
+            f'{label}: {before[table][1][label] / after[table][1][label]:7.1f}x' for label in users
+        )
+        print(f'{table:<22} {ratios}')
+
+
+if __name__ == '__main__':
+    main()
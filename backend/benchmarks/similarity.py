@@ -0,0 +1,80 @@
+"""
+Cost of "similar tracks" queries (api.similarity) on a large library.
+
+Fills a FeatureMatrix with ``--tracks`` random audio-feature rows, then
+times single kNN queries, one batched query for ``--batch`` tracks, and
+incremental adds and removals.
+
+Usage (from the backend directory):
+
+    python benchmarks/similarity.py --tracks 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+django.setup()
+
+from api.similarity import FeatureMatrix
+
+
+def features(rng):
+    return {
+        'danceability': rng.random(), 'energy': rng.random(), 'valence': rng.random(),
+        'acousticness': rng.random(), 'instrumentalness': rng.random(), 'speechiness': rng.random(),
+        'liveness': rng.random(), 'mode': rng.randint(0, 1), 'loudness': rng.uniform(-30, 0),
+        'tempo': rng.uniform(60, 200),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    matrix = FeatureMatrix()
+    start = time.perf_counter()
+    matrix.upsert((pk, f'track{pk}', features(rng)) for pk in range(args.tracks))
+    print(f'{len(matrix):,} tracks loaded in {time.perf_counter() - start:.2f}s')
+
+    timings = []
+    for _ in range(args.queries):
+        track_id = f'track{rng.randrange(args.tracks)}'
+        start = time.perf_counter()
+        matrix.nearest(matrix.vector(track_id), args.k, exclude=[track_id])
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    print(f'{args.queries} single queries: median {statistics.median(timings):.0f} us, '
+          f'p95 {timings[int(len(timings) * 0.95)]:.0f} us')
+
+    track_ids = matrix.track_ids[:args.batch]
+    start = time.perf_counter()
+    matrix.nearest(matrix.matrix[:, :args.batch].T, args.k, exclude=track_ids)
+    elapsed = time.perf_counter() - start
+    print(f'1 batched query for {args.batch} tracks: {elapsed * 1000:.0f} ms, '
+          f'{elapsed / args.batch * 1_000_000:.0f} us per track')
+
+    start = time.perf_counter()
+    for pk in range(args.tracks, args.tracks + 1000):
+        matrix.upsert([(pk, f'track{pk}', features(rng))])
+    for pk in range(args.tracks, args.tracks + 1000):
+        matrix.remove([pk])
+    print(f'1000 single adds + 1000 removals: {(time.perf_counter() - start) / 2000 * 1_000_000:.0f} us each')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Local stand-in for api.spotify.com used by the benchmarks.
+
+An asyncio HTTP/1.1 server with keep-alive that answers every request with
+``payload`` after a fixed latency. With ``etags`` enabled it sends a strong
+ETag derived from the payload and answers a matching If-None-Match with an
+empty 304, so conditional revalidation can be measured end to end.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+
+DEFAULT_PAYLOAD = {'items': [{'track': {'id': str(i)}} for i in range(20)], 'total': 20}
+
+
+class StubSpotify:
+    """Canned-response server running on its own event loop thread"""
+
+    def __init__(self, latency=0.0, payload=None, etags=False):
+        self.latency = latency
+        self.etags = etags
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.set_payload(DEFAULT_PAYLOAD if payload is None else payload)
+
+    def set_payload(self, payload):
+        """Replace the served body, which also changes its ETag"""
+        self.body = json.dumps(payload).encode()
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+
+    def start(self):
+        """Start serving on a free port and return the /v1 base URL"""
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0, backlog=1024))
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        port = server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}/v1'
+
+    def render(self, path):
+        """Body for a request path; subclasses can vary it per path (ETags cover ``body`` only)"""
+        return self.body
+
+    def _response(self, request):
+        self.requests += 1
+        if not self.etags:
+            path = request.split(b' ', 2)[1].decode('latin-1')
+            return self._format(b'200 OK', self.render(path))
+
+        headers = request.decode('latin-1').lower().split('\r\n')
+        if_none_match = next(
+            (line.split(':', 1)[1].strip() for line in headers if line.startswith('if-none-match:')), None
+        )
+        if if_none_match == self.etag.lower():
+            self.not_modified += 1
+            return self._format(b'304 Not Modified', b'')
+        return self._format(b'200 OK', self.body)
+
+    def _format(self, status, body):
+        self.bytes_sent += len(body)
+        etag = b'ETag: ' + self.etag.encode() + b'\r\n' if self.etags else b''
+        return (
+            b'HTTP/1.1 ' + status + b'\r\n'
+            b'Content-Type: application/json\r\n'
+            + etag +
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+            b'\r\n' + body
+        )
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                if not request:
+                    break
+                await asyncio.sleep(self.latency)
+                writer.write(self._response(request))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
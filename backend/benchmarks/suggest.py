@@ -0,0 +1,95 @@
+"""
+Latency of search suggestions (api.suggest) on a large in-memory index.
+
+Fills a SuggestionIndex with ``--entries`` made-up track, artist, album
+and query names (words drawn with Zipfian frequencies), ranks its busy
+prefixes as the background refresh does, then times lookups of 1-8
+character prefixes, as typed in a search box, and single additions.
+
+Usage (from the backend directory):
+
+    python benchmarks/suggest.py --entries 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from itertools import accumulate
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+import django
+from django.conf import settings
+
+settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+django.setup()
+
+from api.suggest import SuggestionIndex
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 've', 'to', 'sun', 'el', 'dar', 'in', 'fa', 'ne', 'or', 'is', 'ta', 'mo',
+             'ri', 'an', 'be', 'ex']
+KINDS = ['track', 'artist', 'album', 'query']
+
+
+def vocabulary(rng, size=20000):
+    words = (''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size * 2))
+    words = list(dict.fromkeys(words))[:size]
+    return words, list(accumulate(1 / rank ** 1.07 for rank in range(1, len(words) + 1)))
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (f'median {statistics.median(timings):.1f} us, p95 {timings[int(len(timings) * 0.95)]:.1f} us, '
+            f'p99 {timings[int(len(timings) * 0.99)]:.1f} us, max {timings[-1]:.1f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--adds', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words, cum_weights = vocabulary(rng)
+
+    def name():
+        return ' '.join(word.title() for word in rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 4)))
+
+    index = SuggestionIndex()
+    items = [(rng.choice(KINDS), name(), rng.uniform(1, 6), None) for _ in range(args.entries)]
+    start = time.perf_counter()
+    for position in range(0, len(items), 5000):
+        index.add_many(items[position:position + 5000])
+    loaded = time.perf_counter() - start
+    start = time.perf_counter()
+    index.warm()
+    print(f'{len(index):,} entries ({index.stats()["keys"]:,} keys) added in {loaded:.1f}s, '
+          f'{index.stats()["ranked_prefixes"]:,} busy prefixes ranked in {time.perf_counter() - start:.1f}s')
+
+    prefixes = []
+    for _ in range(args.queries):
+        text = rng.choice(items)[1] if rng.random() < 0.5 else rng.choices(words, cum_weights=cum_weights)[0]
+        prefixes.append(text[:rng.randint(1, 8)])
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.lookup(prefix)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    print(f'{args.queries:,} lookups: {percentiles(timings)}')
+
+    timings = []
+    for _ in range(args.adds):
+        text = name()
+        start = time.perf_counter()
+        index.add('query', text, 1, increment=True)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    print(f'{args.adds:,} additions: {percentiles(timings)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""
+ASGI config for spotify_api project.
+
+Serve with an ASGI worker (e.g. ``gunicorn -k uvicorn.workers.UvicornWorker``)
+so the async proxy views can hold many upstream waits per process.
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+application = get_asgi_application()
@@ -0,0 +1,17 @@
+"""
+Celery application for spotify_api project.
+
+Run a worker (with the beat scheduler embedded) from the backend directory:
+
+    celery -A spotify_api worker -B --loglevel=info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spotify_api.settings')
+
+app = Celery('spotify_api')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
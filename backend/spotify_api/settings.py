@@ -68,6 +68,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'spotify_api.wsgi.application'
+ASGI_APPLICATION = 'spotify_api.asgi.application'
 
 # Database
 DATABASES = {
@@ -139,6 +140,31 @@ SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:4200/callback')
 
+# Upstream HTTP connection pool (shared per worker process)
+SPOTIFY_HTTP_POOL_CONNECTIONS = int(os.getenv('SPOTIFY_HTTP_POOL_CONNECTIONS', '4'))
+SPOTIFY_HTTP_POOL_MAXSIZE = int(os.getenv('SPOTIFY_HTTP_POOL_MAXSIZE', '20'))
+SPOTIFY_HTTP_POOL_BLOCK = os.getenv('SPOTIFY_HTTP_POOL_BLOCK', 'False').lower() == 'true'
+SPOTIFY_HTTP_TIMEOUT = float(os.getenv('SPOTIFY_HTTP_TIMEOUT', '10'))
+SPOTIFY_ASYNC_MAX_CONNECTIONS = int(os.getenv('SPOTIFY_ASYNC_MAX_CONNECTIONS', '200'))
+SPOTIFY_ASYNC_MAX_PER_HOST = int(os.getenv('SPOTIFY_ASYNC_MAX_PER_HOST', '200'))
+
+# Concurrent fan-out of independent upstream calls
+SPOTIFY_FANOUT_WORKERS = int(os.getenv('SPOTIFY_FANOUT_WORKERS', '10'))
+DASHBOARD_SECTION_TIMEOUT = float(os.getenv('DASHBOARD_SECTION_TIMEOUT', '5'))
+# Pages of one collection (saved tracks, playlist tracks...) requested in parallel
+SPOTIFY_PAGE_CONCURRENCY = int(os.getenv('SPOTIFY_PAGE_CONCURRENCY', '8'))
+
+# App-wide upstream rate limit shared by all workers (requests/second, 0 disables);
+# calls wait up to SPOTIFY_RATE_LIMIT_MAX_WAIT seconds for a token before failing
+SPOTIFY_RATE_LIMIT = float(os.getenv('SPOTIFY_RATE_LIMIT', '10'))
+SPOTIFY_RATE_LIMIT_BURST = int(os.getenv('SPOTIFY_RATE_LIMIT_BURST', '20'))
+SPOTIFY_RATE_LIMIT_MAX_WAIT = float(os.getenv('SPOTIFY_RATE_LIMIT_MAX_WAIT', '5'))
+
+# Retries of GETs on 429/5xx (jittered exponential backoff unless Spotify sends Retry-After)
+SPOTIFY_MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '3'))
+SPOTIFY_RETRY_BASE_DELAY = float(os.getenv('SPOTIFY_RETRY_BASE_DELAY', '0.5'))
+SPOTIFY_RETRY_MAX_DELAY = float(os.getenv('SPOTIFY_RETRY_MAX_DELAY', '8'))
+
 # Cache configuration
 CACHES = {
     'default': {
@@ -150,6 +176,140 @@ CACHES = {
     }
 }
 
+# Stale-while-revalidate: entries are served stale for (factor - 1) x their TTL
+# while a background refresh runs; TTLs are spread by +/- jitter
+CACHE_STALE_TTL_FACTOR = float(os.getenv('CACHE_STALE_TTL_FACTOR', '2.0'))
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', '0.1'))
+CACHE_XFETCH_BETA = float(os.getenv('CACHE_XFETCH_BETA', '1.0'))
+
+# In-process L1 cache in front of CACHES['default'] (bytes, seconds)
+CACHE_L1_MAX_BYTES = int(os.getenv('CACHE_L1_MAX_BYTES', str(32 * 1024 * 1024)))
+CACHE_L1_TTL = float(os.getenv('CACHE_L1_TTL', '60'))
+
+# Search results are cached for all users under a normalized key; the next
+# page is prefetched in the background when the rate limit has spare tokens
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', '600'))
+SEARCH_PREFETCH = os.getenv('SEARCH_PREFETCH', 'True').lower() == 'true'
+
+# Single-flight: one worker per cache key fetches from Spotify, others wait up to SINGLE_FLIGHT_WAIT
+SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', '15'))
+SINGLE_FLIGHT_WAIT = float(os.getenv('SINGLE_FLIGHT_WAIT', '2.0'))
+
+# Spotify access tokens: the background job refreshes those expiring within
+# TOKEN_REFRESH_MARGIN seconds every TOKEN_REFRESH_INTERVAL; requests refresh
+# inline within TOKEN_INLINE_REFRESH_MARGIN, waiting up to TOKEN_REFRESH_WAIT
+# for a refresh already running elsewhere
+TOKEN_REFRESH_INTERVAL = float(os.getenv('TOKEN_REFRESH_INTERVAL', '300'))
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', '600'))
+TOKEN_INLINE_REFRESH_MARGIN = int(os.getenv('TOKEN_INLINE_REFRESH_MARGIN', '30'))
+TOKEN_REFRESH_WAIT = float(os.getenv('TOKEN_REFRESH_WAIT', '5'))
+
+# Saved-tracks mirror: incremental sync every LIBRARY_SYNC_INTERVAL seconds,
+# full reconciliation (catches removals) at least every LIBRARY_FULL_SYNC_INTERVAL
+LIBRARY_SYNC_INTERVAL = float(os.getenv('LIBRARY_SYNC_INTERVAL', '900'))
+LIBRARY_FULL_SYNC_INTERVAL = int(os.getenv('LIBRARY_FULL_SYNC_INTERVAL', str(24 * 3600)))
+LIBRARY_SYNC_LOCK_TIMEOUT = int(os.getenv('LIBRARY_SYNC_LOCK_TIMEOUT', '600'))
+
+# Recently-played ingestion: each connected user is polled once per
+# LISTENING_POLL_INTERVAL (one request each). Capacity is roughly
+# SPOTIFY_RATE_LIMIT x LISTENING_POLL_INTERVAL users, shared with live traffic.
+# Users polled up to LISTENING_POLL_SLACK seconds less than an interval ago are
+# already due, since polls are stamped when they finish, after the run started.
+LISTENING_POLL_INTERVAL = float(os.getenv('LISTENING_POLL_INTERVAL', '1800'))
+LISTENING_POLL_SLACK = float(os.getenv('LISTENING_POLL_SLACK', str(LISTENING_POLL_INTERVAL / 4)))
+LISTENING_INGEST_BATCH_SIZE = int(os.getenv('LISTENING_INGEST_BATCH_SIZE', '200'))
+LISTENING_INGEST_CONCURRENCY = int(os.getenv('LISTENING_INGEST_CONCURRENCY', '8'))
+LISTENING_RATE_LIMIT_MAX_WAIT = float(os.getenv('LISTENING_RATE_LIMIT_MAX_WAIT', '120'))
+
+# Listening statistics rollups: plays stored since the last run are added to the
+# rollup tables every LISTENING_ROLLUP_INTERVAL seconds, LISTENING_ROLLUP_BATCH
+# plays per transaction. Plays younger than LISTENING_ROLLUP_LAG seconds wait for
+# the next run, so rows from transactions still in flight are not skipped.
+LISTENING_ROLLUP_INTERVAL = float(os.getenv('LISTENING_ROLLUP_INTERVAL', '300'))
+LISTENING_ROLLUP_BATCH = int(os.getenv('LISTENING_ROLLUP_BATCH', '10000'))
+LISTENING_ROLLUP_LAG = int(os.getenv('LISTENING_ROLLUP_LAG', '60'))
+LISTENING_ROLLUP_LOCK_TIMEOUT = int(os.getenv('LISTENING_ROLLUP_LOCK_TIMEOUT', '3600'))
+
+# Local library search: dotted path of an api.library_search backend; blank
+# picks one for the database (SQLite FTS5, PostgreSQL full-text search)
+LIBRARY_SEARCH_BACKEND = os.getenv('LIBRARY_SEARCH_BACKEND', '')
+
+# Search suggestions: each worker's in-memory index reads new SearchHistory
+# rows (SUGGEST_REFRESH_BATCH per query) at most every SUGGEST_REFRESH_INTERVAL
+# seconds; a past search is only suggested once SUGGEST_MIN_USERS users made it
+# within SUGGEST_PENDING_WINDOW seconds. Each index keeps at most
+# SUGGEST_MAX_ENTRIES suggestions (the lightest are dropped) and tracks at most
+# SUGGEST_MAX_PENDING searches that are not suggested yet
+SUGGEST_REFRESH_INTERVAL = float(os.getenv('SUGGEST_REFRESH_INTERVAL', '30'))
+SUGGEST_REFRESH_BATCH = int(os.getenv('SUGGEST_REFRESH_BATCH', '5000'))
+SUGGEST_MIN_USERS = int(os.getenv('SUGGEST_MIN_USERS', '2'))
+SUGGEST_PENDING_WINDOW = int(os.getenv('SUGGEST_PENDING_WINDOW', str(7 * 24 * 3600)))
+SUGGEST_MAX_PENDING = int(os.getenv('SUGGEST_MAX_PENDING', '100000'))
+SUGGEST_MAX_ENTRIES = int(os.getenv('SUGGEST_MAX_ENTRIES', '200000'))
+
+# Favorite-track feature matrices for "similar tracks" are kept in memory for
+# this many users per worker (least recently used are dropped)
+SIMILARITY_CACHE_USERS = int(os.getenv('SIMILARITY_CACHE_USERS', '256'))
+
+# Batch recommendations: users whose favorites, saved tracks or plays changed are
+# recomputed every RECOMMENDATION_INTERVAL seconds, RECOMMENDATION_SHARD_SIZE users
+# per task/process (RECOMMENDATION_PROCESSES for the management command, 0 = one
+# per CPU); the candidate catalog is rebuilt per worker after RECOMMENDATION_CATALOG_TTL
+RECOMMENDATION_INTERVAL = float(os.getenv('RECOMMENDATION_INTERVAL', '3600'))
+RECOMMENDATIONS_PER_TYPE = int(os.getenv('RECOMMENDATIONS_PER_TYPE', '25'))
+RECOMMENDATION_SHARD_SIZE = int(os.getenv('RECOMMENDATION_SHARD_SIZE', '200'))
+RECOMMENDATION_PROCESSES = int(os.getenv('RECOMMENDATION_PROCESSES', '0'))
+RECOMMENDATION_CATALOG_TTL = float(os.getenv('RECOMMENDATION_CATALOG_TTL', '600'))
+RECOMMENDATION_PLAYS_DAYS = int(os.getenv('RECOMMENDATION_PLAYS_DAYS', '90'))
+
+# Library audio-feature analytics: per-user results are cached for
+# AUDIO_ANALYTICS_TIMEOUT seconds, or AUDIO_ANALYTICS_RETRY while some
+# tracks' features could not be fetched yet
+AUDIO_ANALYTICS_TIMEOUT = int(os.getenv('AUDIO_ANALYTICS_TIMEOUT', str(7 * 24 * 3600)))
+AUDIO_ANALYTICS_RETRY = int(os.getenv('AUDIO_ANALYTICS_RETRY', '60'))
+
+# Write-behind of activity (searches, plays): events are buffered per
+# worker and bulk written every ACTIVITY_FLUSH_INTERVAL seconds or once
+# ACTIVITY_FLUSH_SIZE are waiting, by a worker thread ('thread') or a Celery
+# task ('celery'); beyond ACTIVITY_BUFFER_LIMIT waiting events new ones are dropped
+ACTIVITY_FLUSH_MODE = os.getenv('ACTIVITY_FLUSH_MODE', 'thread')
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '1.0'))
+ACTIVITY_FLUSH_SIZE = int(os.getenv('ACTIVITY_FLUSH_SIZE', '500'))
+ACTIVITY_BUFFER_LIMIT = int(os.getenv('ACTIVITY_BUFFER_LIMIT', '10000'))
+
+# Cache/upstream counters are folded into the shared cache at most this often (seconds)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+
+# Celery configuration (background tasks)
+CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'refresh-expiring-spotify-tokens': {
+        'task': 'authentication.tasks.refresh_expiring_tokens',
+        'schedule': TOKEN_REFRESH_INTERVAL,
+    },
+    'sync-saved-track-libraries': {
+        'task': 'api.tasks.sync_libraries',
+        'schedule': LIBRARY_SYNC_INTERVAL,
+    },
+    'ingest-listening-history': {
+        'task': 'api.tasks.ingest_listening_history',
+        'schedule': LISTENING_POLL_INTERVAL,
+    },
+    'compute-recommendations': {
+        'task': 'api.tasks.compute_recommendations',
+        'schedule': RECOMMENDATION_INTERVAL,
+    },
+    'roll-up-listening-history': {
+        'task': 'api.tasks.roll_up_listening_history',
+        'schedule': LISTENING_ROLLUP_INTERVAL,
+    },
+}
+
 # Session configuration
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
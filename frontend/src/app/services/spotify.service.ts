@@ -87,6 +87,7 @@ export interface DashboardData {
   recently_played: SpotifyTrack[];
   featured_playlists: SpotifyPlaylist[];
   new_releases: SpotifyAlbum[];
+  errors?: { [section: string]: string };
 }
 
 @Injectable({
@@ -3,12 +3,40 @@ Shared utilities for Spotify API interactions
 """
 import os
 import json
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+_session = None
+_session_lock = threading.Lock()
+
+def get_spotify_session():
+    """Get a keep-alive session shared by every request in this process"""
+    # A standalone copy of backend/api/http.py's _build_session: these scripts run
+    # without Django settings (or aiohttp), so they cannot import it. Keep the
+    # adapter options and environment variables in step with that builder; the
+    # backend-only pool stats are left out.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=int(os.getenv('SPOTIFY_HTTP_POOL_CONNECTIONS', '4')),
+                    pool_maxsize=int(os.getenv('SPOTIFY_HTTP_POOL_MAXSIZE', '20')),
+                    pool_block=os.getenv('SPOTIFY_HTTP_POOL_BLOCK', 'False').lower() == 'true',
+                )
+                session.mount('https://', adapter)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
 def get_spotify_headers():
     """Get Authorization headers for Spotify API requests"""
     access_token = os.getenv('SPOTIFY_ACCESS_TOKEN')
@@ -23,7 +51,8 @@ def get_spotify_headers():
 def make_spotify_request(method, url, **kwargs):
     """Make a request to Spotify API with proper headers"""
     headers = get_spotify_headers()
-    response = requests.request(method, url, headers=headers, **kwargs)
+    kwargs.setdefault('timeout', float(os.getenv('SPOTIFY_HTTP_TIMEOUT', '10')))
+    response = get_spotify_session().request(method, url, headers=headers, **kwargs)
     return response
 
 def print_json_response(response):